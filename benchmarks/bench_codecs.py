@@ -0,0 +1,50 @@
+"""Compares JSON codecs from :mod:`wepay.codec` on `find` responses of real
+size, i.e. pages of 50 fully populated checkouts, as well as on a typical
+`/checkout/create` request.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/bench_codecs.py [number_of_pages]
+
+"""
+from __future__ import print_function
+import sys, timeit
+
+from stub import checkout
+from wepay.codec import CODECS
+
+
+def main(pages=20):
+    responses = [[checkout(page * 50 + i) for i in range(50)]
+                 for page in range(pages)]
+    request = {'account_id': 1234567, 'short_description': 'Order #1',
+               'type': 'goods', 'amount': 1234.56, 'currency': 'USD',
+               'fee': {'app_fee': 12.35, 'fee_payer': 'payee'},
+               'payment_method': {'type': 'credit_card',
+                                  'credit_card': {'id': 987654321}}}
+    print("%-20s %16s %16s %16s" % (
+        'codec', 'decode, ms/page', 'encode, ms/page', 'request, us'))
+    for codec_class in CODECS:
+        if not codec_class.available:
+            print("%-20s %16s" % (codec_class.name, 'not installed'))
+            continue
+        for use_decimal in (False, True):
+            if use_decimal and not codec_class.supports_decimal:
+                continue
+            codec = codec_class(use_decimal=use_decimal)
+            encoded = [codec.dumps(page) for page in responses]
+            decode = min(timeit.repeat(
+                lambda: [codec.loads(data) for data in encoded],
+                number=5, repeat=3)) / 5 / pages * 1000
+            encode = min(timeit.repeat(
+                lambda: [codec.dumps(page) for page in responses],
+                number=5, repeat=3)) / 5 / pages * 1000
+            small = min(timeit.repeat(
+                lambda: codec.loads(codec.dumps(request)),
+                number=1000, repeat=3)) / 1000 * 1000000
+            name = codec.name + (' (decimal)' if use_decimal else '')
+            print("%-20s %16.3f %16.3f %16.2f" % (name, decode, encode, small))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
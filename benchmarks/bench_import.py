@@ -0,0 +1,59 @@
+"""Measures cold start of the SDK with ``python -X importtime``: time it takes
+to import :mod:`wepay`, to create a client and to make the first call ready,
+as well as which of the heavy modules got loaded on the way. Every step runs
+in a fresh interpreter, so nothing is cached between runs.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/bench_import.py [runs]
+
+"""
+from __future__ import print_function
+import subprocess, sys
+
+STEPS = [
+    ('import wepay', "import wepay"),
+    ('WePay()', "import wepay; wepay.WePay()"),
+    ('api.checkout', "import wepay; wepay.WePay().checkout"),
+    ('import wepay.aio', "import wepay.aio"),
+]
+
+WATCHED = ['requests', 'urllib3', 'wepay.calls.checkout', 'wepay.calls.account',
+           'aiohttp']
+
+
+def importtime(code):
+    """Runs ``code`` in a new interpreter and returns cumulative import time of
+    every top level module in microseconds, together with modules that were
+    loaded by the end.
+
+    """
+    script = "%s\nimport sys\nprint(' '.join(sorted(sys.modules)))" % code
+    process = subprocess.Popen(
+        [sys.executable, '-X', 'importtime', '-c', script],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = process.communicate()
+    total = 0
+    for line in err.decode().splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        # top level imports have no indentation
+        if not name[1:].startswith(' ') and cumulative.strip().isdigit():
+            total += int(cumulative)
+    return total, set(out.decode().split())
+
+
+def main(runs=5):
+    baseline = sorted(importtime('pass')[0] for _ in range(runs))[runs // 2]
+    print("%-20s %12s   %s" % ('step', 'import, ms', 'loaded'))
+    for name, code in STEPS:
+        results = [importtime(code) for _ in range(runs)]
+        median = sorted(total for total, _ in results)[runs // 2]
+        loaded = [module for module in WATCHED if module in results[0][1]]
+        print("%-20s %12.1f   %s" % (
+            name, (median - baseline) / 1000.0, ', '.join(loaded) or '-'))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,40 @@
+"""Measures overhead the SDK adds on top of the HTTP request itself, i.e. time
+spent in a call method and :meth:`Call.make_call<wepay.calls.base.Call.make_call>`
+before it reaches :meth:`WePay.call<wepay.api.WePay.call>`, which is stubbed out
+here.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/bench_make_call.py [number_of_calls]
+
+"""
+from __future__ import print_function
+import sys, timeit
+
+from wepay import WePay
+
+
+def main(number=100000):
+    api = WePay(production=False, access_token='token')
+    api.call = lambda uri, params=None, **kwargs: params
+    quiet = WePay(production=False, access_token='token', silent=True)
+    quiet.call = api.call
+    cases = [
+        ('checkout(id)', lambda: api.checkout(12345)),
+        ('checkout.find(...)', lambda: api.checkout.find(
+            1234, start=0, limit=50, state='captured', access_token='other')),
+        ('checkout.create(...)', lambda: api.checkout.create(
+            1234, 'Order #1', 'goods', 10.5, currency='USD', fee={
+                'app_fee': 0.5, 'fee_payer': 'payee'}, timeout=10)),
+        ('checkout(id, batch_mode)', lambda: api.checkout(
+            12345, batch_mode=True, batch_reference_id='c1')),
+        ('checkout(id), silent', lambda: quiet.checkout(12345)),
+    ]
+    print("%-28s %12s" % ('call', 'us/call'))
+    for name, fn in cases:
+        elapsed = min(timeit.repeat(fn, number=number, repeat=3))
+        print("%-28s %12.3f" % (name, elapsed / number * 1000000))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,65 @@
+"""Measures cost of the :mod:`middleware<wepay.middleware>` chain, i.e. time
+spent in :meth:`WePay.call<wepay.api.WePay.call>` with the transport stubbed
+out, with no middlewares, with a number of no-op middlewares and with all
+built-in features turned on. The last column is the cost per middleware
+relative to an empty chain.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/bench_middleware.py [number_of_calls]
+
+"""
+from __future__ import print_function
+import sys, timeit
+
+from wepay import WePay
+from wepay.circuit import CircuitBreaker
+from wepay.metrics import Metrics
+from wepay.ratelimit import RateLimiter
+from wepay.retry import RetryPolicy
+
+
+def noop(request, call_next):
+    return call_next(request)
+
+
+def post(url, params, headers, timeout, timing=None):
+    return {}
+
+
+def client(middleware=(), **kwargs):
+    api = WePay(production=False, access_token='token',
+                middleware=middleware, **kwargs)
+    api._post = post
+    return api
+
+
+def main(number=100000):
+    builtin = {
+        'metrics': Metrics(), 'retry': RetryPolicy(),
+        'breaker': CircuitBreaker(),
+        'rate_limit': RateLimiter(rate=10 ** 9, burst=10 ** 9),
+    }
+    cases = [
+        ('no middleware', client(), 0),
+        ('1 no-op', client([noop]), 1),
+        ('5 no-op', client([noop] * 5), 5),
+        ('10 no-op', client([noop] * 10), 10),
+    ]
+    cases.extend((name, client(**{name: feature}), 1)
+                 for name, feature in sorted(builtin.items()))
+    cases.append(('all built-in', client(**builtin), len(builtin)))
+    print("%-16s %10s %16s" % ('chain', 'us/call', 'us/middleware'))
+    base = None
+    for name, api, size in cases:
+        call = lambda: api.call('/checkout/create', {'account_id': 1234})
+        elapsed = min(timeit.repeat(call, number=number, repeat=3))
+        us = elapsed / number * 1000000
+        if base is None:
+            base = us
+        per = (us - base) / size if size else 0
+        print("%-16s %10.3f %16.3f" % (name, us, per))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
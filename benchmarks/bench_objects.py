@@ -0,0 +1,64 @@
+"""Compares memory taken by `find` results decoded as plain dicts and as
+:mod:`records<wepay.objects>`, both untouched and after their fields were
+accessed, together with time it takes to decode them.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/bench_objects.py [number_of_objects]
+
+"""
+from __future__ import print_function
+import gc, sys, time, tracemalloc
+
+from stub import checkout, account
+from wepay.codec import get_codec
+from wepay.objects import decode_records
+
+
+def measure(make):
+    """Returns memory in bytes taken by objects returned by ``make`` and time
+    in seconds it took to make them, which is measured separately, since
+    tracing slows allocations down.
+
+    """
+    gc.collect()
+    started = time.time()
+    objects = make()
+    elapsed = time.time() - started
+    del objects
+    gc.collect()
+    tracemalloc.start()
+    objects = make()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return size, elapsed
+
+
+def touch(records):
+    for record in records:
+        record['state']
+    return records
+
+
+def main(count=20000):
+    codec = get_codec()
+    print("%-10s %-22s %14s %12s" % ('object', 'decoded as', 'bytes/object', 'ms/page'))
+    for name, factory in [('checkout', checkout), ('account', account)]:
+        pages = [codec.dumps([factory(page * 50 + i) for i in range(50)])
+                 for page in range(count // 50)]
+        url = 'https://wepayapi.com/v2/%s/find' % name
+        for label, make in [
+                ('dict', lambda: [codec.loads(page) for page in pages]),
+                ('record, untouched', lambda: [
+                    decode_records(url, page, codec) for page in pages]),
+                ('record, accessed', lambda: [
+                    touch(decode_records(url, page, codec)) for page in pages])]:
+            size, elapsed = measure(make)
+            print("%-10s %-22s %14d %12.3f" % (
+                name, label, size // count, elapsed / len(pages) * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,167 @@
+"""Measures throughput, latency and memory usage of :class:`WePay<wepay.WePay>`
+against a local stand-in for wepayapi.com (see ``stub.py``), for both `requests`
+and `urllib` transports, with following workloads:
+
+* ``serial`` - lookups one after another from a single thread.
+* ``threaded`` - lookups from a pool of threads sharing one client.
+* ``batched`` - lookups sent in `/batch/create` chunks of 50 with
+  :meth:`batch.execute<wepay.calls.batch.Batch.execute>`; every lookup is
+  counted as a call, while latency is measured per chunk.
+* ``paged`` - walking through `/checkout/find` pages of 50 checkouts with
+  :func:`iter_pages<wepay.paging.iter_pages>`, which is what
+  :meth:`checkout.iter_find<wepay.calls.checkout.Checkout.iter_find>` does;
+  every page is counted as a call.
+
+Memory is measured with :mod:`tracemalloc` for the serial workload only, as
+peak memory traced during the run and memory retained per call after it. Server
+runs in a separate process by default, so it does not affect the numbers.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/bench_transport.py --help
+
+HTTPS is turned on by ``--https CERTFILE KEYFILE``, in which case the
+certificate has to be issued for ``127.0.0.1``, and is trusted through
+``SSL_CERT_FILE`` and ``REQUESTS_CA_BUNDLE`` environment variables.
+
+"""
+from __future__ import print_function
+import argparse, os, threading, time
+try:
+    import tracemalloc
+except ImportError: # python 2
+    tracemalloc = None
+
+from stub import serve_in_process, serve_in_thread
+from wepay import WePay
+from wepay.paging import iter_pages
+
+clock = getattr(time, 'perf_counter', time.time)
+
+CLIENT_ID, CLIENT_SECRET = 12345, 'secret'
+
+
+def percentile(latencies, p):
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100.0))]
+
+
+def timed(fn, *args, **kwargs):
+    started = clock()
+    fn(*args, **kwargs)
+    return clock() - started
+
+
+def serial(api, calls, threads):
+    return [timed(api.checkout, 12345) for _ in range(calls)], calls
+
+
+def threaded(api, calls, threads):
+    latencies = []
+    per_thread = calls // threads
+    def worker():
+        # list.extend is atomic, so latencies can be collected from threads
+        latencies.extend(timed(api.checkout, 12345) for _ in range(per_thread))
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    return latencies, per_thread * threads
+
+
+def batched(api, calls, threads):
+    lookups = [api.checkout(12345, batch_mode=True) for _ in range(calls)]
+    result = api.batch.execute(CLIENT_ID, CLIENT_SECRET, lookups,
+                               max_workers=threads)
+    assert len(result['calls']) == calls
+    return [chunk.elapsed for chunk in result.chunks], calls
+
+
+def paged(api, calls, threads):
+    latencies = []
+    started = clock()
+    for _ in iter_pages(api.checkout.find, (1234567,), page_size=50):
+        now = clock()
+        latencies.append(now - started)
+        started = now
+        if len(latencies) >= calls:
+            break
+    return latencies, len(latencies)
+
+
+WORKLOADS = [serial, threaded, batched, paged]
+
+
+def run(api, workload, calls, threads):
+    workload(api, min(calls, 100), threads) # warm up connections
+    started = clock()
+    latencies, count = workload(api, calls, threads)
+    elapsed = clock() - started
+    latencies.sort()
+    return {
+        'calls': count, 'calls/sec': count / elapsed,
+        'p50': percentile(latencies, 50) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+    }
+
+
+def memory(api, calls):
+    serial(api, 100, 1)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    serial(api, calls, 1)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'peak KiB': (peak - before) / 1024.0,
+            'retained B/call': float(current - before) / calls}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--calls', type=int, default=2000,
+                        help="number of calls per workload")
+    parser.add_argument('--threads', type=int, default=8,
+                        help="number of threads in threaded and batched workloads")
+    parser.add_argument('--transport', choices=['requests', 'urllib'],
+                        action='append', help="defaults to both")
+    parser.add_argument('--workload', choices=[w.__name__ for w in WORKLOADS],
+                        action='append', help="defaults to all")
+    parser.add_argument('--https', nargs=2, metavar=('CERTFILE', 'KEYFILE'))
+    parser.add_argument('--in-process', action='store_true',
+                        help="run the server in a thread of this process")
+    args = parser.parse_args()
+    kwargs = {}
+    if args.https:
+        kwargs = {'certfile': args.https[0], 'keyfile': args.https[1]}
+        os.environ['SSL_CERT_FILE'] = os.environ['REQUESTS_CA_BUNDLE'] = \
+            args.https[0]
+    serve = serve_in_thread if args.in_process else serve_in_process
+    endpoint, stop = serve(**kwargs)
+    workloads = [w for w in WORKLOADS
+                 if not args.workload or w.__name__ in args.workload]
+    print("%-9s %-9s %7s %10s %9s %9s %10s %16s" % (
+        'transport', 'workload', 'calls', 'calls/sec', 'p50, ms', 'p99, ms',
+        'peak KiB', 'retained B/call'))
+    try:
+        for transport in args.transport or ['requests', 'urllib']:
+            api = WePay(production=False, access_token='token',
+                        use_requests=transport == 'requests',
+                        pool_maxsize=args.threads)
+            api.api_endpoint = endpoint
+            with api:
+                for workload in workloads:
+                    stats = run(api, workload, args.calls, args.threads)
+                    line = "%-9s %-9s %7d %10.1f %9.3f %9.3f" % (
+                        transport, workload.__name__, stats['calls'],
+                        stats['calls/sec'], stats['p50'], stats['p99'])
+                    if workload is serial and tracemalloc is not None:
+                        stats = memory(api, args.calls)
+                        line += " %10.1f %16.1f" % (
+                            stats['peak KiB'], stats['retained B/call'])
+                    print(line)
+    finally:
+        stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""Local stand-in for wepayapi.com, that serves canned responses to `/checkout`,
+`/account`, paginated `/checkout/find` and `/account/find`, as well as to
+`/batch/create` with any of those inside. Responses are encoded once and
+reused, so the server spends as little time as possible per request.
+
+It can run in a thread of the benchmarking process, or in a separate process,
+which keeps the server out of the GIL contention and allocation measurements.
+Can also be started on its own::
+
+    PYTHONPATH=. python benchmarks/stub.py [port] [certfile keyfile]
+
+"""
+from __future__ import print_function
+import json, multiprocessing, ssl, sys, threading
+from six.moves import BaseHTTPServer, socketserver
+
+
+def checkout(checkout_id):
+    """Returns a fully populated checkout object."""
+    return {
+        'checkout_id': checkout_id, 'account_id': 1234567,
+        'type': 'goods', 'short_description': 'Order #%s' % checkout_id,
+        'currency': 'USD', 'amount': 1234.56, 'state': 'captured',
+        'soft_descriptor': 'WPY*Example Store', 'create_time': 1463589119,
+        'gross': 1270.43, 'reference_id': 'ref_%s' % checkout_id,
+        'callback_uri': 'https://example.com/ipn/%s' % checkout_id,
+        'long_description': 'Long description of an order ' * 4,
+        'delivery_type': 'point_of_sale', 'auto_release': True,
+        'fee': {'app_fee': 12.35, 'processing_fee': 35.87, 'fee_payer': 'payee'},
+        'chargeback': {'amount_charged_back': 0, 'dispute_uri': None},
+        'refund': {'amount_refunded': 0, 'refund_reason': None},
+        'payment_method': {
+            'type': 'credit_card',
+            'credit_card': {'id': 987654321, 'data': {'emv_receipt': None},
+                            'auto_capture': True}},
+        'hosted_checkout': None,
+        'payer': {'email': 'payer%s@example.com' % checkout_id,
+                  'name': 'Bob Payer', 'home_address': {
+                      'address1': '380 Portage Ave', 'city': 'Palo Alto',
+                      'region': 'CA', 'postal_code': '94306', 'country': 'US'}},
+        'npo_information': None,
+        'payment_error': None,
+        'in_review': False,
+    }
+
+
+def account(account_id):
+    """Returns a fully populated account object."""
+    return {
+        'account_id': account_id, 'name': 'Example Store %s' % account_id,
+        'state': 'active', 'description': 'Sells examples',
+        'reference_id': 'acc_%s' % account_id, 'type': 'personal',
+        'create_time': 1463589119, 'owner_user_id': 54321,
+        'disablement_reason': None, 'country': 'US', 'currencies': ['USD'],
+        'balances': [{'currency': 'USD', 'balance': 1234.56,
+                      'incoming_pending_amount': 0, 'outgoing_pending_amount': 0,
+                      'reserved_amount': 0, 'disputed_amount': 0,
+                      'withdrawal_period': 'daily', 'withdrawal_next_time': None,
+                      'withdrawal_bank_name': 'WEPAY BANK XXXXX1234'}],
+        'statuses': [{'currency': 'USD', 'incoming_payments_status': 'ok',
+                      'outgoing_payments_status': 'ok', 'account_restrictions': []}],
+        'action_reasons': [], 'gaq_domains': [], 'theme_object': None,
+        'callback_uri': 'https://example.com/ipn/account/%s' % account_id,
+    }
+
+
+class Responses(object):
+    """Canned responses of the stub. ``total`` objects are available through
+    each `find` call.
+
+    """
+
+    def __init__(self, total=1000):
+        self.total = total
+        self.checkout = checkout(12345)
+        self.account = account(1234567)
+        self.checkouts = [checkout(i) for i in range(total)]
+        self.accounts = [account(i) for i in range(total)]
+        self._encoded = {}
+
+    def respond(self, path, params):
+        """Returns ``(status, response)`` for a call to ``path``."""
+        path = path[3:] if path.startswith('/v2') else path
+        if path == '/checkout':
+            return 200, self.checkout
+        if path == '/account':
+            return 200, self.account
+        if path in ('/checkout/find', '/account/find'):
+            objs = self.checkouts if path == '/checkout/find' else self.accounts
+            start = int(params.get('start', 0))
+            return 200, objs[start:start + int(params.get('limit', 50))]
+        if path == '/batch/create':
+            return 200, {'calls': [{
+                'call': call['call'], 'reference_id': call.get('reference_id'),
+                'response': self.respond(call['call'], call.get('parameters', {}))[1]
+            } for call in params.get('calls', [])]}
+        return 501, {'error': 'invalid_request', 'error_code': 1001,
+                     'error_description': 'that is not a recognized WePay API call'}
+
+    def encoded(self, path, params):
+        """Same as :meth:`respond`, but returns encoded bytes, which are cached
+        for everything except `/batch/create`.
+
+        """
+        key = None
+        if path != '/v2/batch/create':
+            key = (path, params.get('start'), params.get('limit'))
+            if key in self._encoded:
+                return self._encoded[key]
+        status, response = self.respond(path, params)
+        result = status, json.dumps(response).encode('utf-8')
+        if key is not None:
+            self._encoded[key] = result
+        return result
+
+
+def make_server(host='127.0.0.1', port=0, certfile=None, keyfile=None,
+                total=1000):
+    """Creates a keep-alive HTTP server, or HTTPS one if ``certfile`` is
+    given.
+
+    """
+    responses = Responses(total)
+
+    class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # send small responses in one piece and large ones without waiting
+        # for ACKs, otherwise Nagle's algorithm delays them by up to 40ms
+        wbufsize = -1
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            params = json.loads(self.rfile.read(length).decode('utf-8') or '{}')
+            status, data = responses.encoded(self.path, params)
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+        daemon_threads = True
+        request_queue_size = 128
+
+    server = Server((host, port), RequestHandler)
+    if certfile is not None:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    return server
+
+
+def url(server):
+    """Returns an API endpoint of a ``server``, to be used as
+    ``WePay.api_endpoint``.
+
+    """
+    scheme = 'https' if isinstance(server.socket, ssl.SSLSocket) else 'http'
+    return '%s://%s:%s/v2' % ((scheme,) + server.server_address[:2])
+
+
+def serve_in_thread(**kwargs):
+    """Starts a server in a daemon thread.
+
+    :return: a tuple with API endpoint and a function that stops the server.
+
+    """
+    server = make_server(**kwargs)
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,))
+    thread.daemon = True
+    thread.start()
+    def stop():
+        server.shutdown()
+        server.server_close()
+    return url(server), stop
+
+
+def _serve(queue, kwargs):
+    server = make_server(**kwargs)
+    queue.put(url(server))
+    server.serve_forever(0.01)
+
+
+def serve_in_process(**kwargs):
+    """Starts a server in a separate process.
+
+    :return: a tuple with API endpoint and a function that stops the server.
+
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(queue, kwargs))
+    process.daemon = True
+    process.start()
+    endpoint = queue.get(timeout=30)
+    def stop():
+        process.terminate()
+        process.join()
+    return endpoint, stop
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    server = make_server(port=int(args[0]) if args else 8000,
+                         certfile=args[1] if len(args) > 1 else None,
+                         keyfile=args[2] if len(args) > 2 else None)
+    print("Serving WePay stub at %s" % url(server))
+    server.serve_forever()
@@ -36,6 +36,6 @@ setup(
         'Topic :: Software Development :: Libraries :: Python Modules'
     ],
     keywords=["wepay", "payment", "credit card"],
-    install_requires=['six'],
+    install_requires=['six', 'futures; python_version < "3"'],
     tests_require=['mock', 'requests']
 )
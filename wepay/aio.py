@@ -0,0 +1,594 @@
+"""Asynchronous client for the `WePay <https://wepay.com>`_ API, built on top of
+`asyncio <https://docs.python.org/3/library/asyncio.html>`_. Requires Python
+3.5 or newer.
+
+.. moduleauthor:: lehins <lehins@yandex.ru>
+   :platform: independent
+"""
+import asyncio, collections, copy, http.client, io, socket, time, warnings
+from urllib.parse import urlsplit
+from urllib.error import URLError
+try:
+    import aiohttp
+    HAS_AIOHTTP = True
+except ImportError:
+    HAS_AIOHTTP = False
+
+from wepay.api import WePay
+from wepay.codec import get_codec
+from wepay.exceptions import WePayWarning, WePayError, WePayConnectionError
+from wepay.metrics import clock
+from wepay.middleware import MetricsMiddleware, CacheMiddleware, \
+    SingleFlightMiddleware, RetryMiddleware, HedgeMiddleware, \
+    CircuitBreakerMiddleware, RateLimitMiddleware
+from wepay.objects import decode_records
+from wepay.utils import decode_response, is_idempotent, raise_error
+
+__all__ = ['AsyncWePay', 'ipn_app']
+
+_STALE_CONNECTION_ERRORS = (
+    http.client.BadStatusLine, ConnectionResetError, BrokenPipeError,
+    asyncio.IncompleteReadError)
+
+
+class AsyncMetricsMiddleware(MetricsMiddleware):
+
+    async def __call__(self, request, call_next):
+        started = self.start(request)
+        try:
+            response = await call_next(request)
+        except BaseException as exc:
+            self.emit(request, started, exc)
+            raise
+        self.emit(request, started)
+        return response
+
+
+class AsyncCacheMiddleware(CacheMiddleware):
+
+    async def __call__(self, request, call_next):
+        key = self.key(request)
+        generation = None
+        if key is not None:
+            found, response = self.cache.get(key)
+            if found:
+                request.cached = True
+                return response
+            generation = self.cache.generation()
+        response = None
+        try:
+            response = await call_next(request)
+        finally:
+            self.update(request, key, response, generation)
+        return response
+
+
+class AsyncSingleFlightMiddleware(SingleFlightMiddleware):
+
+    async def __call__(self, request, call_next):
+        group = self.group
+        key = group.key(request)
+        if key is None:
+            return await call_next(request)
+        # asyncio futures belong to a loop, so calls are coalesced per loop
+        loop = asyncio.get_event_loop()
+        key = (loop,) + key
+        while True:
+            flight, leader = group.join(key, loop.create_future)
+            if leader:
+                break
+            try:
+                return copy.deepcopy(await asyncio.shield(flight))
+            except asyncio.CancelledError:
+                # it was the leader, who got cancelled, so the call is made
+                # again, with one of the followers taking over
+                if not flight.cancelled():
+                    raise
+        try:
+            response = await call_next(request)
+        except asyncio.CancelledError:
+            group.land(key)
+            flight.cancel()
+            raise
+        except BaseException as exc:
+            group.land(key)
+            flight.set_exception(exc)
+            flight.exception() # nobody may be waiting, do not log it as lost
+            raise
+        group.land(key)
+        flight.set_result(response)
+        return response
+
+
+class AsyncRetryMiddleware(RetryMiddleware):
+
+    async def __call__(self, request, call_next):
+        policy = self.policy
+        started = time.time()
+        retryable = policy.retryable(request.uri, request.params)
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                response = await call_next(request)
+            except (WePayError, WePayConnectionError) as exc:
+                delay = policy.next_delay(exc, attempt, started, retryable)
+                if delay is None:
+                    policy.report(request.uri, attempt, started, exc)
+                    raise
+                await asyncio.sleep(delay)
+            else:
+                policy.report(request.uri, attempt, started)
+                return response
+
+
+class AsyncHedgeMiddleware(HedgeMiddleware):
+
+    async def __call__(self, request, call_next):
+        policy = self.policy
+        if not policy.hedgeable(request.uri):
+            return await call_next(request)
+        first = policy.duplicate(request)
+        primary = asyncio.ensure_future(call_next(first))
+        tasks = {primary: (clock(), first)}
+        finished = []
+        hedges = 0
+        error = None
+        try:
+            while True:
+                timeout = None
+                if hedges < policy.max_hedges:
+                    timeout = policy.hedge_delay(request.uri)
+                done, _ = await asyncio.wait(
+                    tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    started, sent = tasks.pop(task)
+                    finished.append(sent)
+                    if task.exception() is None:
+                        policy.record(request.uri, clock() - started,
+                                      hedge=task is not primary)
+                        return task.result()
+                    error = error or task.exception()
+                if not done:
+                    hedges += 1
+                    policy.hedged(request.uri)
+                    if request.timing is not None:
+                        request.timing.hedges += 1
+                    hedge = policy.duplicate(request)
+                    tasks[asyncio.ensure_future(call_next(hedge))] = (
+                        clock(), hedge)
+                elif not tasks:
+                    raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            policy.collect(request, [sent for _, sent in tasks.values()] +
+                           finished)
+
+
+class AsyncCircuitBreakerMiddleware(CircuitBreakerMiddleware):
+
+    async def __call__(self, request, call_next):
+        self.breaker.before(request.uri)
+        try:
+            response = await call_next(request)
+        except BaseException as exc:
+            self.breaker.record(request.uri, exc)
+            raise
+        self.breaker.record(request.uri)
+        return response
+
+
+class AsyncRateLimitMiddleware(RateLimitMiddleware):
+
+    async def __call__(self, request, call_next):
+        delay = self.limiter.reserve(request.access_token)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return await call_next(request)
+
+
+class AsyncWePay(WePay):
+    """Asynchronous version of :class:`WePay<wepay.api.WePay>`. It has exactly
+    the same call attributes, which perform the same parameter validation and
+    raise the same exceptions, with the only difference that all API calls
+    return awaitables:
+
+        >>> async with AsyncWePay(production=False, access_token=WEPAY_ACCESS_TOKEN) as api:
+        ...     checkouts = await api.checkout.find(account_id)
+        ...     checkout = await api.checkout(checkouts[0]['checkout_id'])
+
+    Calls made with ``batch_mode=True`` still return a dictionary right away,
+    while helpers, which need responses right away, such as `iter_find()`,
+    `scan()`, `batch.execute()` or `batching()`, raise :exc:`TypeError`.
+
+    All calls go through a non-blocking pool of kept alive connections, so
+    there can be many of them in flight concurrently. The pool is managed by
+    `aiohttp <https://docs.aiohttp.org>`_ library if it is installed, otherwise
+    by plain :mod:`asyncio` streams.
+
+    Accepts the same keyword arguments as :class:`WePay<wepay.api.WePay>`,
+    except ``use_requests``, plus:
+
+    :keyword bool use_aiohttp: set to `False` in order to explicitly turn off
+       `aiohttp` usage and fallback to :mod:`asyncio` streams.
+
+    Middlewares have to be coroutine functions, that await ``call_next``.
+
+    """
+
+    _builtin_middleware = (
+        ('metrics', AsyncMetricsMiddleware), ('cache', AsyncCacheMiddleware),
+        ('single_flight', AsyncSingleFlightMiddleware),
+        ('retry', AsyncRetryMiddleware), ('hedge', AsyncHedgeMiddleware),
+        ('breaker', AsyncCircuitBreakerMiddleware),
+        ('rate_limit', AsyncRateLimitMiddleware))
+    _awaitable = True
+
+    def __init__(self, production=True, access_token=None, api_version=None,
+                 timeout=30, silent=None, use_aiohttp=None, pool_connections=10,
+                 pool_maxsize=100, pool_idle_timeout=None, cache=None,
+                 retry=None, rate_limit=None, breaker=None, codec=None,
+                 use_decimal=False, metrics=None, hedge=None, single_flight=None,
+                 middleware=None, tokens=None, records=False):
+        super(AsyncWePay, self).__init__(
+            production=production, access_token=access_token,
+            api_version=api_version, timeout=timeout, silent=silent,
+            use_requests=False, cache=cache, retry=retry, rate_limit=rate_limit,
+            breaker=breaker, codec=codec, use_decimal=use_decimal,
+            metrics=metrics, hedge=hedge, single_flight=single_flight,
+            middleware=middleware, tokens=tokens, records=records)
+        post = self._post
+        self._post = AsyncPost(use_aiohttp=use_aiohttp, silent=silent,
+                               pool_connections=pool_connections,
+                               pool_maxsize=pool_maxsize,
+                               pool_idle_timeout=pool_idle_timeout,
+                               codec=post.codec)
+        self._post.records = post.records
+
+    def __enter__(self):
+        raise TypeError("Use 'async with' together with %s" % type(self).__name__)
+
+    def batching(self, client_id, client_secret, **kwargs):
+        raise TypeError("Use batch_mode=True calls and batch.create() "
+                        "together with %s" % type(self).__name__)
+
+    def map(self, call, iterable, **kwargs):
+        raise TypeError("Use asyncio.gather() or asyncio.as_completed() "
+                        "together with %s" % type(self).__name__)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """Closes all kept alive connections to WePay."""
+        await self._post.close()
+
+    async def call(self, uri, params=None, access_token=None, api_version=None,
+                   timeout=None):
+        """Asynchronous version of :meth:`WePay.call<wepay.api.WePay.call>`."""
+        request = self._prepare_call(
+            uri, params, access_token, api_version, timeout)
+        return await self._handler()(request)
+
+    async def _send(self, request):
+        timing = request.timing
+        if timing is None:
+            return await self._post(request.url, request.params,
+                                    request.headers, request.timeout)
+        timing.attempts += 1
+        return await self._post(request.url, request.params, request.headers,
+                                request.timeout, timing)
+
+
+class AsyncPost(object):
+    """Asynchronous counterpart of :class:`Post<wepay.utils.Post>`, uses either
+    `aiohttp` library or :class:`AsyncConnectionPool` to perform POST requests.
+
+    """
+
+    def __init__(self, use_aiohttp=None, silent=None, pool_connections=10,
+                 pool_maxsize=100, pool_idle_timeout=None, codec=None):
+        self._use_aiohttp = HAS_AIOHTTP and (use_aiohttp is None or use_aiohttp)
+        if not silent and use_aiohttp and not self._use_aiohttp:
+            message = "Using aiohttp library was specified, but there was a " \
+                      "problem importing it. Falling back to asyncio."
+            if silent is not None:
+                raise WePayWarning(message)
+            warnings.warn(message, WePayWarning)
+        self._pool_connections = pool_connections
+        self._pool_maxsize = pool_maxsize
+        self._pool_idle_timeout = pool_idle_timeout
+        self.codec = get_codec(codec)
+        self.records = None
+        self._session = None
+        self._pool = AsyncConnectionPool(
+            maxhosts=pool_connections, maxsize=pool_maxsize,
+            idle_timeout=pool_idle_timeout)
+
+    async def __call__(self, url, params, headers, timeout, timing=None):
+        if self._use_aiohttp:
+            return await self._post_aiohttp(url, params, headers, timeout, timing)
+        return await self._post_asyncio(url, params, headers, timeout, timing)
+
+    async def close(self):
+        """Closes all pooled connections. Pool will be recreated on the next call."""
+        session, self._session = self._session, None
+        if session is not None:
+            await session.close()
+        self._pool.close()
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            kwargs = {}
+            if self._pool_idle_timeout is not None:
+                kwargs['keepalive_timeout'] = self._pool_idle_timeout
+            connector = aiohttp.TCPConnector(
+                limit=self._pool_connections * self._pool_maxsize,
+                limit_per_host=self._pool_maxsize, **kwargs)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def _post_asyncio(self, url, params, headers, timeout, timing=None):
+        if timing is not None:
+            timing.start()
+        data = self.codec.dumps(params)
+        if timing is not None:
+            timing.mark('encode', sent=len(data))
+        try:
+            status, reason, msg, body = await asyncio.wait_for(
+                self._pool.urlopen(url, data, headers,
+                                   idempotent=is_idempotent(url, params)),
+                timeout)
+        except asyncio.TimeoutError:
+            if timing is not None:
+                timing.mark('network')
+            raise WePayConnectionError(URLError(socket.timeout('timed out')))
+        except (OSError, http.client.HTTPException,
+                asyncio.IncompleteReadError) as exc:
+            if timing is not None:
+                timing.mark('network')
+            raise WePayConnectionError(URLError(exc))
+        if timing is None:
+            return decode_response(url, status, reason, msg, body, self.codec,
+                                   self.records)
+        timing.mark('network', received=len(body), status=status)
+        try:
+            return decode_response(url, status, reason, msg, body, self.codec,
+                                   self.records)
+        finally:
+            timing.mark('decode')
+
+    async def _post_aiohttp(self, url, params, headers, timeout, timing=None):
+        if timing is not None:
+            timing.start()
+        data = self.codec.dumps(params)
+        if timing is not None:
+            timing.mark('encode', sent=len(data))
+        try:
+            async with self._get_session().post(
+                    url, data=data, headers=headers,
+                    timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                body = await response.read()
+                if timing is not None:
+                    timing.mark('network', received=len(body),
+                                status=response.status)
+                if response.status >= 400:
+                    exc = aiohttp.ClientResponseError(
+                        response.request_info, response.history,
+                        status=response.status, message=response.reason,
+                        headers=response.headers)
+                    try:
+                        kwargs = self.codec.loads(body)
+                    except ValueError:
+                        kwargs = {}
+                    raise_error(exc, response.status, **kwargs)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            if timing is not None:
+                timing.mark('network')
+            raise WePayConnectionError(exc)
+        if timing is None:
+            return self._decode(url, body)
+        try:
+            return self._decode(url, body)
+        finally:
+            timing.mark('decode')
+
+    def _decode(self, url, body):
+        if self.records is None:
+            return self.codec.loads(body)
+        return decode_records(url, body, self.codec, self.records)
+
+
+class AsyncConnectionPool(object):
+    """Pool of kept alive HTTP/1.1 connections made with :mod:`asyncio`
+    streams. Counterpart of :class:`ConnectionPool<wepay.utils.ConnectionPool>`,
+    with an addition that number of simultaneously open connections per host
+    is limited by ``maxsize``, so excess requests wait for a free connection.
+
+    """
+
+    def __init__(self, maxhosts=10, maxsize=100, idle_timeout=None):
+        self._maxhosts = maxhosts
+        self._maxsize = maxsize
+        self._idle_timeout = idle_timeout
+        self._idle = collections.OrderedDict()
+        self._limits = {}
+
+    async def urlopen(self, url, body, headers, idempotent=False):
+        """Sends a POST request and reads the whole response. Same as with
+        :class:`ConnectionPool<wepay.utils.ConnectionPool>`, a request is only
+        sent again on a new connection, when a kept alive one turns out to be
+        closed, if it was not written in full or if it is ``idempotent``.
+
+        :return: a tuple with status, reason, headers and body of the response.
+
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname,
+               parts.port or (80 if parts.scheme == 'http' else 443))
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        headers = dict(headers, Host=parts.netloc)
+        limit = self._limits.get(key)
+        if limit is None:
+            limit = self._limits[key] = asyncio.Semaphore(self._maxsize)
+        async with limit:
+            conn, reused = self._get(key)
+            if conn is None:
+                conn = await self._new_connection(key)
+            try:
+                try:
+                    await self._send(conn, path, body, headers)
+                except _STALE_CONNECTION_ERRORS:
+                    if not reused:
+                        raise
+                    # request was not written in full, so it was not processed
+                    conn[1].close()
+                    conn, reused = await self._new_connection(key), False
+                    await self._send(conn, path, body, headers)
+                try:
+                    response = await self._receive(conn)
+                except _STALE_CONNECTION_ERRORS:
+                    # server could have processed the request before dropping
+                    # the connection, so only an idempotent one is sent again
+                    if not (reused and idempotent):
+                        raise
+                    conn[1].close()
+                    conn = await self._new_connection(key)
+                    await self._send(conn, path, body, headers)
+                    response = await self._receive(conn)
+            except BaseException:
+                conn[1].close()
+                raise
+            status, reason, msg, data, will_close = response
+            if will_close:
+                conn[1].close()
+            else:
+                self._put(key, conn)
+        return status, reason, msg, data
+
+    def close(self):
+        """Closes all idle connections."""
+        idle, self._idle = self._idle, collections.OrderedDict()
+        for connections in idle.values():
+            for (_, writer), _ in connections:
+                writer.close()
+
+    async def _new_connection(self, key):
+        scheme, host, port = key
+        return await asyncio.open_connection(
+            host, port, ssl=None if scheme == 'http' else True)
+
+    def _get(self, key):
+        connections = self._idle.get(key)
+        now = time.time()
+        while connections:
+            conn, last_used = connections.pop()
+            if conn[0].at_eof():
+                conn[1].close()
+            elif (self._idle_timeout is not None and
+                  now - last_used > self._idle_timeout):
+                conn[1].close()
+            else:
+                return conn, True
+        return None, False
+
+    def _put(self, key, conn):
+        connections = self._idle.pop(key, [])
+        self._idle[key] = connections
+        if len(connections) < self._maxsize:
+            connections.append((conn, time.time()))
+        else:
+            conn[1].close()
+        while len(self._idle) > self._maxhosts:
+            for (_, writer), _ in self._idle.popitem(last=False)[1]:
+                writer.close()
+
+    async def _send(self, conn, path, body, headers):
+        writer = conn[1]
+        lines = ['POST %s HTTP/1.1' % path, 'Content-Length: %s' % len(body)]
+        lines.extend('%s: %s' % item for item in headers.items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+    async def _receive(self, conn):
+        reader = conn[0]
+        status_line = await reader.readline()
+        if not status_line:
+            raise http.client.RemoteDisconnected(
+                "Remote end closed connection without response")
+        # reason phrase can be empty
+        parts = status_line.decode('latin-1').split(None, 2)
+        try:
+            version, status = parts[:2]
+            status = int(status)
+        except ValueError:
+            raise http.client.BadStatusLine(status_line)
+        reason = parts[2] if len(parts) > 2 else ''
+        raw_headers = []
+        while True:
+            line = await reader.readline()
+            raw_headers.append(line)
+            if line in (b'\r\n', b'\n', b''):
+                break
+        msg = http.client.parse_headers(io.BytesIO(b''.join(raw_headers)))
+        will_close = (version == 'HTTP/1.0' or
+                      msg.get('Connection', '').lower() == 'close')
+        if msg.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            data = b''.join(chunks)
+        elif msg.get('Content-Length') is not None:
+            data = await reader.readexactly(int(msg['Content-Length']))
+        else:
+            data = await reader.read()
+            will_close = True
+        return status, reason.strip(), msg, data, will_close
+
+
+def ipn_app(receiver):
+    """Wraps an :class:`IPNReceiver<wepay.ipn.IPNReceiver>` into an ASGI
+    application. Notifications are acknowledged without waiting for lookups,
+    while on `lifespan` shutdown the receiver is closed in an executor, so
+    that queued notifications are still dispatched.
+
+    """
+    async def app(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await asyncio.get_event_loop().run_in_executor(
+                        None, receiver.close)
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        body = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            body.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        headers = dict(scope.get('headers') or [])
+        status, text = receiver.handle(
+            scope.get('method', 'GET'),
+            headers.get(b'content-type', b'').decode('latin-1'), b''.join(body))
+        text = text.encode('utf-8')
+        await send({'type': 'http.response.start', 'status': status, 'headers': [
+            (b'content-type', b'text/plain'),
+            (b'content-length', str(len(text)).encode('latin-1'))]})
+        await send({'type': 'http.response.body', 'body': text})
+    return app
@@ -3,7 +3,17 @@
 .. moduleauthor:: lehins <lehins@yandex.ru>
    :platform: independent
 """
-from wepay.calls import *
+import copy, functools, operator, threading
+
+from wepay.batching import AutoBatch
+from wepay.bulk import imap
+from wepay import calls
+from wepay.calls.base import Call
+from wepay.codec import get_codec
+from wepay.middleware import Request, compose, MetricsMiddleware, \
+    CacheMiddleware, SingleFlightMiddleware, RetryMiddleware, \
+    HedgeMiddleware, CircuitBreakerMiddleware, RateLimitMiddleware
+from wepay.objects import RECORDS
 from wepay.utils import Post, cached_property
 
 __all__ = ['WePay']
@@ -32,6 +42,55 @@ class WePay(object):
        `requests <http://docs.python-requests.org/en/latest/>`_ library usage and
        fallback to `urllib <https://docs.python.org/3/library/urllib.html#module-urllib>`_
 
+    :keyword int pool_connections: number of per host connection pools to keep.
+
+    :keyword int pool_maxsize: maximum number of connections to WePay kept alive
+       and reused between calls.
+
+    :keyword float pool_idle_timeout: time in seconds after which idle
+       connections are dropped. `None` (default) keeps them until :meth:`close`
+       is called.
+
+    :keyword cache: a :class:`LookupCache<wepay.cache.LookupCache>` instance,
+       which will be used to serve repeated lookup calls.
+
+    :keyword retry: a :class:`RetryPolicy<wepay.retry.RetryPolicy>` instance,
+       which will be used to retry failed calls.
+
+    :keyword rate_limit: a :class:`RateLimiter<wepay.ratelimit.RateLimiter>`
+       instance, which will be used to throttle calls.
+
+    :keyword breaker: a :class:`CircuitBreaker<wepay.circuit.CircuitBreaker>`
+       instance, which will be used to fail calls fast while WePay is failing.
+
+    :keyword codec: JSON codec used for params and responses, either a name
+       (``'orjson'``, ``'ujson'``, ``'simplejson'`` or ``'json'``) or an
+       instance. Fastest installed one is used by default, see :mod:`wepay.codec`.
+
+    :keyword bool use_decimal: decode amounts in responses as
+       :class:`decimal.Decimal` instead of `float`.
+
+    :keyword metrics: a :class:`Metrics<wepay.metrics.Metrics>` instance, which
+       will receive latency, status and size of every call.
+
+    :keyword hedge: a :class:`HedgePolicy<wepay.hedging.HedgePolicy>`
+       instance, which will be used to send duplicates of slow lookups.
+
+    :keyword single_flight: a :class:`SingleFlight
+       <wepay.singleflight.SingleFlight>` instance, which will be used to
+       share one request between identical concurrent lookups.
+
+    :keyword list middleware: callables, which every call is passed through
+       before built-in features, see :mod:`wepay.middleware`.
+
+    :keyword tokens: a :class:`TokenStore<wepay.tokens.TokenStore>` instance,
+       which keeps access tokens of merchants, see :meth:`merchant`.
+
+    :keyword records: set to `True` in order to receive checkouts, accounts,
+       preapprovals, withdrawals and subscriptions as lazily decoded
+       :class:`Record<wepay.objects.Record>` objects, or a dictionary, which
+       maps uris of calls to record classes, see :mod:`wepay.objects`.
+
     Instance of this class contains attributes, which correspond to WePay
     objects and should be used to perform API calls. If a WePay object has a
     lookup call, corresponding attribute will also be callable. Example:
@@ -70,16 +129,59 @@ class WePay(object):
         >>> calls.append(api.account.create('Test Account', 'Short Description', batch_mode=True, access_token='STAGE_...', batch_reference_id='c1'))
         >>> calls.append(api.checkout(12345, batch_mode=True))
         >>> api.batch.create(CLIENT_ID, CLIENT_SECRET, calls)
+
+    Or calls can be batched automatically, see :meth:`batching`:
+        >>> with api.batching(CLIENT_ID, CLIENT_SECRET):
+        ...     account = api.account.create('Test Account', 'Short Description', access_token='STAGE_...')
+        ...     checkout = api.checkout(12345)
+        >>> checkout.result()
+
+    Connections to WePay are pooled and kept alive, so it is best to create one
+    instance and reuse it. Pool can be drained by :meth:`close` or by using an
+    instance as a context manager:
+
+        >>> with WePay(production=False, access_token=WEPAY_ACCESS_TOKEN) as api:
+        ...     api.checkout(12345)
     """
     
+    _builtin_middleware = (
+        ('metrics', MetricsMiddleware), ('cache', CacheMiddleware),
+        ('single_flight', SingleFlightMiddleware), ('retry', RetryMiddleware),
+        ('hedge', HedgeMiddleware), ('breaker', CircuitBreakerMiddleware),
+        ('rate_limit', RateLimitMiddleware))
+    _features = operator.attrgetter(
+        'metrics', 'cache', 'single_flight', 'retry', 'hedge', 'breaker',
+        'rate_limit')
+    _awaitable = False
+
     def __init__(self, production=True, access_token=None, api_version=None,
-                 timeout=30, silent=None, use_requests=None):
+                 timeout=30, silent=None, use_requests=None, pool_connections=10,
+                 pool_maxsize=10, pool_idle_timeout=None, cache=None, retry=None,
+                 rate_limit=None, breaker=None, codec=None, use_decimal=False,
+                 metrics=None, hedge=None, single_flight=None, middleware=None,
+                 tokens=None, records=False):
         self.production = production
         self.access_token = access_token
         self.api_version = api_version
         self.silent = silent
+        self.cache = cache
+        self.retry = retry
+        self.rate_limit = rate_limit
+        self.breaker = breaker
+        self.metrics = metrics
+        self.hedge = hedge
+        self.single_flight = single_flight
+        self.middleware = list(middleware or [])
+        self.tokens = tokens
+        self._chain = None
         self._timeout = timeout
-        self._post = Post(use_requests=use_requests, silent=silent)
+        self._post = Post(use_requests=use_requests, silent=silent,
+                          pool_connections=pool_connections,
+                          pool_maxsize=pool_maxsize,
+                          pool_idle_timeout=pool_idle_timeout,
+                          codec=get_codec(codec, use_decimal=use_decimal))
+        self._post.records = RECORDS if records is True else records or None
+        self._local = threading.local()
         if production:
             self.api_endpoint = "https://wepayapi.com/v2"
             self.browser_uri = "https://www.wepay.com"
@@ -92,45 +194,141 @@ class WePay(object):
             self.browser_iframe_js = self.browser_uri + "/js/iframe.wepay.js"
         self.browser_endpoint = self.browser_uri + "/v2"
     
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Closes all kept alive connections to WePay."""
+        self._post.close()
+
+    def batching(self, client_id, client_secret, window=None, max_calls=50,
+                 access_token=None):
+        """Creates a context, within which all calls are coalesced into
+        `/batch/create` requests and return futures instead of responses.
+
+        :param client_id: application's client id.
+        :param client_secret: application's client secret.
+        :keyword float window: time in seconds to wait for more calls
+           before sending a batch.
+        :keyword int max_calls: maximum number of calls in one batch.
+        :keyword str access_token: access_token for `/batch/create` and
+           calls that do not specify one.
+        :rtype: :class:`AutoBatch<wepay.batching.AutoBatch>`
+
+        """
+        return AutoBatch(self, client_id, client_secret, window=window,
+                         max_calls=max_calls, access_token=access_token)
+
+    def map(self, call, iterable, max_workers=10, ordered=True, **kwargs):
+        """Makes a ``call`` for every tuple of arguments in ``iterable``
+        concurrently, in a pool of ``max_workers`` threads, and yields
+        :class:`MapResult<wepay.bulk.MapResult>` objects with responses or
+        exceptions as soon as they are available:
+
+            >>> for result in api.map(api.checkout, checkout_ids, timeout=10):
+            ...     if result.error is None:
+            ...         print(result.response['state'])
+
+        Calls share the pool of kept alive connections, so ``pool_maxsize``
+        should not be lower than ``max_workers``, and go through all the
+        :mod:`middleware<wepay.middleware>`, including the rate limiter.
+
+        :param call: a call method, for instance ``api.checkout``.
+        :param iterable: argument tuples, or single arguments.
+        :keyword int max_workers: maximum number of calls in flight.
+        :keyword bool ordered: yield results in order of ``iterable``, otherwise
+           in order of completion.
+        :keyword kwargs: keyword arguments passed to every call.
+        :rtype: generator, see :func:`imap<wepay.bulk.imap>`
+
+        """
+        if kwargs:
+            call = functools.partial(call, **kwargs)
+        return imap(call, iterable, max_workers=max_workers, ordered=ordered)
+
+    def merchant(self, key):
+        """Returns a copy of this client, which makes calls with an access
+        token of a merchant with ``key`` from :attr:`tokens`, while sharing
+        connections, middleware and all the other features with this one:
+
+            >>> api.merchant(merchant_id).checkout.create(...)
+
+        Copies are cheap, since the token is read from memory once it was
+        loaded, so a new one can be created for every call.
+
+        :raises: :exc:`KeyError` if there is no token for ``key``.
+
+        """
+        access_token = self.tokens.get(key)
+        if access_token is None:
+            raise KeyError("No access token for merchant: %r" % (key,))
+        merchant = copy.copy(self)
+        # call instances are bound to the client they were created by
+        for name, value in list(merchant.__dict__.items()):
+            if isinstance(value, Call):
+                del merchant.__dict__[name]
+        merchant.access_token = access_token
+        return merchant
+
+    @property
+    def auto_batch(self):
+        """:class:`AutoBatch<wepay.batching.AutoBatch>` active in current
+        thread or `None`.
+
+        """
+        stack = getattr(self._local, 'auto_batches', None)
+        return stack[-1] if stack else None
+
+    def _push_auto_batch(self, batch):
+        if getattr(self._local, 'auto_batches', None) is None:
+            self._local.auto_batches = []
+        self._local.auto_batches.append(batch)
+
+    def _pop_auto_batch(self, batch):
+        self._local.auto_batches.remove(batch)
+
     @cached_property
     def oauth2(self):
         """:class:`OAuth2<wepay.calls.oauth2.OAuth2>` call instance."""
-        return OAuth2(self)
+        return calls.OAuth2(self)
  
     @cached_property
     def app(self):
         """:class:`App<wepay.calls.app.App>` call instance"""
-        return App(self)
+        return calls.App(self)
 
     @cached_property
     def user(self):
         """:class:`User<wepay.calls.user.User>` call instance"""
-        return User(self)
+        return calls.User(self)
 
     @cached_property
     def account(self):
         """:class:`Account<wepay.calls.account.Account>` call instance"""
-        return Account(self)
+        return calls.Account(self)
 
     @cached_property
     def checkout(self):
         """:class:`Checkout<wepay.calls.checkout.Checkout>` call instance"""
-        return Checkout(self)
+        return calls.Checkout(self)
 
     @cached_property
     def preapproval(self):
         """:class:`Preapproval<wepay.calls.preapproval.Preapproval>` call instance"""
-        return Preapproval(self)
+        return calls.Preapproval(self)
 
     @cached_property
     def withdrawal(self):
         """:class:`Withdrawal<wepay.calls.withdrawal.Withdrawal>` call instance"""
-        return Withdrawal(self)
+        return calls.Withdrawal(self)
 
     @cached_property
     def credit_card(self):
         """:class:`CreditCard<wepay.calls.credit_card.CreditCard>` call instance"""
-        return CreditCard(self)
+        return calls.CreditCard(self)
 
     @cached_property
     def subscription_plan(self):
@@ -138,12 +336,12 @@ class WePay(object):
         call instance
 
         """
-        return SubscriptionPlan(self)
+        return calls.SubscriptionPlan(self)
 
     @cached_property
     def subscription(self):
         """:class:`Subscription<wepay.calls.subscription.Subscription>` call instance"""
-        return Subscription(self)
+        return calls.Subscription(self)
 
     @cached_property
     def subscription_charge(self):
@@ -151,18 +349,19 @@ class WePay(object):
         call instance
 
         """
-        return SubscriptionCharge(self)
+        return calls.SubscriptionCharge(self)
 
     @cached_property
     def batch(self):
         """:class:`Batch<wepay.calls.batch.Batch>` call instance """
-        return Batch(self)
+        return calls.Batch(self)
 
     def call(self, uri, params=None, access_token=None, api_version=None, timeout=None):
         """Calls wepay.com/v2/``uri`` with ``params`` and returns the JSON
         response as a python `dict`. The optional ``access_token`` parameter
         takes precedence over instance's ``access_token`` if it is
-        set. Essentially this is the place for all api calls.
+        set. Essentially this is the place for all api calls, each of which
+        is passed through the :mod:`middleware<wepay.middleware>` chain.
 
         :param str uri: API uri to call
         :keyword dict params: parameters to include in the call
@@ -177,6 +376,35 @@ class WePay(object):
         :raises: :exc:`WePayConnectionError<wepay.exceptions.WePayConnectionError>`
 
         """
+        request = self._prepare_call(
+            uri, params, access_token, api_version, timeout)
+        return self._handler()(request)
+
+    def _handler(self):
+        # chain is rebuilt only when middlewares or built-in features change
+        key = self._features(self)
+        if self.middleware:
+            key += tuple(self.middleware)
+        chain = self._chain
+        if chain is None or chain[0] != key:
+            middlewares = list(self.middleware)
+            for attr, middleware_class in self._builtin_middleware:
+                value = getattr(self, attr)
+                if value is not None:
+                    middlewares.append(middleware_class(value))
+            chain = self._chain = (key, compose(middlewares, self._send))
+        return chain[1]
+
+    def _send(self, request):
+        timing = request.timing
+        if timing is None:
+            return self._post(request.url, request.params, request.headers,
+                              request.timeout)
+        timing.attempts += 1
+        return self._post(request.url, request.params, request.headers,
+                          request.timeout, timing)
+
+    def _prepare_call(self, uri, params, access_token, api_version, timeout):
         url = self.api_endpoint + uri
         params = params or {}
 
@@ -191,4 +419,5 @@ class WePay(object):
             headers['Api-Version'] = api_version
 
         timeout = timeout or self._timeout
-        return self._post(url, params, headers, timeout)
+        return Request(uri, url, params, headers, timeout, access_token,
+                       api_version)
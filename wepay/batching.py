@@ -0,0 +1,303 @@
+"""Automatic coalescing of API calls into `/batch/create
+<https://www.wepay.com/developer/reference/batch#create>`_ requests.
+
+.. moduleauthor:: lehins <lehins@yandex.ru>
+   :platform: independent
+"""
+import collections, itertools, threading, time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from wepay.exceptions import WePayClientError, WePayServerError
+
+__all__ = [
+    'MAX_CALLS', 'AutoBatch', 'BatchFuture', 'BatchExecutor', 'BatchResult',
+    'BatchChunk'
+]
+
+MAX_CALLS = 50
+"""Maximum number of calls WePay accepts in a single `/batch/create`."""
+
+
+class BatchFuture(Future):
+    """A :class:`concurrent.futures.Future` that resolves to a response of a
+    single call queued in an :class:`AutoBatch`. Asking for its result before
+    the batch was sent flushes the batch right away, so it is safe to wait on it
+    within the batching context.
+
+    """
+
+    def __init__(self, batch=None):
+        self._batch = batch
+        super(BatchFuture, self).__init__()
+
+    def result(self, timeout=None):
+        if self._batch is not None and not self.done():
+            self._batch.flush()
+        return super(BatchFuture, self).result(timeout=timeout)
+
+    def exception(self, timeout=None):
+        if self._batch is not None and not self.done():
+            self._batch.flush()
+        return super(BatchFuture, self).exception(timeout=timeout)
+
+
+class AutoBatch(object):
+    """Queues all calls made through ``api`` while it is active and sends them
+    as one `/batch/create` request, which is used as a context manager and is
+    normally created by :meth:`WePay.batching<wepay.api.WePay.batching>`:
+
+        >>> with api.batching(CLIENT_ID, CLIENT_SECRET) as batch:
+        ...     f1 = api.checkout(12345)
+        ...     f2 = api.account(54321, access_token='STAGE_...')
+        >>> f1.result()
+        {'checkout_id': 12345, ...}
+
+    Every call returns a :class:`BatchFuture`, that resolves to the call's own
+    response or raises :exc:`WePayClientError<wepay.exceptions.WePayClientError>`
+    (HTTP 400 is assumed) or :exc:`WePayServerError<wepay.exceptions.WePayServerError>`
+    (for `processing_error`, HTTP 500 is assumed) as if it was a standalone call.
+    Failure of the whole `/batch/create` request is set on all of its futures.
+    Calls that cannot be batched, i.e. ones with ``api_version`` or ``timeout``
+    keywords, are performed right away and returned as resolved futures.
+
+    Batch is sent when the context is exited, as soon as ``max_calls`` calls
+    were queued, once ``window`` seconds passed since the first call was queued,
+    or when :meth:`flush` is called explicitly.
+
+    Context is local to a thread, but a single instance can be entered by many
+    threads at once, in which case their calls are coalesced together.
+
+    :param api: :class:`WePay<wepay.api.WePay>` instance.
+    :param client_id: application's client id.
+    :param client_secret: application's client secret.
+    :keyword float window: time in seconds to wait for more calls before sending
+       a batch. `None` (default) means wait until exit or ``max_calls``.
+    :keyword int max_calls: maximum number of calls in one `/batch/create`.
+    :keyword str access_token: used for `/batch/create` itself, as well as for
+       calls that did not specify one, instead of ``api.access_token``.
+
+    """
+
+    def __init__(self, api, client_id, client_secret, window=None,
+                 max_calls=MAX_CALLS, access_token=None):
+        self._api = api
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.window = window
+        self.max_calls = max_calls
+        self.access_token = access_token
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._queue = []
+        self._timer = None
+        self._reference_ids = itertools.count()
+
+    def __enter__(self):
+        self._api._push_auto_batch(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._api._pop_auto_batch(self)
+        self.flush()
+
+    def submit(self, call):
+        """Queues a ``call`` dictionary, as it is produced with
+        ``batch_mode=True``.
+
+        :rtype: BatchFuture
+
+        """
+        call = dict(call)
+        access_token = self.access_token or self._api.access_token
+        if 'authorization' not in call and access_token is not None:
+            call['authorization'] = access_token
+        future = BatchFuture(self)
+        with self._lock:
+            if call.get('reference_id') is None:
+                call['reference_id'] = 'auto_%s' % next(self._reference_ids)
+            self._queue.append((call, future))
+            full = len(self._queue) >= self.max_calls
+            if not full and self.window is not None and self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+        return future
+
+    def resolved(self, fn, *args, **kwargs):
+        """Performs a call right away and returns its outcome as a resolved
+        future.
+
+        """
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+    def flush(self):
+        """Sends all queued calls."""
+        with self._flush_lock:
+            with self._lock:
+                queue, self._queue = self._queue, []
+                timer, self._timer = self._timer, None
+            if timer is not None:
+                timer.cancel()
+            for i in range(0, len(queue), self.max_calls):
+                self._send(queue[i:i + self.max_calls])
+
+    def _send(self, queue):
+        queue = [(call, future) for call, future in queue
+                 if future.set_running_or_notify_cancel()]
+        if not queue:
+            return
+        try:
+            response = self._api.batch.create(
+                self.client_id, self.client_secret, [call for call, _ in queue],
+                access_token=self.access_token)
+        except Exception as exc:
+            for _, future in queue:
+                future.set_exception(exc)
+            return
+        resolve(queue, response)
+
+
+def resolve(queue, response):
+    """Sets results of ``(call, future)`` pairs in a ``queue`` from a
+    `/batch/create` ``response``.
+
+    """
+    responses = {}
+    for sub in response.get('calls', []):
+        responses[sub.get('reference_id')] = sub.get('response')
+    for call, future in queue:
+        try:
+            result = responses[call['reference_id']]
+        except KeyError:
+            future.set_exception(WePayServerError(
+                None, 500, error='processing_error',
+                error_description="Call is missing from /batch/create response."))
+            continue
+        if isinstance(result, dict) and 'error_code' in result:
+            error = dict((key, result.get(key)) for key in
+                         ('error', 'error_code', 'error_description'))
+            if result.get('error') == 'processing_error':
+                future.set_exception(WePayServerError(None, 500, **error))
+            else:
+                future.set_exception(WePayClientError(None, 400, **error))
+        else:
+            future.set_result(result)
+
+
+BatchChunk = collections.namedtuple(
+    'BatchChunk', ['index', 'size', 'started', 'elapsed'])
+"""Timing of a single `/batch/create` request sent by :class:`BatchExecutor`:
+position of the chunk, number of calls in it, time it was sent at (as returned
+by :func:`time.time`) and number of seconds it took.
+
+"""
+
+
+class BatchResult(dict):
+    """Response of :class:`BatchExecutor`, which looks exactly like a response
+    from a single `/batch/create`, i.e. ``{'calls': [...]}`` with sub-calls in
+    the original order, which also keeps timings of every chunk.
+
+    """
+
+    def __init__(self, calls, chunks):
+        super(BatchResult, self).__init__(calls=calls)
+        self.chunks = chunks
+        """List of :class:`BatchChunk` timings, one per chunk."""
+        self.references = dict((call.get('reference_id'), call) for call in calls)
+        """Sub-calls keyed by their `reference_id`."""
+
+    def response(self, reference_id):
+        """Returns `response` of a sub-call with ``reference_id``."""
+        return self.references[reference_id].get('response')
+
+
+class BatchExecutor(object):
+    """Sends a list of calls of any size, by splitting it into chunks of at most
+    ``chunk_size`` calls and sending them as `/batch/create` requests
+    concurrently, with at most ``max_workers`` of requests in flight:
+
+        >>> calls = [api.checkout(checkout_id, batch_mode=True) for checkout_id in ids]
+        >>> result = BatchExecutor(api, CLIENT_ID, CLIENT_SECRET)(calls)
+        >>> result['calls'][0]['response']
+        {'checkout_id': ...}
+
+    Calls without a `reference_id` are assigned a unique one, so that every
+    sub-call in the result can be found in :attr:`BatchResult.references`. If
+    any of the chunks fails, its exception is raised.
+
+    :param api: :class:`WePay<wepay.api.WePay>` instance.
+    :param client_id: application's client id.
+    :param client_secret: application's client secret.
+    :keyword int chunk_size: maximum number of calls in a chunk.
+    :keyword int max_workers: maximum number of chunks sent concurrently.
+    :keyword str access_token: used instead of ``api.access_token``.
+    :keyword float timeout: timeout for each of the `/batch/create` requests.
+
+    """
+
+    def __init__(self, api, client_id, client_secret, chunk_size=MAX_CALLS,
+                 max_workers=4, access_token=None, timeout=None):
+        assert 0 < chunk_size <= MAX_CALLS, \
+            "'chunk_size' should be between 1 and %s." % MAX_CALLS
+        self._api = api
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.access_token = access_token
+        self.timeout = timeout
+
+    def __call__(self, calls):
+        calls = [dict(call) for call in calls]
+        taken = set(call.get('reference_id') for call in calls)
+        counter = itertools.count()
+        for call in calls:
+            if call.get('reference_id') is None:
+                reference_id = 'chunk_%s' % next(counter)
+                while reference_id in taken:
+                    reference_id = 'chunk_%s' % next(counter)
+                call['reference_id'] = reference_id
+        chunks = [calls[i:i + self.chunk_size]
+                  for i in range(0, len(calls), self.chunk_size)]
+        if len(chunks) <= 1 or self.max_workers <= 1:
+            results = [self._send(i, chunk) for i, chunk in enumerate(chunks)]
+        else:
+            with ThreadPoolExecutor(
+                    max_workers=min(self.max_workers, len(chunks))) as executor:
+                futures = [executor.submit(self._send, i, chunk)
+                           for i, chunk in enumerate(chunks)]
+                try:
+                    results = [future.result() for future in futures]
+                except Exception:
+                    for future in futures:
+                        future.cancel()
+                    raise
+        merged = []
+        for chunk, (responses, _) in zip(chunks, results):
+            by_reference = dict(
+                (sub.get('reference_id'), sub) for sub in responses)
+            for i, call in enumerate(chunk):
+                sub = by_reference.get(call['reference_id'])
+                if sub is None and i < len(responses):
+                    sub = responses[i]
+                merged.append(sub)
+        return BatchResult(merged, [timing for _, timing in results])
+
+    def _send(self, index, chunk):
+        kwargs = {'access_token': self.access_token}
+        if self.timeout is not None:
+            kwargs['timeout'] = self.timeout
+        started = time.time()
+        response = self._api.batch.create(
+            self.client_id, self.client_secret, chunk, **kwargs)
+        elapsed = time.time() - started
+        return (response.get('calls', []),
+                BatchChunk(index, len(chunk), started, elapsed))
@@ -0,0 +1,67 @@
+"""Bulk calls fanned out over a bounded pool of threads, see
+:meth:`WePay.map<wepay.api.WePay.map>`.
+
+.. moduleauthor:: lehins <lehins@yandex.ru>
+   :platform: independent
+"""
+import collections
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+__all__ = ['MapResult', 'imap']
+
+
+MapResult = collections.namedtuple(
+    'MapResult', ['index', 'args', 'response', 'error'])
+"""Outcome of a single call made by :func:`imap`: its position in the input,
+the arguments it was made with, the response, or `None` if it failed with an
+``error``, which is `None` otherwise.
+
+"""
+
+
+def _call(fn, index, args):
+    try:
+        return MapResult(index, args, fn(*args), None)
+    except Exception as exc:
+        return MapResult(index, args, None, exc)
+
+
+def imap(fn, iterable, max_workers=10, ordered=True):
+    """Calls ``fn(*args)`` for every ``args`` in ``iterable`` in a pool of
+    ``max_workers`` threads and yields a :class:`MapResult` for each of
+    them. Elements, that are not tuples, are passed as a single argument.
+
+    The ``iterable`` is consumed lazily, with at most twice as many calls
+    queued as there are threads, so it can be arbitrarily long. Exceptions
+    are captured in results instead of aborting the run. Calls, which have not
+    been started yet, are cancelled once the generator is closed.
+
+    :keyword bool ordered: yield results in order of ``iterable``, otherwise
+       as soon as they complete.
+
+    """
+    iterator = enumerate(iterable)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    pending = collections.deque()
+    limit = 2 * max_workers
+    try:
+        while True:
+            for index, args in iterator:
+                if not isinstance(args, tuple):
+                    args = (args,)
+                pending.append(executor.submit(_call, fn, index, args))
+                if len(pending) >= limit:
+                    break
+            if not pending:
+                return
+            if ordered:
+                yield pending.popleft().result()
+                continue
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
@@ -0,0 +1,206 @@
+"""Read-through cache for lookup calls.
+
+.. moduleauthor:: lehins <lehins@yandex.ru>
+   :platform: independent
+"""
+import collections, copy, json, threading, time
+
+from wepay.utils import is_read_only
+
+__all__ = ['LookupCache']
+
+
+class LookupCache(object):
+    """Bounded LRU cache with per endpoint TTLs for responses of lookup
+    calls. Pass an instance to :class:`WePay<wepay.api.WePay>` in order to turn
+    it on:
+
+        >>> api = WePay(access_token=WEPAY_ACCESS_TOKEN, cache=LookupCache(ttls={'/checkout': 5}))
+        >>> api.checkout(12345) # goes to WePay
+        >>> api.checkout(12345) # served from cache for the next 5 seconds
+
+    Only endpoints listed in ``ttls`` are cached. Entries are keyed by
+    endpoint, parameters, access token and API version, and every value is
+    copied on its way in and out, so responses can be safely modified by the
+    caller.
+
+    Any other call, that refers to a cached object by its ID parameter, for
+    instance `/checkout/refund` with `checkout_id`, is considered mutating and
+    evicts all cached lookups of that object (see :meth:`invalidate`). Whenever
+    such call returns the whole updated object, which is the case for
+    endpoints in ``refresh``, the cache is refreshed with it instead. A lookup,
+    which was in flight while its object was invalidated, is not cached, since
+    its response could predate the change (see :meth:`generation`).
+
+    :keyword int maxsize: maximum number of cached responses, least recently
+       used ones are evicted first.
+    :keyword dict ttls: mapping from an endpoint uri to a number of seconds its
+       responses stay valid for. Defaults to :attr:`DEFAULT_TTLS`.
+    :keyword refresh: endpoints that respond with an updated object. Defaults
+       to :attr:`DEFAULT_REFRESH`.
+
+    """
+
+    DEFAULT_TTLS = {
+        '/account': 60,
+        '/checkout': 10,
+        '/preapproval': 30,
+        '/subscription': 30,
+        '/subscription_plan': 60,
+    }
+
+    DEFAULT_REFRESH = frozenset([
+        '/account/modify', '/checkout/modify', '/subscription/modify',
+        '/subscription_plan/modify'
+    ])
+
+    def __init__(self, maxsize=1024, ttls=None, refresh=None):
+        self.maxsize = maxsize
+        self.ttls = dict(self.DEFAULT_TTLS if ttls is None else ttls)
+        self.refresh = frozenset(self.DEFAULT_REFRESH if refresh is None else refresh)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._objects = {}
+        # generation of the last invalidation of every recently changed object
+        self._generation = 0
+        self._changed = collections.OrderedDict()
+        self._forgotten = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, uri, params, access_token=None, api_version=None):
+        """Creates a key for a call or returns `None` if ``uri`` is not
+        cached.
+
+        """
+        if uri not in self.ttls:
+            return None
+        object_id = params.get('%s_id' % uri[1:])
+        if object_id is not None:
+            # IDs can be passed as numbers as well as strings
+            object_id = str(object_id)
+        return (uri, json.dumps(params, sort_keys=True, default=str),
+                access_token, api_version, object_id)
+
+    def get(self, key):
+        """Returns a tuple ``(found, response)``."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.time():
+                self._remove(key)
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.pop(key)
+            self._entries[key] = entry
+            self.hits += 1
+        return True, copy.deepcopy(entry[1])
+
+    def generation(self):
+        """Returns current generation of the cache, which should be taken
+        before a lookup is made and passed to :meth:`set` together with its
+        response.
+
+        """
+        return self._generation
+
+    def set(self, key, response, generation=None):
+        """Stores a ``response`` for a ``key`` created by :meth:`key`, unless
+        the object was invalidated after the ``generation`` of the lookup.
+
+        """
+        entry = (time.time() + self.ttls[key[0]], copy.deepcopy(response))
+        with self._lock:
+            if generation is not None and key[4] is not None:
+                changed = self._changed.get(key[:1] + key[4:], self._forgotten)
+                if changed > generation:
+                    return
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            if key[4] is not None:
+                self._objects.setdefault(key[:1] + key[4:], set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, uri, params, response=None, access_token=None,
+                   api_version=None):
+        """Evicts all cached lookups of an object, that is affected by a call
+        to ``uri`` with ``params``, and refreshes the cache from ``response``
+        if it carries the updated object. Read-only calls are ignored.
+
+        :return: number of evicted entries.
+
+        """
+        if is_read_only(uri):
+            return 0
+        parts = uri.strip('/').split('/')
+        lookup = '/%s' % parts[0]
+        if lookup not in self.ttls:
+            return 0
+        id_param = '%s_id' % parts[0]
+        object_id = params.get(id_param)
+        if object_id is None:
+            return 0
+        object_id = str(object_id)
+        with self._lock:
+            self._generation += 1
+            self._changed.pop((lookup, object_id), None)
+            self._changed[(lookup, object_id)] = self._generation
+            while len(self._changed) > self.maxsize:
+                self._forgotten = self._changed.popitem(last=False)[1]
+            keys = list(self._objects.get((lookup, object_id), ()))
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+        if (uri in self.refresh and isinstance(response, dict) and
+            str(response.get(id_param)) == object_id):
+            self.set(self.key(lookup, {id_param: response[id_param]},
+                              access_token, api_version), response)
+        return len(keys)
+
+    def invalidate_batch(self, params, response, access_token=None,
+                         api_version=None):
+        """Invalidates the cache with all of the calls made through a
+        `/batch/create` call with ``params`` and its ``response``.
+
+        """
+        responses = dict((sub.get('reference_id'), sub.get('response'))
+                         for sub in (response or {}).get('calls', []))
+        for call in params.get('calls', []):
+            self.invalidate(call.get('call'), call.get('parameters', {}),
+                            responses.get(call.get('reference_id')),
+                            call.get('authorization', access_token), api_version)
+
+    def clear(self):
+        """Removes all entries."""
+        with self._lock:
+            self._entries.clear()
+            self._objects.clear()
+
+    def _remove(self, key):
+        del self._entries[key]
+        if key[4] is not None:
+            keys = self._objects.get(key[:1] + key[4:])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._objects[key[:1] + key[4:]]
+
+    def stats(self):
+        """Returns a dictionary with ``hits``, ``misses``, ``evictions``,
+        ``invalidations`` counters and current ``size`` of the cache.
+
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions,
+                    'invalidations': self.invalidations,
+                    'size': len(self._entries)}
@@ -1,15 +1,8 @@
-from wepay.calls.oauth2 import OAuth2
-from wepay.calls.app import App
-from wepay.calls.user import User
-from wepay.calls.account import Account, Membership
-from wepay.calls.checkout import Checkout
-from wepay.calls.preapproval import Preapproval
-from wepay.calls.withdrawal import Withdrawal
-from wepay.calls.credit_card import CreditCard
-from wepay.calls.subscription_plan import SubscriptionPlan
-from wepay.calls.subscription import Subscription
-from wepay.calls.subscription_charge import SubscriptionCharge
-from wepay.calls.batch import Batch
+"""Call classes, one module per WePay object. Modules are imported on first
+access to a class, so that only the calls, that are actually used, are loaded.
+
+"""
+import importlib, sys
 
 __all__ = [
     'OAuth2', 'App', 'User', 'Account', 'Membership', 'Checkout', 'Preapproval',
@@ -17,4 +10,31 @@ __all__ = [
     'SubscriptionCharge', 'Batch'
 ]
 
+MODULES = {
+    'OAuth2': 'oauth2', 'App': 'app', 'User': 'user', 'Account': 'account',
+    'Membership': 'account', 'Checkout': 'checkout',
+    'Preapproval': 'preapproval', 'Withdrawal': 'withdrawal',
+    'CreditCard': 'credit_card', 'SubscriptionPlan': 'subscription_plan',
+    'Subscription': 'subscription', 'SubscriptionCharge': 'subscription_charge',
+    'Batch': 'batch'
+}
+"""Names of modules, which define call classes."""
+
+
+def __getattr__(name):
+    module = MODULES.get(name)
+    if module is None:
+        raise AttributeError(
+            "module %r has no attribute %r" % (__name__, name))
+    value = getattr(importlib.import_module('%s.%s' % (__name__, module)), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()).union(__all__))
+
 
+if sys.version_info < (3, 7): # no module level __getattr__
+    for _name in __all__:
+        __getattr__(_name)
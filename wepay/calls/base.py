@@ -1,6 +1,108 @@
-import warnings
+import collections, importlib, warnings
+import six
+from wepay.calls import MODULES
 from wepay.exceptions import WePayWarning
+from wepay.paging import iter_pages
+from wepay.utils import is_read_only
 
+__all__ = ['Call', 'CallSpec', 'SPECS', 'get_spec']
+
+DEFAULT_CONTROL_KEYWORDS = ('access_token', 'batch_mode')
+
+SPECS = {}
+"""Registry of all :class:`CallSpec` objects keyed by uri."""
+
+_MODULES = frozenset(MODULES.values())
+_IMPORTED = set()
+
+
+class CallSpec(collections.namedtuple('CallSpec', [
+        'uri', 'allowed_params', 'param_names', 'control_keywords', 'floating',
+        'batchable', 'read_only'])):
+    """Everything :meth:`Call.make_call` needs to know about a call, resolved
+    once, when a :class:`Call` subclass is defined:
+
+    * ``uri`` - API uri, for instance `/checkout/find`.
+    * ``allowed_params`` - `frozenset` of accepted parameters.
+    * ``param_names`` - same parameters in their documented order.
+    * ``control_keywords`` - keywords, which control the call rather than being
+      sent as parameters, including ``api_version`` and ``timeout``.
+    * ``floating`` - parameters that are converted to `float`.
+    * ``batchable`` - whether the call can be made with ``batch_mode``.
+    * ``read_only`` - whether the call does not modify any objects.
+
+    """
+    __slots__ = ()
+
+    @classmethod
+    def compile(cls, uri, func, floating=()):
+        """Creates a spec for a call to ``uri`` made by ``func``, which has to
+        have ``allowed_params`` and optionally ``control_keywords`` attributes.
+
+        """
+        control_keywords = getattr(func, 'control_keywords', None)
+        if control_keywords is None:
+            control_keywords = DEFAULT_CONTROL_KEYWORDS
+        allowed_params = frozenset(func.allowed_params)
+        return cls(uri, allowed_params, tuple(func.allowed_params),
+                   tuple(control_keywords) + ('api_version', 'timeout'),
+                   tuple(name for name in floating if name in allowed_params),
+                   'batch_mode' in control_keywords, is_read_only(uri))
+
+
+def get_spec(uri):
+    """Returns a :class:`CallSpec` for ``uri`` or `None` if it is unknown.
+    Module with calls for ``uri`` is imported if it was not yet.
+
+    """
+    spec = SPECS.get(uri)
+    if spec is None:
+        name = uri.split('/')[1] if uri.startswith('/') else None
+        if name in _MODULES and name not in _IMPORTED:
+            _IMPORTED.add(name)
+            try:
+                importlib.import_module('wepay.calls.%s' % name)
+            except ImportError:
+                return None
+            spec = SPECS.get(uri)
+    return spec
+
+
+class CallMeta(type):
+    """Compiles a :class:`CallSpec` for every call method of a class, i.e.
+    for every function with ``allowed_params``, and stores it in the function's
+    ``spec`` attribute. Spec for the lookup call, which is the class itself, is
+    stored in the ``spec`` class attribute.
+
+    """
+
+    def __init__(cls, name, bases, namespace):
+        super(CallMeta, cls).__init__(name, bases, namespace)
+        call_name = namespace.get('call_name', getattr(cls, 'call_name', None))
+        if not isinstance(call_name, six.string_types):
+            return
+        floating = getattr(cls, 'floating', ())
+        for value in namespace.values():
+            if (callable(value) and hasattr(value, 'allowed_params') and
+                getattr(value, 'spec', None) is None):
+                value.spec = _register(CallSpec.compile(
+                    '/%s/%s' % (call_name, value.__name__[2:]), value, floating))
+        if hasattr(cls, 'allowed_params'):
+            cls.spec = _register(
+                CallSpec.compile('/%s' % call_name, cls, floating))
+
+
+def _register(spec):
+    # a module imported once more under another name, e.g. by test discovery,
+    # shares specs with the first import, while a changed call replaces them
+    registered = SPECS.get(spec.uri)
+    if registered == spec:
+        return registered
+    SPECS[spec.uri] = spec
+    return spec
+
+
+@six.add_metaclass(CallMeta)
 class Call(object):
     """ Base class for all API calls """
 
@@ -14,22 +116,21 @@ class Call(object):
     def __init__(self, api):
         self._api = api
 
-    def _update_params(self, params, extra_kwargs, control_keywords):
-        if control_keywords is None:
-            control_keywords = ['access_token', 'batch_mode']
+    def _update_params(self, params, extra_kwargs, spec, batching=False):
         control_kwargs = {}
-        for key in control_keywords + ['api_version', 'timeout']:
+        for key in spec.control_keywords:
             if key in extra_kwargs:
                 control_kwargs[key] = extra_kwargs.pop(key)
-        if control_kwargs.get('batch_mode', False):
+        batch_mode = control_kwargs.get('batch_mode', False)
+        if batching or batch_mode:
             control_kwargs['reference_id'] = extra_kwargs.pop(
                 'batch_reference_id', None)
-        for batch_conflict in ['api_version', 'timeout']:
-            assert not (
-                control_kwargs.get(batch_conflict, None) is not None and 
-                control_kwargs.get('batch_mode', False)), \
-                "Cannot use '%s' and 'batch_mode' in the same call." % batch_conflict
-        params.update(extra_kwargs)
+        if batch_mode:
+            for batch_conflict in ['api_version', 'timeout']:
+                assert control_kwargs.get(batch_conflict, None) is None, \
+                    "Cannot use '%s' and 'batch_mode' in the same call." % batch_conflict
+        if extra_kwargs:
+            params.update(extra_kwargs)
         return control_kwargs
 
     def make_call(self, func, params, extra_kwargs):
@@ -42,7 +143,9 @@ class Call(object):
         call it will construct a dictionary that is ready to be used in
         :func:`WePay.batch.create` later on, while ``refernce_id`` can also be
         added to it later, as specified by WePay Documentation, see
-        :meth:`batch.create<wepay.calls.batch.Batch.create>`
+        :meth:`batch.create<wepay.calls.batch.Batch.create>`. Within
+        :meth:`WePay.batching<wepay.api.WePay.batching>` context a call is
+        queued for an automatic `/batch/create` and a future is returned.
 
         :param func callable: function making the call
         :param dict params: parameters to include in the call
@@ -54,39 +157,69 @@ class Call(object):
         :raises: :exception:`wepay.exceptions.WePayError`
 
         """
-        if hasattr(func, '__name__'):
-            uri = '/%s/%s' % (self.call_name, func.__name__[2:])
-        else:
-            uri = '/%s' % self.call_name
+        spec = getattr(func, 'spec', None)
+        if spec is None: # call method was attached after class creation
+            if hasattr(func, '__name__'):
+                uri = '/%s/%s' % (self.call_name, func.__name__[2:])
+            else:
+                uri = '/%s' % self.call_name
+            spec = CallSpec.compile(uri, func, self.floating)
+        uri = spec.uri
+        api = self._api
+        auto_batch = api.auto_batch if self.call_name != 'batch' else None
         control_kwargs = self._update_params(
-            params, extra_kwargs, getattr(func, 'control_keywords', None))
-        if not self._api.silent:
-            unrecognized_params = set(params) - set(func.allowed_params)
-            if unrecognized_params:
-                err_msg = (
-                    "At least one of the parameters to the api call: '%s' is "
-                    "unrecognized. Allowed parameters are: '%s'. Unrecognized "
-                    "parameters are: '%s'." % (uri, ', '.join(func.allowed_params), 
-                                               ', '.join(unrecognized_params)))
-                if self._api.production and self._api.silent is None:
-                    warnings.warn(err_msg, WePayWarning)
-                else:
-                    raise WePayWarning(err_msg)
+            params, extra_kwargs, spec, auto_batch is not None)
+        if not api.silent and not spec.allowed_params.issuperset(params):
+            unrecognized_params = set(params) - spec.allowed_params
+            err_msg = (
+                "At least one of the parameters to the api call: '%s' is "
+                "unrecognized. Allowed parameters are: '%s'. Unrecognized "
+                "parameters are: '%s'." % (uri, ', '.join(spec.param_names),
+                                           ', '.join(unrecognized_params)))
+            if api.production and api.silent is None:
+                warnings.warn(err_msg, WePayWarning)
+            else:
+                raise WePayWarning(err_msg)
         
         # in case if param is Decimal
-        for name in self.floating:
+        for name in spec.floating:
             if name in params:
                 params[name] = float(params[name])
         if control_kwargs.pop('batch_mode', False):
-            call = {
-                'call': uri
-            }
-            access_token = control_kwargs.get('access_token', None)
-            if access_token is not None:
-                call['authorization'] = access_token
-            if params:
-                call['parameters'] = params
-            if control_kwargs.get('reference_id', None) is not None:
-                call['reference_id'] = control_kwargs['reference_id']
-            return call
-        return self._api.call(uri, params=params, **control_kwargs)
+            return self._batch_call(uri, params, control_kwargs)
+        if auto_batch is not None:
+            if not (spec.batchable and
+                    control_kwargs.get('api_version') is None and
+                    control_kwargs.get('timeout') is None):
+                control_kwargs.pop('reference_id', None)
+                return auto_batch.resolved(
+                    self._api.call, uri, params=params, **control_kwargs)
+            return auto_batch.submit(self._batch_call(uri, params, control_kwargs))
+        return api.call(uri, params=params, **control_kwargs)
+
+    def _require_blocking(self, alternative):
+        # helpers, which need responses right away, would only get coroutines
+        # from AsyncWePay
+        if self._api._awaitable:
+            raise TypeError("Use %s together with %s" % (
+                alternative, type(self._api).__name__))
+
+    def _iter_find(self, find, args, kwargs, page_size=None, prefetch=False):
+        self._require_blocking("find() with 'start' and 'limit' parameters")
+        return (obj for page in iter_pages(find, args, kwargs,
+                                           page_size=page_size,
+                                           prefetch=prefetch)
+                for obj in page)
+
+    def _batch_call(self, uri, params, control_kwargs):
+        call = {
+            'call': uri
+        }
+        access_token = control_kwargs.get('access_token', None)
+        if access_token is not None:
+            call['authorization'] = access_token
+        if params:
+            call['parameters'] = params
+        if control_kwargs.get('reference_id', None) is not None:
+            call['reference_id'] = control_kwargs['reference_id']
+        return call
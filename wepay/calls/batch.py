@@ -1,3 +1,4 @@
+from wepay.batching import MAX_CALLS, BatchExecutor
 from wepay.calls.base import Call
 
 class Batch(Call):
@@ -22,4 +23,25 @@ class Batch(Call):
         return self.make_call(self.__create, params, kwargs)
     __create.allowed_params = ['client_id', 'client_secret', 'calls']
     __create.control_kwargs = ['access_token']
-    create = __create
\ No newline at end of file
+    create = __create
+
+    def execute(self, client_id, client_secret, calls, chunk_size=MAX_CALLS,
+                max_workers=4, **kwargs):
+        """Same as :meth:`create`, except that ``calls`` can be of any size. They
+        will be split into chunks of ``chunk_size`` and sent as separate
+        `/batch/create` calls concurrently, with at most ``max_workers`` in
+        flight at a time. See :class:`BatchExecutor<wepay.batching.BatchExecutor>`
+
+        :keyword str access_token: will be used instead of instance's
+            ``access_token``
+
+        :keyword float timeout: timeout for each of the `/batch/create` calls.
+
+        :rtype: :class:`BatchResult<wepay.batching.BatchResult>`
+
+        """
+        self._require_blocking("asyncio.gather() of batch.create() calls")
+        executor = BatchExecutor(
+            self._api, client_id, client_secret, chunk_size=chunk_size,
+            max_workers=max_workers, **kwargs)
+        return executor(calls)
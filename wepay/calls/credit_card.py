@@ -116,6 +116,22 @@ class CreditCard(Call):
     __find.control_keywords = ['batch_mode']
     find = __find
 
+    def iter_find(self, client_id, client_secret,
+                  page_size=None, prefetch=False, **kwargs):
+        """Iterates over all credit cards matching :meth:`find` criteria, one at
+        a time, while fetching them lazily page by page. Accepts the same
+        arguments as :meth:`find`, plus:
+
+        :keyword int page_size: number of objects fetched per call, defaults to
+           ``limit`` or 50.
+
+        :keyword bool prefetch: fetch next page in the background, while
+           current one is being iterated over.
+
+        """
+        return self._iter_find(self.find, (client_id, client_secret),
+                               kwargs, page_size, prefetch)
+
     def __delete(self, client_id, client_secret, credit_card_id, **kwargs):
         """Call documentation: `/credit_card/delete
         <https://www.wepay.com/developer/reference/credit_card#delete>`_, plus
@@ -58,6 +58,20 @@ class Preapproval(Call):
     ]
     find = __find
 
+    def iter_find(self, page_size=None, prefetch=False, **kwargs):
+        """Iterates over all preapprovals matching :meth:`find` criteria, one at
+        a time, while fetching them lazily page by page. Accepts the same
+        arguments as :meth:`find`, plus:
+
+        :keyword int page_size: number of objects fetched per call, defaults to
+           ``limit`` or 50.
+
+        :keyword bool prefetch: fetch next page in the background, while
+           current one is being iterated over.
+
+        """
+        return self._iter_find(self.find, (), kwargs, page_size, prefetch)
+
     def __create(self, short_description, period, **kwargs):
         """Call documentation: `/preapproval/create
         <https://www.wepay.com/developer/reference/preapproval#create>`_, plus
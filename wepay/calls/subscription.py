@@ -1,4 +1,5 @@
 from wepay.calls.base import Call
+from wepay.paging import scan_windows
 
 class Subscription(Call):
     """The /subscription API calls"""
@@ -58,6 +59,42 @@ class Subscription(Call):
         'state', 'reference_id'
     ]
     find = __find
+
+    def iter_find(self, subscription_plan_id,
+                  page_size=None, prefetch=False, **kwargs):
+        """Iterates over all subscriptions matching :meth:`find` criteria, one
+        at a time, while fetching them lazily page by page. Accepts the same
+        arguments as :meth:`find`, plus:
+
+        :keyword int page_size: number of objects fetched per call, defaults to
+           ``limit`` or 50.
+
+        :keyword bool prefetch: fetch next page in the background, while
+           current one is being iterated over.
+
+        """
+        return self._iter_find(self.find, (subscription_plan_id,),
+                               kwargs, page_size, prefetch)
+
+    def scan(self, subscription_plan_id, start_time, end_time, shards=8,
+             max_workers=4, **kwargs):
+        """Concurrently scans all subscriptions created between ``start_time``
+        and ``end_time`` (unix timestamps), that match :meth:`find` criteria, by
+        splitting the range into time windows. Subscriptions are yielded as they
+        arrive, in no particular order and without duplicates. Accepts the same
+        keyword arguments as :meth:`find`, plus:
+
+        :keyword int shards: number of time windows to start with. Windows
+           with more than a page of results are split further automatically.
+
+        :keyword int max_workers: maximum number of calls made concurrently.
+
+        """
+        self._require_blocking(
+            "find() with 'start_time' and 'end_time' parameters")
+        return scan_windows(
+            self.find, (subscription_plan_id,), kwargs, start_time, end_time,
+            'subscription_id', shards=shards, max_workers=max_workers)
         
     def __create(self, subscription_plan_id, **kwargs):
         """Call documentation: `/subscription/create
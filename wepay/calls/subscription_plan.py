@@ -53,6 +53,20 @@ class SubscriptionPlan(Call):
     __find.allowed_params = ['account_id', 'start', 'limit', 'state', 'reference_id']
     find = __find
 
+    def iter_find(self, page_size=None, prefetch=False, **kwargs):
+        """Iterates over all subscription plans matching :meth:`find` criteria,
+        one at a time, while fetching them lazily page by page. Accepts the same
+        arguments as :meth:`find`, plus:
+
+        :keyword int page_size: number of objects fetched per call, defaults to
+           ``limit`` or 50.
+
+        :keyword bool prefetch: fetch next page in the background, while
+           current one is being iterated over.
+
+        """
+        return self._iter_find(self.find, (), kwargs, page_size, prefetch)
+
 
     def __create(self, account_id, name, short_description, amount, period,
                  **kwargs):
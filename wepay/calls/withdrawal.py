@@ -56,6 +56,21 @@ class Withdrawal(Call):
     __find.allowed_params = ['account_id', 'limit', 'start', 'sort_order', 'state']
     find = __find
 
+    def iter_find(self, account_id, page_size=None, prefetch=False, **kwargs):
+        """Iterates over all withdrawals matching :meth:`find` criteria, one at
+        a time, while fetching them lazily page by page. Accepts the same
+        arguments as :meth:`find`, plus:
+
+        :keyword int page_size: number of objects fetched per call, defaults to
+           ``limit`` or 50.
+
+        :keyword bool prefetch: fetch next page in the background, while
+           current one is being iterated over.
+
+        """
+        return self._iter_find(self.find, (account_id,),
+                               kwargs, page_size, prefetch)
+
     def __modify(self, withdrawal_id, **kwargs):
         """Call documentation: `/withdrawal/modify
         <https://www.wepay.com/developer/reference/withdrawal#modify>`_, plus
@@ -0,0 +1,161 @@
+"""Circuit breaker, which stops calling WePay while it is failing.
+
+.. moduleauthor:: lehins <lehins@yandex.ru>
+   :platform: independent
+"""
+import collections, threading, time
+
+from wepay.exceptions import WePayServerError, WePayConnectionError, \
+    WePayRateLimitError, WePayCircuitOpenError
+
+__all__ = ['CircuitBreaker', 'CLOSED', 'OPEN', 'HALF_OPEN']
+
+CLOSED = 'closed'
+"""Calls go through as usual."""
+
+OPEN = 'open'
+"""Calls fail right away."""
+
+HALF_OPEN = 'half_open'
+"""Limited number of probe calls go through in order to check if WePay has
+recovered."""
+
+
+class _Circuit(object):
+
+    def __init__(self):
+        self.state = CLOSED
+        self.outcomes = collections.deque()
+        self.failures = 0
+        self.opened = None
+        self.probes = 0
+
+
+class CircuitBreaker(object):
+    """Keeps track of failures of calls per endpoint group, i.e. `/checkout`,
+    `/account` and so on, and fails calls to a group right away with
+    :exc:`WePayCircuitOpenError<wepay.exceptions.WePayCircuitOpenError>` once
+    too many of them failed recently, instead of waiting for a timeout. Pass an
+    instance to :class:`WePay<wepay.api.WePay>` in order to turn it on:
+
+        >>> api = WePay(access_token=WEPAY_ACCESS_TOKEN, breaker=CircuitBreaker(failure_rate=0.5, reset_timeout=10))
+
+    Circuit of a group is opened once at least ``min_calls`` calls were made to
+    it within last ``window`` seconds and ``failure_rate`` of them failed with
+    :exc:`WePayServerError<wepay.exceptions.WePayServerError>` or
+    :exc:`WePayConnectionError<wepay.exceptions.WePayConnectionError>`. After
+    ``reset_timeout`` seconds the circuit becomes half-open and lets through up
+    to ``probes`` calls, first successful of which closes the circuit, while a
+    failed one opens it again.
+
+    Every attempt of a retried call is counted separately, and calls rejected
+    by an open circuit are never retried.
+
+    :keyword float failure_rate: fraction of failed calls, which opens the
+       circuit.
+    :keyword int min_calls: minimum number of calls within the ``window``
+       required to open the circuit.
+    :keyword float window: time in seconds over which failures are counted.
+    :keyword float reset_timeout: time in seconds the circuit stays open for.
+    :keyword int probes: number of concurrent calls allowed in half-open state.
+    :keyword callback: a function called with ``(group, old_state, new_state)``
+       whenever a circuit changes its state.
+
+    """
+
+    def __init__(self, failure_rate=0.5, min_calls=10, window=30,
+                 reset_timeout=30, probes=1, callback=None):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.probes = probes
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._circuits = {}
+
+    def group(self, uri):
+        """Returns a name of the endpoint group ``uri`` belongs to."""
+        return '/' + uri.strip('/').split('/')[0]
+
+    def state(self, uri):
+        """Returns current state of the circuit for ``uri``'s group."""
+        with self._lock:
+            circuit = self._circuits.get(self.group(uri))
+            if circuit is None:
+                return CLOSED
+            if (circuit.state == OPEN and
+                time.time() - circuit.opened >= self.reset_timeout):
+                return HALF_OPEN
+            return circuit.state
+
+    def before(self, uri):
+        """Checks if a call to ``uri`` is allowed to go through. Has to be
+        followed by :meth:`record` with the outcome of the call.
+
+        :raises: :exc:`WePayCircuitOpenError<wepay.exceptions.WePayCircuitOpenError>`
+
+        """
+        group = self.group(uri)
+        with self._lock:
+            circuit = self._circuits.get(group)
+            if circuit is None or circuit.state == CLOSED:
+                return
+            now = time.time()
+            if circuit.state == OPEN:
+                retry_after = circuit.opened + self.reset_timeout - now
+                if retry_after > 0:
+                    raise WePayCircuitOpenError(group, retry_after)
+                self._change(group, circuit, HALF_OPEN)
+            if circuit.probes >= self.probes:
+                raise WePayCircuitOpenError(group, 0)
+            circuit.probes += 1
+
+    def record(self, uri, exc=None):
+        """Records an outcome of a call to ``uri``, where ``exc`` is an
+        exception it failed with or `None`.
+
+        """
+        if (isinstance(exc, (WePayRateLimitError, WePayCircuitOpenError)) or
+            not isinstance(exc, (Exception, type(None)))):
+            # call was never sent or was interrupted
+            failed = None
+        else:
+            failed = isinstance(exc, (WePayServerError, WePayConnectionError))
+        group = self.group(uri)
+        now = time.time()
+        with self._lock:
+            circuit = self._circuits.get(group)
+            if circuit is None:
+                circuit = self._circuits[group] = _Circuit()
+            if circuit.state == HALF_OPEN:
+                circuit.probes = max(0, circuit.probes - 1)
+                if failed:
+                    circuit.opened = now
+                    self._change(group, circuit, OPEN)
+                elif failed is not None:
+                    circuit.outcomes.clear()
+                    circuit.failures = 0
+                    self._change(group, circuit, CLOSED)
+                return
+            if failed is None or circuit.state == OPEN:
+                return
+            circuit.outcomes.append((now, failed))
+            circuit.failures += failed
+            while circuit.outcomes and circuit.outcomes[0][0] <= now - self.window:
+                circuit.failures -= circuit.outcomes.popleft()[1]
+            total = len(circuit.outcomes)
+            if (total >= self.min_calls and
+                circuit.failures >= self.failure_rate * total):
+                circuit.opened = now
+                self._change(group, circuit, OPEN)
+
+    def reset(self):
+        """Closes all circuits."""
+        with self._lock:
+            self._circuits.clear()
+
+    def _change(self, group, circuit, state):
+        old_state, circuit.state = circuit.state, state
+        if self.callback is not None:
+            self.callback(group, old_state, state)
@@ -0,0 +1,150 @@
+"""JSON codecs used for encoding requests to and decoding responses from WePay.
+
+Besides the standard :mod:`json` module, `orjson
+<https://github.com/ijl/orjson>`_, `ujson <https://github.com/ultrajson/ultrajson>`_
+and `simplejson <https://github.com/simplejson/simplejson>`_ are supported and
+picked up automatically, whenever one of them is installed, in that order of
+preference.
+
+.. moduleauthor:: lehins <lehins@yandex.ru>
+   :platform: independent
+"""
+import decimal, json
+import six
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+try:
+    import ujson
+    HAS_UJSON = True
+except ImportError:
+    HAS_UJSON = False
+try:
+    import simplejson
+    HAS_SIMPLEJSON = True
+except ImportError:
+    HAS_SIMPLEJSON = False
+
+__all__ = [
+    'JSONCodec', 'OrjsonCodec', 'UjsonCodec', 'SimplejsonCodec', 'CODECS',
+    'get_codec'
+]
+
+
+def _default(obj):
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    raise TypeError("%r is not JSON serializable" % obj)
+
+
+class JSONCodec(object):
+    """Codec built on top of the standard :mod:`json` module. All codecs encode
+    to and decode from UTF-8 encoded bytes.
+
+    :keyword bool use_decimal: decode all fractional numbers, which in WePay
+       responses are amounts, fees and balances, as :class:`decimal.Decimal`
+       instead of `float`, so they can be handled without rounding errors.
+       :class:`decimal.Decimal` params are always encoded as numbers.
+
+    """
+
+    name = 'json'
+    supports_decimal = True
+    available = True
+
+    def __init__(self, use_decimal=False):
+        if use_decimal and not self.supports_decimal:
+            raise ValueError(
+                "'%s' codec cannot decode decimals." % self.name)
+        self.use_decimal = use_decimal
+
+    def __repr__(self):
+        return "<%s use_decimal=%s>" % (self.__class__.__name__, self.use_decimal)
+
+    def dumps(self, obj):
+        """Encodes ``obj`` into JSON bytes."""
+        return json.dumps(obj, default=_default).encode('utf-8')
+
+    def loads(self, data):
+        """Decodes JSON ``data`` given as bytes."""
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        if self.use_decimal:
+            return json.loads(data, parse_float=decimal.Decimal)
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    """Codec built on top of `orjson`, the fastest one, which cannot decode
+    decimals though.
+
+    """
+
+    name = 'orjson'
+    supports_decimal = False
+    available = HAS_ORJSON
+
+    def dumps(self, obj):
+        return orjson.dumps(obj, default=_default)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+class UjsonCodec(JSONCodec):
+    """Codec built on top of `ujson`, which cannot decode decimals."""
+
+    name = 'ujson'
+    supports_decimal = False
+    available = HAS_UJSON
+
+    def dumps(self, obj):
+        return ujson.dumps(obj, default=_default).encode('utf-8')
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+
+class SimplejsonCodec(JSONCodec):
+    """Codec built on top of `simplejson`, which has native decimal support."""
+
+    name = 'simplejson'
+    available = HAS_SIMPLEJSON
+
+    def dumps(self, obj):
+        return simplejson.dumps(obj, use_decimal=True).encode('utf-8')
+
+    def loads(self, data):
+        return simplejson.loads(data, use_decimal=self.use_decimal)
+
+
+CODECS = [OrjsonCodec, UjsonCodec, SimplejsonCodec, JSONCodec]
+"""Supported codecs in order of preference."""
+
+
+def get_codec(codec=None, use_decimal=False):
+    """Returns an instance of a codec.
+
+    :keyword codec: a codec instance, which is returned as is, a name of a
+       codec (``'orjson'``, ``'ujson'``, ``'simplejson'`` or ``'json'``), or
+       `None` in order to pick the fastest available one, which supports
+       ``use_decimal`` if it is set.
+    :keyword bool use_decimal: see :class:`JSONCodec`.
+    :raises: :exc:`ValueError` if requested codec is unknown, not installed or
+       cannot decode decimals.
+
+    """
+    if codec is not None and not isinstance(codec, six.string_types):
+        return codec
+    for codec_class in CODECS:
+        if codec is None:
+            if (codec_class.available and
+                (codec_class.supports_decimal or not use_decimal)):
+                return codec_class(use_decimal=use_decimal)
+        elif codec_class.name == codec:
+            if not codec_class.available:
+                raise ValueError("'%s' codec is not installed." % codec)
+            return codec_class(use_decimal=use_decimal)
+    raise ValueError("Unknown codec: '%s'" % codec)
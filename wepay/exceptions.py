@@ -1,6 +1,7 @@
 __all__ = [
     'WePayWarning', 'WePayError', 'WePayHTTPError', 'WePayClientError',
-    'WePayServerError', 'WePayConnectionError'
+    'WePayServerError', 'WePayConnectionError', 'WePayRateLimitError',
+    'WePayCircuitOpenError'
 ]
 
 
@@ -13,6 +14,13 @@ class WePayError(Exception):
     Documentation <https://www.wepay.com/developer/reference/errors>`_
 
     """
+
+    attempts = 1
+    """Number of times the call was attempted, see :mod:`wepay.retry`."""
+
+    elapsed = None
+    """Time in seconds spent on all attempts, if the call was retried."""
+
     def __init__(self, error, error_code, error_description):
         self._error = error
         self._error_code = error_code
@@ -101,6 +109,12 @@ class WePayConnectionError(Exception):
 
     """
 
+    attempts = 1
+    """Number of times the call was attempted, see :mod:`wepay.retry`."""
+
+    elapsed = None
+    """Time in seconds spent on all attempts, if the call was retried."""
+
     def __init__(self, error):
         self._error = error
         super(WePayConnectionError, self).__init__()        
@@ -120,3 +134,51 @@ class WePayConnectionError(Exception):
 
         """
         return self._error
+
+
+class WePayRateLimitError(WePayConnectionError):
+    """Raised by :class:`RateLimiter<wepay.ratelimit.RateLimiter>` when a call
+    cannot be made without exceeding the configured rate. Call is never sent to
+    WePay in this case.
+
+    """
+
+    def __init__(self, delay):
+        self._delay = delay
+        super(WePayRateLimitError, self).__init__(None)
+
+    def __str__(self):
+        return "Rate limit exceeded, next call is allowed in %.3f seconds" % (
+            self.delay)
+
+    @property
+    def delay(self):
+        """Time in seconds until the call could be made."""
+        return self._delay
+
+
+class WePayCircuitOpenError(WePayConnectionError):
+    """Raised by :class:`CircuitBreaker<wepay.circuit.CircuitBreaker>` when
+    calls to an endpoint group are failing and the circuit is open. Call is
+    never sent to WePay in this case.
+
+    """
+
+    def __init__(self, group, retry_after):
+        self._group = group
+        self._retry_after = retry_after
+        super(WePayCircuitOpenError, self).__init__(None)
+
+    def __str__(self):
+        return "Circuit for %s calls is open, retry in %.3f seconds" % (
+            self.group, self.retry_after)
+
+    @property
+    def group(self):
+        """Endpoint group, for instance `/checkout`."""
+        return self._group
+
+    @property
+    def retry_after(self):
+        """Time in seconds until the circuit becomes half-open."""
+        return self._retry_after
@@ -0,0 +1,250 @@
+"""Streaming export of `find` results into columnar formats for analytics:
+`NumPy <https://numpy.org>`_ structured arrays, `Apache Arrow
+<https://arrow.apache.org/docs/python/>`_ IPC or Parquet files, as long as
+`numpy` or `pyarrow` are installed, and CSV:
+
+    >>> checkouts = api.checkout.iter_find(account_id, prefetch=True)
+    >>> with open('checkouts.csv', 'w') as fileobj:
+    ...     write_csv(checkouts, fileobj, COLUMNS['checkout'])
+    >>> write_arrow(api.checkout.iter_find(account_id), 'checkouts.parquet',
+    ...             COLUMNS['checkout'])
+
+Objects are consumed from any iterable, normally an `iter_find()` generator,
+in batches of a fixed size, and every batch is turned into a list of values
+per column before it is written, so memory stays bounded by ``batch_size``
+no matter how many objects are exported.
+
+.. moduleauthor:: lehins <lehins@yandex.ru>
+   :platform: independent
+"""
+import collections, csv, itertools
+import six
+from wepay.codec import get_codec
+try:
+    import numpy
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+try:
+    import pyarrow
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+__all__ = [
+    'Column', 'COLUMNS', 'make_columns', 'iter_batches', 'iter_arrays',
+    'write_csv', 'write_arrow'
+]
+
+
+class Column(collections.namedtuple('Column', ['name', 'path', 'dtype'])):
+    """Column of an export: its ``name``, ``path`` to a value in an object, a
+    tuple of keys, and a NumPy ``dtype`` string, for instance ``'i8'``,
+    ``'f8'``, ``'?'`` or ``'U16'``, or `None` for Python objects.
+
+    """
+    __slots__ = ()
+
+
+def make_columns(columns):
+    """Creates a list of :class:`Column` objects out of ``columns`` given as
+    names of fields, ``(name, dtype)`` tuples or columns. Nested fields are
+    separated with dots, e.g. ``'fee.app_fee'``, and are named with
+    underscores, e.g. `fee_app_fee`.
+
+    """
+    result = []
+    for column in columns:
+        if isinstance(column, Column):
+            result.append(column)
+            continue
+        if isinstance(column, six.string_types):
+            column = (column, None)
+        field, dtype = column
+        result.append(Column(field.replace('.', '_'), tuple(field.split('.')),
+                             dtype))
+    return result
+
+
+COLUMNS = {
+    'checkout': make_columns([
+        ('checkout_id', 'i8'), ('account_id', 'i8'), ('type', 'U16'),
+        ('state', 'U16'), ('currency', 'U3'), ('amount', 'f8'),
+        ('gross', 'f8'), ('fee.app_fee', 'f8'), ('fee.processing_fee', 'f8'),
+        ('fee.fee_payer', 'U16'), ('refund.amount_refunded', 'f8'),
+        ('chargeback.amount_charged_back', 'f8'), ('create_time', 'i8'),
+        ('reference_id', 'U64'), ('short_description', 'U127'),
+        ('payer.email', 'U127'), ('in_review', '?'), ('auto_release', '?')]),
+    'withdrawal': make_columns([
+        ('withdrawal_id', 'i8'), ('account_id', 'i8'), ('type', 'U16'),
+        ('state', 'U16'), ('currency', 'U3'), ('amount', 'f8'),
+        ('create_time', 'i8'), ('capture_time', 'i8'),
+        ('recipient_confirmed', '?'), ('note', 'U255')]),
+    'subscription_charge': make_columns([
+        ('subscription_charge_id', 'i8'), ('subscription_id', 'i8'),
+        ('type', 'U16'), ('state', 'U16'), ('currency', 'U3'),
+        ('amount', 'f8'), ('gross', 'f8'), ('fee.app_fee', 'f8'),
+        ('fee.processing_fee', 'f8'), ('quantity', 'i8'),
+        ('amount_refunded', 'f8'), ('amount_charged_back', 'f8'),
+        ('create_time', 'i8'), ('end_time', 'i8'), ('prorate_time', 'i8')]),
+}
+"""Default columns of exported checkouts, withdrawals and subscription charges,
+which can be extended or narrowed down as needed.
+
+"""
+
+FILL_VALUES = {'f': float('nan'), 'i': -1, 'u': 0, 'b': False, 'U': u'',
+               'S': b''}
+"""Values of missing fields in NumPy arrays by kind of a dtype, since only
+Python objects can be `None` there.
+
+"""
+
+
+def _value(obj, path):
+    for key in path:
+        if obj is None:
+            return None
+        obj = obj.get(key)
+    return obj
+
+
+def _text(codec):
+    codec = get_codec(codec)
+    def text(value):
+        if isinstance(value, (dict, list)):
+            return codec.dumps(value).decode('utf-8')
+        return six.text_type(value)
+    return text
+
+
+def iter_batches(rows, columns, batch_size=10000):
+    """Consumes ``rows`` in batches of ``batch_size`` objects and yields each
+    batch as a list of values for every one of ``columns``, where missing
+    fields are `None`.
+
+    """
+    columns = make_columns(columns)
+    iterator = iter(rows)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield [[_value(row, column.path) for row in batch]
+               for column in columns]
+        del batch
+
+
+def iter_arrays(rows, columns, batch_size=10000):
+    """Same as :func:`iter_batches`, except that every batch is a NumPy
+    structured array with a field for each column, where missing values are
+    replaced according to :data:`FILL_VALUES`. Columns without a dtype hold
+    Python objects. Requires `numpy`.
+
+    """
+    if not HAS_NUMPY:
+        raise ImportError("iter_arrays requires numpy library.")
+    columns = make_columns(columns)
+    dtype = numpy.dtype([(str(column.name), column.dtype or 'O')
+                         for column in columns])
+    for values in iter_batches(rows, columns, batch_size=batch_size):
+        array = numpy.empty(len(values[0]), dtype=dtype)
+        for column, column_values in zip(columns, values):
+            fill = FILL_VALUES.get(dtype[column.name].kind)
+            if fill is not None:
+                column_values = [fill if value is None else value
+                                 for value in column_values]
+            array[column.name] = column_values
+        yield array
+
+
+def write_csv(rows, fileobj, columns, batch_size=10000, header=True,
+              codec=None):
+    """Writes ``rows`` into ``fileobj`` as CSV, one batch at a time. Missing
+    values are written as empty strings and nested objects or lists as JSON.
+
+    :keyword bool header: write names of columns as the first line.
+    :keyword codec: JSON codec for nested values, see
+       :func:`get_codec<wepay.codec.get_codec>`.
+    :return: number of written rows.
+
+    """
+    columns = make_columns(columns)
+    text = _text(codec)
+    writer = csv.writer(fileobj)
+    if header:
+        writer.writerow([column.name for column in columns])
+    count = 0
+    for values in iter_batches(rows, columns, batch_size=batch_size):
+        writer.writerows(zip(*[
+            ['' if value is None else
+             text(value) if isinstance(value, (dict, list)) else value
+             for value in column_values]
+            for column_values in values]))
+        count += len(values[0])
+    return count
+
+
+def _arrow_type(dtype):
+    if dtype is None or dtype[0] in 'US':
+        return pyarrow.string()
+    return pyarrow.from_numpy_dtype(dtype)
+
+
+def _arrow_writer(sink, schema, format):
+    if format == 'parquet':
+        from pyarrow import parquet
+        return parquet.ParquetWriter(sink, schema)
+    return pyarrow.ipc.new_file(sink, schema)
+
+
+def write_arrow(rows, sink, columns, batch_size=10000, format='parquet',
+                codec=None):
+    """Writes ``rows`` into ``sink``, a path or a file-like object, as a
+    Parquet file or, if ``format`` is ``'arrow'``, as an Arrow IPC file, with
+    every batch becoming an Arrow record batch. Missing values are written as
+    nulls and values of columns without a dtype as strings, nested objects or
+    lists as JSON, so that the schema is known before the first batch is
+    written. Requires `pyarrow`.
+
+    :keyword codec: JSON codec for nested values, see
+       :func:`get_codec<wepay.codec.get_codec>`.
+    :return: number of written rows.
+
+    """
+    if not HAS_PYARROW:
+        raise ImportError("write_arrow requires pyarrow library.")
+    if format not in ('parquet', 'arrow'):
+        raise ValueError("Unknown format: '%s'" % format)
+    columns = make_columns(columns)
+    schema = pyarrow.schema([(column.name, _arrow_type(column.dtype))
+                             for column in columns])
+    # a missing field in the first batch would otherwise turn into a column
+    # of nulls, which no later batch could be written into
+    convert = []
+    for column, field in zip(columns, schema):
+        if column.dtype is None:
+            convert.append(_text(codec))
+        elif pyarrow.types.is_floating(field.type):
+            convert.append(float) # amounts can be decoded as Decimal
+        else:
+            convert.append(None)
+    writer = _arrow_writer(sink, schema, format)
+    count = 0
+    try:
+        for values in iter_batches(rows, columns, batch_size=batch_size):
+            arrays = []
+            for field, to_type, column_values in zip(schema, convert, values):
+                if to_type is not None:
+                    column_values = [None if value is None else to_type(value)
+                                     for value in column_values]
+                arrays.append(pyarrow.array(column_values, type=field.type))
+            batch = pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+            if format == 'parquet':
+                writer.write_table(pyarrow.Table.from_batches([batch]))
+            else:
+                writer.write_batch(batch)
+            count += batch.num_rows
+    finally:
+        writer.close()
+    return count
@@ -0,0 +1,231 @@
+"""Hedged requests for lookups. When a lookup has not been answered within a
+delay, which is normally a high percentile of latencies observed for its
+endpoint, a duplicate request is sent on another pooled connection. The first
+successful answer wins, while the other one is cancelled. Requests already in
+flight cannot be interrupted in threads, so with :class:`WePay
+<wepay.api.WePay>` the loser's response is merely discarded, while
+:class:`AsyncWePay<wepay.aio.AsyncWePay>` cancels it right away:
+
+    >>> api = WePay(access_token=WEPAY_ACCESS_TOKEN, hedge=HedgePolicy())
+    >>> api.checkout(12345)
+
+Only calls, which are marked as read-only by their
+:class:`CallSpec<wepay.calls.base.CallSpec>`, are ever hedged, so a mutating
+call can never be sent twice. Hedging costs extra requests, which count
+against WePay's rate limits, so it is best reserved for latency critical
+polling. Duplicates are counted in ``attempts`` and ``hedges`` of the call's
+:class:`CallEvent<wepay.metrics.CallEvent>`, so this extra load shows up in
+:mod:`metrics<wepay.metrics>`.
+
+.. moduleauthor:: lehins <lehins@yandex.ru>
+   :platform: independent
+"""
+import collections, threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from wepay.calls.base import get_spec
+from wepay.metrics import clock, Timing
+
+__all__ = ['HedgePolicy']
+
+
+class HedgePolicy(object):
+    """Decides when to hedge a lookup and keeps track of latencies.
+
+    :keyword float delay: time in seconds to wait before sending a duplicate
+       request, used until ``min_samples`` latencies of an endpoint are
+       observed, or always if ``percentile`` is `None`.
+    :keyword float percentile: percentile of recent latencies of an endpoint
+       to wait before sending a duplicate request.
+    :keyword int min_samples: number of latencies required for ``percentile``
+       to be used.
+    :keyword int window: number of most recent latencies kept per endpoint.
+    :keyword int max_hedges: maximum number of duplicate requests per call.
+    :keyword int max_workers: number of threads, which send requests of hedged
+       calls made by :class:`WePay<wepay.api.WePay>`.
+       :class:`AsyncWePay<wepay.aio.AsyncWePay>` does not need them.
+
+    """
+
+    def __init__(self, delay=0.1, percentile=95, min_samples=20, window=200,
+                 max_hedges=1, max_workers=20):
+        self.delay = delay
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.window = window
+        self.max_hedges = max_hedges
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._stats = collections.Counter()
+        self._executor = None
+        self._active = 0
+
+    def __call__(self, fn, request):
+        """Calls ``fn(request)`` in a thread, and ``fn`` with a copy of the
+        request in another one every time it takes too long, until one of
+        them succeeds or all of them fail. The delay counts from the moment a
+        thread picks the request up, so time spent waiting for a free thread
+        is not mistaken for a slow response, and no duplicates are sent while
+        all threads are busy.
+
+        """
+        uri = request.uri
+        primary = self._submit(fn, self.duplicate(request))
+        primary.running.wait()
+        attempts = {primary.future: primary}
+        finished = []
+        deadline = primary.started + self.hedge_delay(uri)
+        hedges = 0
+        error = None
+        try:
+            while True:
+                timeout = None
+                if hedges < self.max_hedges:
+                    timeout = max(0, deadline - clock())
+                done, pending = wait(
+                    attempts, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    attempt = attempts.pop(future)
+                    finished.append(attempt.request)
+                    exc = future.exception()
+                    if exc is None:
+                        for loser in pending:
+                            loser.cancel()
+                        self.record(uri, clock() - attempt.started,
+                                    hedge=attempt is not primary)
+                        return future.result()
+                    error = error or exc
+                if not done:
+                    hedges += 1
+                    if self.saturated():
+                        # a duplicate would only queue up behind other requests
+                        hedges = self.max_hedges
+                        continue
+                    self.hedged(uri)
+                    if request.timing is not None:
+                        request.timing.hedges += 1
+                    hedge = self._submit(fn, self.duplicate(request))
+                    attempts[hedge.future] = hedge
+                    deadline = clock() + self.hedge_delay(uri)
+                elif not attempts:
+                    raise error
+        finally:
+            self.collect(request, [attempt.request for attempt in
+                                   attempts.values()] + finished)
+
+    def duplicate(self, request):
+        """Returns a copy of ``request`` to be sent alongside others, which
+        collects timings of its own, if ``request`` does.
+
+        """
+        copy = request.copy()
+        if request.timing is not None:
+            copy.timing = Timing()
+        return copy
+
+    def collect(self, request, duplicates):
+        """Adds timings of ``duplicates`` of ``request`` to its own in order,
+        so the status of the last one is reported. Requests, which are still
+        in flight, are counted as far as they got.
+
+        """
+        if request.timing is not None:
+            for duplicate in duplicates:
+                request.timing.merge(duplicate.timing)
+
+    def saturated(self):
+        """Checks if all threads are busy sending requests."""
+        with self._lock:
+            return self._active >= self.max_workers
+
+    def hedgeable(self, uri):
+        """Checks if calls to ``uri`` may be sent more than once."""
+        spec = get_spec(uri)
+        return spec is not None and spec.read_only
+
+    def hedge_delay(self, uri):
+        """Returns time in seconds to wait for a response from ``uri`` before
+        sending a duplicate request.
+
+        """
+        if self.percentile is None:
+            return self.delay
+        with self._lock:
+            latencies = self._latencies.get(uri)
+            if latencies is None or len(latencies) < self.min_samples:
+                return self.delay
+            latencies = sorted(latencies)
+        return latencies[min(len(latencies) - 1,
+                             int(len(latencies) * self.percentile / 100.0))]
+
+    def record(self, uri, elapsed, hedge=False):
+        """Records latency of a successful request to ``uri``, ``hedge``
+        indicating that it was a duplicate request, which won.
+
+        """
+        with self._lock:
+            latencies = self._latencies.get(uri)
+            if latencies is None:
+                latencies = self._latencies[uri] = collections.deque(
+                    maxlen=self.window)
+            latencies.append(elapsed)
+            self._stats['calls'] += 1
+            if hedge:
+                self._stats['wins'] += 1
+
+    def stats(self):
+        """Returns a dictionary with numbers of successful ``calls``, duplicate
+        requests sent as ``hedges`` and ``wins`` of those over the original
+        ones.
+
+        """
+        with self._lock:
+            return dict((key, self._stats[key])
+                        for key in ('calls', 'hedges', 'wins'))
+
+    def close(self):
+        """Shuts down threads used for hedged calls."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def hedged(self, uri):
+        """Records that a duplicate request to ``uri`` was sent."""
+        with self._lock:
+            self._stats['hedges'] += 1
+
+    def _submit(self, fn, request):
+        attempt = _Attempt(fn, request)
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            attempt.future = self._executor.submit(attempt)
+            self._active += 1
+        attempt.future.add_done_callback(self._done)
+        return attempt
+
+    def _done(self, future):
+        with self._lock:
+            self._active -= 1
+
+
+class _Attempt(object):
+    """Request sent in a thread of a :class:`HedgePolicy`, which records when
+    the thread picked it up.
+
+    """
+    __slots__ = ('fn', 'request', 'future', 'started', 'running')
+
+    def __init__(self, fn, request):
+        self.fn = fn
+        self.request = request
+        self.future = None
+        self.started = None
+        self.running = threading.Event()
+
+    def __call__(self):
+        self.started = clock()
+        self.running.set()
+        return self.fn(self.request)
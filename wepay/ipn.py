@@ -0,0 +1,260 @@
+"""Receiving side of `Instant Payment Notifications
+<https://developer.wepay.com/api/general/ipn>`_, which WePay sends to
+``callback_uri`` of checkouts, preapprovals, accounts and others whenever they
+change. A notification only carries an ID of the object, for instance
+``checkout_id=12345``, so :class:`IPNReceiver` acknowledges it right away,
+merges repeated notifications about an object, that is still waiting to be
+looked up, and looks up the changed objects in the background in bulk, with
+`/batch/create`, before handing them over to registered handlers:
+
+    >>> receiver = IPNReceiver(api, CLIENT_ID, CLIENT_SECRET)
+    >>> @receiver.handler('checkout')
+    ... def checkout_changed(ipn):
+    ...     update_order(ipn.id, ipn.object['state'])
+
+Receiver itself is a WSGI application, which can be mounted at the
+``callback_uri``, while :meth:`IPNReceiver.asgi` returns an ASGI one.
+
+.. moduleauthor:: lehins <lehins@yandex.ru>
+   :platform: independent
+"""
+import collections, json, logging, threading, time
+from six.moves import urllib
+
+from wepay.batching import AutoBatch, MAX_CALLS
+
+__all__ = ['IPN', 'IPNReceiver', 'OBJECTS']
+
+logger = logging.getLogger(__name__)
+
+OBJECTS = ('checkout', 'preapproval', 'account', 'withdrawal',
+           'subscription_charge', 'subscription_plan', 'subscription')
+"""Objects, notifications about which are looked up, in order of preference
+when a notification carries more than one ID.
+
+"""
+
+
+IPN = collections.namedtuple('IPN', ['type', 'id', 'object', 'error'])
+"""Notification passed to handlers: ``type`` of an object, for instance
+`checkout`, its ``id``, the ``object`` itself as returned by a lookup, or
+`None` if the lookup failed with an ``error``.
+
+"""
+
+
+class IPNReceiver(object):
+    """Accepts notifications and dispatches looked up objects to handlers.
+
+    :param api: :class:`WePay<wepay.api.WePay>` instance used for lookups.
+    :param client_id: application's client id, required by `/batch/create`.
+    :param client_secret: application's client secret.
+    :keyword access_token: access token used for lookups, or a callable, that
+       accepts object type and ID and returns one, since objects of different
+       merchants require their own tokens. ``api.access_token`` by default.
+    :keyword float window: time in seconds to wait for more notifications
+       before looking them up.
+    :keyword int max_calls: maximum number of lookups in one `/batch/create`.
+
+    """
+
+    def __init__(self, api, client_id, client_secret, access_token=None,
+                 window=0.5, max_calls=MAX_CALLS):
+        self.api = api
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.access_token = access_token
+        self.window = window
+        self.max_calls = max_calls
+        self.received = 0
+        self.duplicates = 0
+        self._handlers = collections.defaultdict(list)
+        self._pending = set()
+        self._queue = []
+        self._cond = threading.Condition()
+        self._worker = None
+        self._closed = False
+
+    def __call__(self, environ, start_response):
+        """WSGI application."""
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        body = environ['wsgi.input'].read(length) if length > 0 else b''
+        status, message = self.handle(
+            environ.get('REQUEST_METHOD', 'GET'), environ.get('CONTENT_TYPE', ''),
+            body)
+        message = message.encode('utf-8')
+        start_response('%s %s' % (status, message.decode('utf-8')), [
+            ('Content-Type', 'text/plain'),
+            ('Content-Length', str(len(message)))])
+        return [message]
+
+    def asgi(self):
+        """Returns an ASGI application, which passes notifications to this
+        receiver (Python 3 only).
+
+        """
+        from wepay.aio import ipn_app
+        return ipn_app(self)
+
+    def handler(self, *types):
+        """Decorator, which registers a function as a handler of notifications
+        about objects of ``types``, or of all of them if none are given. See
+        :meth:`register`.
+
+        """
+        def decorator(fn):
+            self.register(fn, *types)
+            return fn
+        return decorator
+
+    def register(self, fn, *types):
+        """Registers ``fn``, which will be called with an :class:`IPN` in a
+        background thread for every notification about objects of ``types``,
+        or of all of them if none are given.
+
+        """
+        for object_type in types or (None,):
+            if object_type is not None and object_type not in OBJECTS:
+                raise ValueError("Unknown object type: %s" % object_type)
+            self._handlers[object_type].append(fn)
+
+    def handle(self, method, content_type, body):
+        """Accepts a raw notification, as it was received over HTTP.
+
+        :return: a tuple with HTTP status and a message.
+
+        """
+        if method != 'POST':
+            return 405, 'Method Not Allowed'
+        parsed = self.parse(content_type, body)
+        if parsed is None:
+            return 400, 'Bad Request'
+        # other notifications are acknowledged too, so WePay stops resending
+        if parsed[0] in OBJECTS:
+            self.notify(*parsed)
+        return 200, 'OK'
+
+    def parse(self, content_type, body):
+        """Extracts object type and ID from a body of a notification, or
+        returns `None` if it is not recognized. Types other than
+        :data:`OBJECTS`, for instance `user` or `credit_card`, are extracted
+        as well, but are never looked up.
+
+        """
+        if isinstance(body, bytes):
+            body = body.decode('utf-8', 'replace')
+        try:
+            if 'json' in content_type:
+                params = json.loads(body)
+            else:
+                params = dict((key, values[-1]) for key, values in
+                              urllib.parse.parse_qs(body).items())
+        except ValueError:
+            return None
+        if not isinstance(params, dict):
+            return None
+        id_params = ['%s_id' % object_type for object_type in OBJECTS]
+        id_params.extend(sorted(key for key in params if
+                                key.endswith('_id') and key not in id_params))
+        for id_param in id_params:
+            object_id = params.get(id_param)
+            if object_id is not None:
+                try:
+                    return id_param[:-3], int(object_id)
+                except (TypeError, ValueError):
+                    return None
+        return None
+
+    def notify(self, object_type, object_id):
+        """Queues a lookup of an object, unless it is already queued. Once a
+        lookup has started, a new notification about the same object queues
+        another one, since the object could have changed again.
+
+        :return: `False` if it was a duplicate.
+
+        """
+        key = (object_type, object_id)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("IPNReceiver is closed.")
+            self.received += 1
+            if key in self._pending:
+                self.duplicates += 1
+                return False
+            self._pending.add(key)
+            self._queue.append(key)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run)
+                self._worker.daemon = True
+                self._worker.start()
+            self._cond.notify()
+        return True
+
+    def flush(self):
+        """Looks up all queued objects and dispatches them to handlers in the
+        calling thread.
+
+        """
+        with self._cond:
+            queue, self._queue = self._queue, []
+            self._pending.difference_update(queue)
+        if not queue:
+            return
+        batch = AutoBatch(self.api, self.client_id, self.client_secret,
+                          max_calls=self.max_calls)
+        lookups = []
+        for object_type, object_id in queue:
+            access_token = self.access_token
+            if callable(access_token):
+                access_token = access_token(object_type, object_id)
+            call = getattr(self.api, object_type)(
+                object_id, batch_mode=True, access_token=access_token)
+            lookups.append((object_type, object_id, batch.submit(call)))
+        batch.flush()
+        for object_type, object_id, future in lookups:
+            error = future.exception()
+            obj = None if error is not None else future.result()
+            self._dispatch(IPN(object_type, object_id, obj, error))
+
+    def close(self):
+        """Stops the background thread, after it dispatches all queued
+        notifications.
+
+        """
+        with self._cond:
+            self._closed = True
+            worker, self._worker = self._worker, None
+            self._cond.notify()
+        if worker is not None:
+            worker.join()
+        self.flush()
+
+    def _dispatch(self, ipn):
+        for fn in self._handlers.get(ipn.type, []) + self._handlers.get(None, []):
+            try:
+                fn(ipn)
+            except Exception:
+                logger.exception("IPN handler %r failed for %s %s",
+                                 fn, ipn.type, ipn.id)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                # give more notifications a chance to arrive
+                deadline = time.time() + self.window
+                while len(self._queue) < self.max_calls and not self._closed:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("IPN lookups failed")
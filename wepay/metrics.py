@@ -0,0 +1,338 @@
+"""Instrumentation of API calls. Every call made through :class:`WePay
+<wepay.api.WePay>` with ``metrics`` turned on results in a :class:`CallEvent`,
+which is delivered to all registered hooks and aggregated into per endpoint
+histograms:
+
+    >>> metrics = Metrics()
+    >>> metrics.register(StatsdHook(prefix='myapp.wepay'))
+    >>> api = WePay(access_token=WEPAY_ACCESS_TOKEN, metrics=metrics)
+    >>> api.checkout(12345)
+    >>> api.metrics.snapshot()['/checkout']
+    {'count': 1, 'errors': 0, 'p50': 0.25, ...}
+
+.. moduleauthor:: lehins <lehins@yandex.ru>
+   :platform: independent
+"""
+import bisect, collections, logging, socket, threading, time
+try:
+    import prometheus_client
+    HAS_PROMETHEUS = True
+except ImportError:
+    HAS_PROMETHEUS = False
+
+from wepay.exceptions import WePayHTTPError
+
+__all__ = [
+    'CallEvent', 'Timing', 'Histogram', 'Metrics', 'StatsdHook',
+    'PrometheusHook', 'BUCKETS'
+]
+
+clock = getattr(time, 'perf_counter', time.time)
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+           float('inf'))
+"""Upper bounds in seconds of latency histogram buckets."""
+
+
+CallEvent = collections.namedtuple('CallEvent', [
+    'uri', 'status', 'error', 'elapsed', 'encode', 'network', 'decode',
+    'bytes_sent', 'bytes_received', 'attempts', 'cached', 'hedges'])
+"""Outcome of a single call:
+
+* ``uri`` - API uri, for instance `/checkout/find`.
+* ``status`` - HTTP status of the last attempt, or `None` if WePay was not
+  reached.
+* ``error`` - exception the call failed with or `None`.
+* ``elapsed`` - total time in seconds spent on the call, including retries.
+* ``encode``, ``network``, ``decode`` - time in seconds spent on encoding
+  params, waiting for WePay and decoding responses over all attempts.
+* ``bytes_sent``, ``bytes_received`` - size of request and response bodies
+  over all attempts.
+* ``attempts`` - number of requests sent, `0` for cached responses.
+* ``cached`` - whether response was served from the :mod:`cache<wepay.cache>`.
+* ``hedges`` - number of duplicate requests sent by :mod:`hedging
+  <wepay.hedging>`, which are also counted in ``attempts`` and bytes.
+
+"""
+
+
+class Timing(object):
+    """Collects timings of requests made for a single call. It is passed to
+    :class:`Post<wepay.utils.Post>`, which calls :meth:`start` before encoding
+    params and :meth:`mark` after each phase of a request.
+
+    """
+
+    __slots__ = ('status', 'encode', 'network', 'decode', 'bytes_sent',
+                 'bytes_received', 'attempts', 'hedges', '_last')
+
+    def __init__(self):
+        self.status = None
+        self.encode = self.network = self.decode = 0
+        self.bytes_sent = self.bytes_received = 0
+        self.attempts = self.hedges = 0
+        self._last = None
+
+    def start(self):
+        self._last = clock()
+
+    def mark(self, phase, sent=0, received=0, status=None):
+        """Adds time passed since the last mark to ``phase``, which is one of
+        ``'encode'``, ``'network'`` or ``'decode'``.
+
+        """
+        now = clock()
+        setattr(self, phase, getattr(self, phase) + now - self._last)
+        self._last = now
+        self.bytes_sent += sent
+        self.bytes_received += received
+        if status is not None:
+            self.status = status
+
+    def merge(self, other):
+        """Adds timings collected by ``other`` for a duplicate of the same
+        call, taking over its status, if it has one.
+
+        """
+        self.encode += other.encode
+        self.network += other.network
+        self.decode += other.decode
+        self.bytes_sent += other.bytes_sent
+        self.bytes_received += other.bytes_received
+        self.attempts += other.attempts
+        self.hedges += other.hedges
+        if other.status is not None:
+            self.status = other.status
+
+    def event(self, uri, elapsed, error=None, cached=False):
+        """Creates a :class:`CallEvent` out of collected timings."""
+        status = self.status
+        if isinstance(error, WePayHTTPError):
+            status = error.status_code
+        elif error is not None and self.status == 200:
+            status = None
+        return CallEvent(uri, status, error, elapsed, self.encode, self.network,
+                         self.decode, self.bytes_sent, self.bytes_received,
+                         self.attempts, cached, self.hedges)
+
+
+class Histogram(object):
+    """Latency histogram of a single endpoint with fixed ``buckets``, which also
+    counts errors, statuses, hedges and bytes transferred.
+
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+        self.cached = 0
+        self.hedges = 0
+        self.statuses = collections.Counter()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def add(self, event):
+        self.counts[bisect.bisect_left(self.buckets, event.elapsed)] += 1
+        self.count += 1
+        self.sum += event.elapsed
+        self.errors += event.error is not None
+        self.cached += event.cached
+        self.hedges += event.hedges
+        self.statuses[event.status] += 1
+        self.bytes_sent += event.bytes_sent
+        self.bytes_received += event.bytes_received
+
+    def quantile(self, q):
+        """Estimates ``q`` quantile (between 0 and 1) of latency by linear
+        interpolation within a bucket.
+
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i else 0
+                upper = self.buckets[i]
+                if upper == float('inf'):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-2]
+
+    def summary(self):
+        return {
+            'count': self.count, 'errors': self.errors, 'cached': self.cached,
+            'hedges': self.hedges,
+            'mean': self.sum / self.count if self.count else None,
+            'p50': self.quantile(0.5), 'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99), 'statuses': dict(self.statuses),
+            'bytes_sent': self.bytes_sent, 'bytes_received': self.bytes_received,
+        }
+
+
+class Metrics(object):
+    """Dispatches :class:`CallEvent` objects to registered hooks and aggregates
+    them into a :class:`Histogram` per endpoint.
+
+    :keyword hooks: callables, that accept a :class:`CallEvent`.
+    :keyword bool aggregate: set to `False` in order to only dispatch events.
+    :keyword buckets: latency histogram buckets, see :data:`BUCKETS`.
+
+    """
+
+    def __init__(self, hooks=(), aggregate=True, buckets=BUCKETS):
+        self.hooks = list(hooks)
+        self.aggregate = aggregate
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def register(self, hook):
+        """Adds a ``hook``, which is called with every :class:`CallEvent`.
+        Exceptions raised by hooks are logged, rather than propagated, since
+        the call has already been made by then.
+
+        """
+        self.hooks.append(hook)
+        return hook
+
+    def unregister(self, hook):
+        self.hooks.remove(hook)
+
+    def emit(self, event):
+        if self.aggregate:
+            with self._lock:
+                histogram = self._histograms.get(event.uri)
+                if histogram is None:
+                    histogram = self._histograms[event.uri] = Histogram(
+                        self.buckets)
+                histogram.add(event)
+        for hook in self.hooks:
+            try:
+                hook(event)
+            except Exception:
+                logger.exception("Metrics hook %r failed for %s", hook, event.uri)
+
+    def histogram(self, uri):
+        """Returns :class:`Histogram` of ``uri`` or `None` if no calls were
+        made to it yet.
+
+        """
+        return self._histograms.get(uri)
+
+    def snapshot(self):
+        """Returns summaries of all endpoints keyed by uri, each with
+        ``count``, ``errors``, ``cached``, ``hedges``, ``mean``, ``p50``, ``p90`` and
+        ``p99`` latency in seconds, ``statuses`` counts and number of
+        ``bytes_sent`` and ``bytes_received``.
+
+        """
+        with self._lock:
+            return dict((uri, histogram.summary())
+                        for uri, histogram in self._histograms.items())
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+def _metric_name(uri):
+    return uri.strip('/').replace('/', '.') or 'root'
+
+
+class StatsdHook(object):
+    """Sends events to a `StatsD <https://github.com/statsd/statsd>`_ server as
+    ``<prefix>.<endpoint>.time`` timers and ``<prefix>.<endpoint>.calls``,
+    ``.errors``, ``.cached``, ``.hedges`` counters, for instance
+    ``wepay.checkout.find.time``.
+
+    :keyword client: an object with ``timing(name, ms)`` and ``incr(name, count)``
+       methods, like ``statsd.StatsClient``. If not given, metrics are sent over
+       UDP to ``host`` and ``port``.
+    :keyword str prefix: prefix of all metric names.
+
+    """
+
+    def __init__(self, client=None, host='localhost', port=8125, prefix='wepay'):
+        self.client = client
+        self.prefix = prefix
+        self._address = (host, port)
+        self._socket = None
+        if client is None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def __call__(self, event):
+        name = '%s.%s' % (self.prefix, _metric_name(event.uri))
+        ms = event.elapsed * 1000
+        counters = [('calls', 1)]
+        if event.error is not None:
+            counters.append(('errors', 1))
+        if event.cached:
+            counters.append(('cached', 1))
+        if event.hedges:
+            counters.append(('hedges', event.hedges))
+        if self.client is not None:
+            self.client.timing(name + '.time', ms)
+            for counter, count in counters:
+                self.client.incr('%s.%s' % (name, counter), count)
+            return
+        lines = ['%s.time:%.3f|ms' % (name, ms)]
+        lines.extend('%s.%s:%d|c' % (name, counter, count)
+                     for counter, count in counters)
+        try:
+            self._socket.sendto('\n'.join(lines).encode('utf-8'), self._address)
+        except socket.error:
+            pass # metrics should never break calls
+
+
+class PrometheusHook(object):
+    """Records events with `prometheus_client
+    <https://github.com/prometheus/client_python>`_ as a
+    ``<namespace>_call_duration_seconds`` histogram and
+    ``<namespace>_call_errors_total``, ``<namespace>_hedges_total``,
+    ``<namespace>_bytes_sent_total``, ``<namespace>_bytes_received_total``
+    counters, all labeled with
+    ``endpoint``, plus ``status`` label for errors.
+
+    :keyword registry: `prometheus_client` registry, default one if `None`.
+    :keyword str namespace: prefix of all metric names.
+    :keyword buckets: latency histogram buckets, see :data:`BUCKETS`.
+
+    """
+
+    def __init__(self, registry=None, namespace='wepay', buckets=BUCKETS):
+        if not HAS_PROMETHEUS:
+            raise ImportError("PrometheusHook requires prometheus_client library.")
+        kwargs = {'namespace': namespace}
+        if registry is not None:
+            kwargs['registry'] = registry
+        self.duration = prometheus_client.Histogram(
+            'call_duration_seconds', "Duration of WePay API calls.",
+            ['endpoint'], buckets=buckets, **kwargs)
+        self.errors = prometheus_client.Counter(
+            'call_errors_total', "Failed WePay API calls.",
+            ['endpoint', 'status'], **kwargs)
+        self.hedges = prometheus_client.Counter(
+            'hedges_total', "Duplicate requests sent to WePay.", ['endpoint'],
+            **kwargs)
+        self.bytes_sent = prometheus_client.Counter(
+            'bytes_sent_total', "Bytes sent to WePay.", ['endpoint'], **kwargs)
+        self.bytes_received = prometheus_client.Counter(
+            'bytes_received_total', "Bytes received from WePay.", ['endpoint'],
+            **kwargs)
+
+    def __call__(self, event):
+        self.duration.labels(event.uri).observe(event.elapsed)
+        if event.error is not None:
+            self.errors.labels(event.uri, str(event.status)).inc()
+        if event.hedges:
+            self.hedges.labels(event.uri).inc(event.hedges)
+        self.bytes_sent.labels(event.uri).inc(event.bytes_sent)
+        self.bytes_received.labels(event.uri).inc(event.bytes_received)
@@ -0,0 +1,230 @@
+"""Every call made through :meth:`WePay.call<wepay.api.WePay.call>` is passed as a
+:class:`Request` through an ordered chain of middlewares before it is sent to
+WePay. A middleware is a callable, that accepts a request and the next handler
+in the chain, and returns a response. It can change the request, time it,
+transform the response or return one without calling the next handler at all:
+
+    >>> def sign(request, call_next):
+    ...     request.headers['X-Signature'] = signature(request.params)
+    ...     return call_next(request)
+    >>> api = WePay(access_token=WEPAY_ACCESS_TOKEN, middleware=[sign])
+    >>> api.middleware.append(another_middleware)
+
+Middlewares supplied by a user are called first, in order they are listed in
+``WePay.middleware``, followed by built-in ones, which are derived from
+``WePay`` attributes: :class:`MetricsMiddleware`, :class:`CacheMiddleware`,
+:class:`SingleFlightMiddleware`, :class:`RetryMiddleware`,
+:class:`HedgeMiddleware`,
+:class:`CircuitBreakerMiddleware` and :class:`RateLimitMiddleware`.
+Middlewares for :class:`AsyncWePay<wepay.aio.AsyncWePay>` are coroutine
+functions, which await ``call_next``.
+
+.. moduleauthor:: lehins <lehins@yandex.ru>
+   :platform: independent
+"""
+from wepay.metrics import Timing, clock
+
+__all__ = [
+    'Request', 'compose', 'MetricsMiddleware', 'CacheMiddleware',
+    'SingleFlightMiddleware', 'RetryMiddleware', 'HedgeMiddleware', 'CircuitBreakerMiddleware',
+    'RateLimitMiddleware'
+]
+
+
+class Request(object):
+    """A call on its way to WePay.
+
+    :ivar str uri: API uri, for instance `/checkout/find`.
+    :ivar str url: full url the request will be sent to.
+    :ivar dict params: parameters of the call.
+    :ivar dict headers: HTTP headers, including `Authorization`.
+    :ivar float timeout: timeout in seconds.
+    :ivar str access_token: access token used for the call.
+    :ivar str api_version: API version used for the call or `None`.
+    :ivar timing: :class:`Timing<wepay.metrics.Timing>`, which is filled in by
+       the transport, or `None` if metrics are off.
+    :ivar bool cached: whether response was served from a cache.
+
+    """
+
+    __slots__ = ('uri', 'url', 'params', 'headers', 'timeout', 'access_token',
+                 'api_version', 'timing', 'cached')
+
+    def __init__(self, uri, url, params, headers, timeout, access_token=None,
+                 api_version=None):
+        self.uri = uri
+        self.url = url
+        self.params = params
+        self.headers = headers
+        self.timeout = timeout
+        self.access_token = access_token
+        self.api_version = api_version
+        self.timing = None
+        self.cached = False
+
+    def copy(self):
+        """Returns a copy of the request with its own headers and no timing."""
+        return Request(self.uri, self.url, self.params, dict(self.headers),
+                       self.timeout, self.access_token, self.api_version)
+
+    def __repr__(self):
+        return "<Request %s>" % self.uri
+
+
+def _link(middleware, call_next):
+    def handler(request):
+        return middleware(request, call_next)
+    return handler
+
+
+def compose(middlewares, handler):
+    """Wraps ``handler`` into ``middlewares``, so that the first one is called
+    first, and returns a function that accepts a :class:`Request`.
+
+    """
+    for middleware in reversed(middlewares):
+        handler = _link(middleware, handler)
+    return handler
+
+
+class MetricsMiddleware(object):
+    """Reports every call to :class:`Metrics<wepay.metrics.Metrics>`."""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def __call__(self, request, call_next):
+        started = self.start(request)
+        try:
+            response = call_next(request)
+        except BaseException as exc:
+            self.emit(request, started, exc)
+            raise
+        self.emit(request, started)
+        return response
+
+    def start(self, request):
+        request.timing = Timing()
+        return clock()
+
+    def emit(self, request, started, error=None):
+        self.metrics.emit(request.timing.event(
+            request.uri, clock() - started, error, request.cached))
+
+
+class CacheMiddleware(object):
+    """Serves lookups from a :class:`LookupCache<wepay.cache.LookupCache>` and
+    evicts or refreshes objects changed by other calls.
+
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def __call__(self, request, call_next):
+        key = self.key(request)
+        generation = None
+        if key is not None:
+            found, response = self.cache.get(key)
+            if found:
+                request.cached = True
+                return response
+            generation = self.cache.generation()
+        response = None
+        try:
+            response = call_next(request)
+        finally:
+            self.update(request, key, response, generation)
+        return response
+
+    def key(self, request):
+        return self.cache.key(request.uri, request.params, request.access_token,
+                              request.api_version)
+
+    def update(self, request, key, response, generation=None):
+        if key is not None:
+            if response is not None:
+                self.cache.set(key, response, generation)
+        # failed calls also evict, since state of an object is unknown after them
+        elif request.uri == '/batch/create':
+            self.cache.invalidate_batch(request.params, response,
+                                        request.access_token, request.api_version)
+        else:
+            self.cache.invalidate(request.uri, request.params, response,
+                                  request.access_token, request.api_version)
+
+
+class SingleFlightMiddleware(object):
+    """Coalesces identical concurrent lookups with a
+    :class:`SingleFlight<wepay.singleflight.SingleFlight>`.
+
+    """
+
+    def __init__(self, group):
+        self.group = group
+
+    def __call__(self, request, call_next):
+        return self.group(call_next, request)
+
+
+class RetryMiddleware(object):
+    """Retries failed calls according to a
+    :class:`RetryPolicy<wepay.retry.RetryPolicy>`. Everything further down the
+    chain is invoked once per attempt.
+
+    """
+
+    def __init__(self, policy):
+        self.policy = policy
+
+    def __call__(self, request, call_next):
+        return self.policy(call_next, request.uri, request.params, request)
+
+
+class HedgeMiddleware(object):
+    """Sends duplicates of slow read-only calls according to a
+    :class:`HedgePolicy<wepay.hedging.HedgePolicy>`. Everything further down
+    the chain is invoked once per request sent.
+
+    """
+
+    def __init__(self, policy):
+        self.policy = policy
+
+    def __call__(self, request, call_next):
+        if not self.policy.hedgeable(request.uri):
+            return call_next(request)
+        return self.policy(call_next, request)
+
+
+class CircuitBreakerMiddleware(object):
+    """Fails calls fast with
+    :exc:`WePayCircuitOpenError<wepay.exceptions.WePayCircuitOpenError>` while
+    a :class:`CircuitBreaker<wepay.circuit.CircuitBreaker>` is open and
+    records outcomes of the rest.
+
+    """
+
+    def __init__(self, breaker):
+        self.breaker = breaker
+
+    def __call__(self, request, call_next):
+        self.breaker.before(request.uri)
+        try:
+            response = call_next(request)
+        except BaseException as exc:
+            self.breaker.record(request.uri, exc)
+            raise
+        self.breaker.record(request.uri)
+        return response
+
+
+class RateLimitMiddleware(object):
+    """Throttles calls with a :class:`RateLimiter<wepay.ratelimit.RateLimiter>`."""
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+
+    def __call__(self, request, call_next):
+        self.limiter.acquire(request.access_token)
+        return call_next(request)
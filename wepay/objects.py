@@ -0,0 +1,285 @@
+"""Typed, memory efficient response objects, enabled by
+``WePay(records=True)``. Responses of lookup and `find` calls for checkouts,
+accounts, preapprovals, withdrawals and subscriptions are returned as
+:class:`Record` objects, or lists of them, instead of dictionaries:
+
+    >>> api = WePay(access_token=WEPAY_ACCESS_TOKEN, records=True)
+    >>> for checkout in api.checkout.iter_find(account_id):
+    ...     if checkout.state == 'captured':
+    ...         total += checkout['amount']
+
+A record keeps raw JSON of its object, which is sliced out of a response
+without decoding it, until any of its fields is accessed for the first time.
+Decoded fields are stored in ``__slots__``, rather than in a dictionary, so
+records take a fraction of memory of plain dicts, whether they have been
+accessed or not (see ``benchmarks/bench_objects.py``). Records are mutable
+mappings, so code written for dicts keeps working, except that they are not
+`dict` instances, thus :meth:`Record.to_dict` should be used where one is
+required, e.g. for :func:`json.dumps`.
+
+.. moduleauthor:: lehins <lehins@yandex.ru>
+   :platform: independent
+"""
+import re
+try:
+    from collections.abc import MutableMapping
+except ImportError: # python 2
+    from collections import MutableMapping
+
+from wepay.codec import get_codec
+
+__all__ = [
+    'Record', 'Checkout', 'Account', 'Preapproval', 'Withdrawal',
+    'Subscription', 'RECORDS', 'split_array', 'decode_records'
+]
+
+_MISSING = object()
+
+
+class Record(MutableMapping):
+    """Base class for typed objects. Subclasses list names of known fields of
+    an object in ``__slots__``, while unknown ones, which can be added by WePay
+    at any time, are kept in a dictionary.
+
+    Fields can be accessed as keys or as attributes, in which case known
+    fields, that are missing from an object, are `None`.
+
+    :param dict data: decoded object.
+    :keyword bytes raw: JSON of an object, decoded on the first access, if
+       ``data`` is not given.
+    :keyword codec: :mod:`codec<wepay.codec>` instance used for decoding.
+
+    """
+    __slots__ = ('_raw', '_codec', '_extra')
+    _fields = frozenset()
+
+    def __init__(self, data=None, raw=None, codec=None):
+        self._extra = None
+        self._codec = codec
+        self._raw = raw
+        if data is not None:
+            self._raw = None
+            self._fill(data)
+
+    def __getattr__(self, name):
+        # only called for fields, that are not set yet
+        if name in self._fields:
+            if self._raw is not None:
+                self._load()
+                return getattr(self, name)
+            return None
+        raise AttributeError("%r object has no attribute %r" % (
+            self.__class__.__name__, name))
+
+    def __getitem__(self, key):
+        if self._raw is not None:
+            self._load()
+        if key in self._fields:
+            value = self._get(key)
+            if value is not _MISSING:
+                return value
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if self._raw is not None:
+            self._load()
+        if key in self._fields:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if self._raw is not None:
+            self._load()
+        if key in self._fields:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        if self._raw is not None:
+            self._load()
+        for name in self.__slots__ if self._fields else ():
+            if self._get(name) is not _MISSING:
+                yield name
+        if self._extra:
+            for key in list(self._extra):
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.to_dict())
+
+    def __reduce__(self):
+        return self.__class__, (self.to_dict(),)
+
+    def to_dict(self):
+        """Returns the object as a plain dictionary."""
+        return dict(self.items())
+
+    def _get(self, name):
+        # unlike getattr() does not fall back to __getattr__
+        try:
+            return object.__getattribute__(self, name)
+        except AttributeError:
+            return _MISSING
+
+    def _fill(self, data):
+        fields = self._fields
+        for key, value in data.items():
+            if key in fields:
+                setattr(self, key, value)
+            else:
+                if self._extra is None:
+                    self._extra = {}
+                self._extra[key] = value
+
+    def _load(self):
+        # raw JSON is dropped only once all fields are set, so a concurrent
+        # access at worst decodes it twice
+        raw = self._raw
+        if raw is not None:
+            self._fill(self._codec.loads(raw))
+            self._raw = None
+
+
+class Checkout(Record):
+    """`Checkout <https://developer.wepay.com/api/api-calls/checkout>`_ object."""
+    __slots__ = (
+        'checkout_id', 'account_id', 'type', 'short_description', 'currency',
+        'amount', 'state', 'soft_descriptor', 'create_time', 'gross',
+        'reference_id', 'callback_uri', 'long_description', 'delivery_type',
+        'fee', 'chargeback', 'refund', 'payment_method', 'hosted_checkout',
+        'payer', 'npo_information', 'payment_error', 'in_review',
+        'auto_release')
+    _fields = frozenset(__slots__)
+
+
+class Account(Record):
+    """`Account <https://developer.wepay.com/api/api-calls/account>`_ object."""
+    __slots__ = (
+        'account_id', 'name', 'state', 'description', 'reference_id',
+        'gaq_domains', 'theme_object', 'type', 'create_time', 'balances',
+        'statuses', 'action_reasons', 'disabled_reasons', 'image_uri',
+        'owner_user_id', 'disablement_reason', 'country', 'currencies',
+        'callback_uri')
+    _fields = frozenset(__slots__)
+
+
+class Preapproval(Record):
+    """`Preapproval <https://developer.wepay.com/api/api-calls/preapproval>`_
+    object.
+
+    """
+    __slots__ = (
+        'preapproval_id', 'preapproval_uri', 'manage_uri', 'account_id',
+        'short_description', 'long_description', 'currency', 'amount',
+        'fee_payer', 'state', 'redirect_uri', 'app_fee', 'period',
+        'frequency', 'start_time', 'end_time', 'reference_id', 'callback_uri',
+        'address', 'shipping_address', 'shipping_fee', 'tax', 'auto_recur',
+        'payer_name', 'payer_email', 'create_time', 'next_due_time',
+        'last_checkout_id', 'last_checkout_time', 'mode')
+    _fields = frozenset(__slots__)
+
+
+class Withdrawal(Record):
+    """`Withdrawal <https://developer.wepay.com/api/api-calls/withdrawal>`_
+    object.
+
+    """
+    __slots__ = (
+        'withdrawal_id', 'account_id', 'state', 'withdrawal_uri',
+        'redirect_uri', 'callback_uri', 'amount', 'currency', 'note',
+        'recipient_confirmed', 'type', 'create_time', 'capture_time')
+    _fields = frozenset(__slots__)
+
+
+class Subscription(Record):
+    """`Subscription <https://developer.wepay.com/api/api-calls/subscription>`_
+    object.
+
+    """
+    __slots__ = (
+        'subscription_id', 'subscription_plan_id', 'payer_name',
+        'payer_email', 'currency', 'amount', 'period', 'app_fee', 'fee_payer',
+        'state', 'create_time', 'payment_method_id', 'payment_method_type',
+        'quantity', 'mode', 'trial_days_remaining', 'transition_expire_time',
+        'transition_prorate', 'transition_quantity',
+        'transition_subscription_plan_id', 'reference_id')
+    _fields = frozenset(__slots__)
+
+
+RECORDS = dict(
+    ('/%s%s' % (name, suffix), cls)
+    for name, cls in [('checkout', Checkout), ('account', Account),
+                      ('preapproval', Preapproval), ('withdrawal', Withdrawal),
+                      ('subscription', Subscription)]
+    for suffix in ('', '/find'))
+"""Record classes keyed by uri of calls, that return them."""
+
+
+# every match is a bracket preceded by anything but brackets, where strings,
+# which can have brackets inside, are skipped as a whole
+_BRACKETS = re.compile(
+    br'[^"{}\[\]]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"{}\[\]]*)*([{}\[\]])')
+_OPENING = (b'{', b'[')
+
+
+def split_array(data):
+    """Splits raw JSON array of objects into a list of raw objects without
+    decoding them.
+
+    :raises: :exc:`ValueError` if brackets in ``data`` are unbalanced.
+
+    """
+    items = []
+    depth = 0
+    start = None
+    for match in _BRACKETS.finditer(data):
+        if match.group(1) in _OPENING:
+            depth += 1
+            if depth == 2:
+                start = match.start(1)
+        else:
+            depth -= 1
+            if depth == 1 and start is not None:
+                items.append(data[start:match.end()])
+                start = None
+            elif depth == 0:
+                break
+    if depth != 0:
+        raise ValueError("Unbalanced JSON array.")
+    return items
+
+
+def decode_records(url, data, codec=None, records=None):
+    """Decodes a response body to a call to ``url``, returning records for
+    calls from ``records`` (:data:`RECORDS` by default) and whatever ``codec``
+    returns for all other calls.
+
+    """
+    codec = codec or get_codec('json')
+    records = RECORDS if records is None else records
+    # uri is the tail of a url, one or two segments long
+    slash = url.rfind('/')
+    record_class = (records.get(url[url.rfind('/', 0, slash):]) or
+                    records.get(url[slash:]))
+    if record_class is None:
+        return codec.loads(data)
+    head = data.lstrip()[:1]
+    if head == b'{':
+        return record_class(raw=data, codec=codec)
+    if head == b'[':
+        return [record_class(raw=raw, codec=codec) for raw in split_array(data)]
+    return codec.loads(data)
@@ -0,0 +1,138 @@
+"""Helpers for walking through results of `find` calls, which are paginated with
+``start`` and ``limit`` parameters.
+
+.. moduleauthor:: lehins <lehins@yandex.ru>
+   :platform: independent
+"""
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+__all__ = ['PAGE_SIZE', 'iter_pages', 'scan_windows']
+
+PAGE_SIZE = 50
+"""Maximum number of objects WePay returns by a single `find` call."""
+
+
+def _fetch(find, args, kwargs):
+    page = find(*args, **kwargs)
+    if isinstance(page, Future): # call was made within a batching context
+        page = page.result()
+    return page
+
+
+def iter_pages(find, args=(), kwargs=None, page_size=None, prefetch=False):
+    """Lazily fetches consecutive pages by calling ``find(*args, **kwargs)``
+    with increasing ``start`` and yields them one at a time, until a page with
+    less than ``page_size`` objects is received.
+
+    :param find: a `find` call, for example ``api.checkout.find``.
+    :keyword tuple args: positional arguments to the call.
+    :keyword dict kwargs: keyword arguments to the call. ``start`` is used as
+       the position of the first page and ``limit`` as a page size.
+    :keyword int page_size: number of objects to request per call. Defaults to
+       ``limit`` or :data:`PAGE_SIZE`.
+    :keyword bool prefetch: fetch the next page in a background thread while
+       current one is being consumed.
+
+    """
+    kwargs = dict(kwargs or {})
+    assert not kwargs.get('batch_mode', False), \
+        "Cannot use 'batch_mode' while iterating over pages."
+    start = kwargs.pop('start', 0) or 0
+    limit = kwargs.pop('limit', None)
+    page_size = page_size or limit or PAGE_SIZE
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        page = _fetch(find, args, dict(kwargs, start=start, limit=page_size))
+        while True:
+            start += len(page)
+            last = len(page) < page_size
+            if executor is not None and not last:
+                future = executor.submit(
+                    _fetch, find, args, dict(kwargs, start=start, limit=page_size))
+            yield page
+            if last:
+                break
+            if executor is None:
+                page = _fetch(find, args, dict(kwargs, start=start, limit=page_size))
+            else:
+                page = future.result()
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+def _fetch_window(find, args, kwargs, start_time, end_time, page_size):
+    window = dict(kwargs, start_time=start_time, end_time=end_time)
+    page = _fetch(find, args, dict(window, start=0, limit=page_size))
+    if len(page) < page_size:
+        return page, []
+    if end_time - start_time > 1:
+        middle = (start_time + end_time) // 2
+        return page, [(start_time, middle), (middle, end_time)]
+    # window cannot be split any further, so it is paged through instead
+    objs = list(page)
+    for page in iter_pages(find, args, dict(window, start=len(page)),
+                           page_size=page_size):
+        objs.extend(page)
+    return objs, []
+
+
+def scan_windows(find, args, kwargs, start_time, end_time, id_key, shards=8,
+                 max_workers=4, page_size=PAGE_SIZE):
+    """Scans a time range ``[start_time, end_time]`` by splitting it into
+    ``shards`` windows and calling ``find(*args, start_time=..., end_time=...,
+    **kwargs)`` for each of them concurrently, with at most ``max_workers`` of
+    calls in flight. Any window that fills up a whole page is split in half
+    again, until every window fits into a single page, or is only a second
+    long, in which case it is paged through with ``start``.
+
+    Objects are yielded as soon as they are received, in no particular order,
+    while duplicates (by ``id_key``) are skipped.
+
+    :param find: a `find` call, that accepts ``start_time`` and ``end_time``.
+    :param tuple args: positional arguments to the call.
+    :param dict kwargs: keyword arguments to the call.
+    :param int start_time: beginning of the time range, as a unix timestamp.
+    :param int end_time: end of the time range, as a unix timestamp.
+    :param str id_key: name of a field with object's ID.
+    :keyword int shards: initial number of windows.
+    :keyword int max_workers: maximum number of concurrent calls.
+    :keyword int page_size: ``limit`` used for each call.
+
+    """
+    kwargs = dict(kwargs or {})
+    assert not kwargs.get('batch_mode', False), \
+        "Cannot use 'batch_mode' while scanning."
+    for key in ('start', 'limit', 'start_time', 'end_time'):
+        kwargs.pop(key, None)
+    start_time, end_time = int(start_time), int(end_time)
+    shards = max(1, min(shards, end_time - start_time))
+    step = float(end_time - start_time) / shards
+    bounds = [start_time + int(round(step * i)) for i in range(shards)] + [end_time]
+    seen = set()
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    pending = set()
+    try:
+        def submit(window):
+            pending.add(executor.submit(
+                _fetch_window, find, args, kwargs, window[0], window[1],
+                page_size))
+        for window in zip(bounds[:-1], bounds[1:]):
+            submit(window)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                objs, windows = future.result()
+                for window in windows:
+                    submit(window)
+                for obj in objs:
+                    obj_id = obj.get(id_key)
+                    if obj_id in seen:
+                        continue
+                    seen.add(obj_id)
+                    yield obj
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
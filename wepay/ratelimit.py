@@ -0,0 +1,152 @@
+"""Client-side throttling of API calls with token buckets.
+
+.. moduleauthor:: lehins <lehins@yandex.ru>
+   :platform: independent
+"""
+import collections, threading, time
+
+from wepay.exceptions import WePayRateLimitError
+
+__all__ = ['RateLimiter', 'TokenBucket']
+
+
+class TokenBucket(object):
+    """Classic token bucket, which is refilled with ``rate`` tokens per second
+    up to its ``capacity``. Tokens can be borrowed in advance, in which case the
+    bucket goes below zero and callers are expected to wait until it refills.
+
+    Not thread safe on its own, :class:`RateLimiter` takes care of locking.
+
+    """
+
+    def __init__(self, rate, capacity=None, now=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1, rate))
+        self.tokens = self.capacity
+        self.updated = time.time() if now is None else now
+
+    def refill(self, now):
+        """Adds tokens accumulated since the last update."""
+        if now > self.updated:
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now):
+        """Returns time in seconds until a token becomes available."""
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        """Takes a token, possibly borrowing it."""
+        self.tokens -= 1
+
+
+class RateLimiter(object):
+    """Limits the rate of calls made by :class:`WePay<wepay.api.WePay>`, both
+    globally and per access token, since WePay throttles on the per token
+    basis. Pass an instance to :class:`WePay<wepay.api.WePay>` in order to turn
+    it on:
+
+        >>> api = WePay(rate_limit=RateLimiter(rate=50, token_rate=5))
+        >>> api.checkout(12345, access_token=merchant_access_token)
+
+    Every call takes a token from the global bucket and from the bucket of
+    the access token it is made with. Once either of them is empty, the call
+    either waits until both have a token available (blocking mode), or fails
+    right away with :exc:`WePayRateLimitError<wepay.exceptions.WePayRateLimitError>`
+    (non-blocking mode, or the wait would be longer than ``timeout``). With
+    :class:`AsyncWePay<wepay.aio.AsyncWePay>` waiting is done with
+    :func:`asyncio.sleep`, so the event loop is never blocked.
+
+    Every attempt of a retried call is throttled separately, while
+    `/batch/create` counts as a single call.
+
+    :keyword float rate: global number of calls per second. `None` means no
+       global limit.
+    :keyword int burst: number of calls that can be made at once globally,
+       defaults to ``rate``.
+    :keyword float token_rate: number of calls per second per access token.
+       `None` means no limit per token.
+    :keyword int token_burst: number of calls that can be made at once with an
+       access token, defaults to ``token_rate``.
+    :keyword bool blocking: whether to wait for a token or raise an error.
+    :keyword float timeout: maximum time in seconds to wait in blocking mode.
+       `None` means no limit.
+    :keyword int max_tokens: maximum number of access token buckets to keep
+       track of, least recently used ones are dropped first.
+
+    """
+
+    def __init__(self, rate=None, burst=None, token_rate=None, token_burst=None,
+                 blocking=True, timeout=None, max_tokens=10000):
+        self.rate = rate
+        self.burst = burst
+        self.token_rate = token_rate
+        self.token_burst = token_burst
+        self.blocking = blocking
+        self.timeout = timeout
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self._global = None if rate is None else TokenBucket(rate, burst)
+        self._buckets = collections.OrderedDict()
+
+    def reserve(self, access_token=None, blocking=None, timeout=None):
+        """Takes a token for a call with ``access_token`` and returns time in
+        seconds the caller has to wait before making it. ``blocking`` and
+        ``timeout`` override ones of the limiter.
+
+        :raises: :exc:`WePayRateLimitError<wepay.exceptions.WePayRateLimitError>`
+           if the call cannot be made within allowed time, in which case no
+           token is taken.
+
+        """
+        blocking = self.blocking if blocking is None else blocking
+        timeout = self.timeout if timeout is None else timeout
+        now = time.time()
+        with self._lock:
+            buckets = []
+            if self._global is not None:
+                buckets.append(self._global)
+            if self.token_rate is not None:
+                buckets.append(self._bucket(access_token, now))
+            delay = max([bucket.delay(now) for bucket in buckets] or [0])
+            if delay > 0 and (not blocking or
+                              (timeout is not None and delay > timeout)):
+                raise WePayRateLimitError(delay)
+            for bucket in buckets:
+                bucket.take()
+        return delay
+
+    def acquire(self, access_token=None, blocking=None, timeout=None):
+        """Same as :meth:`reserve`, but also sleeps for the required time.
+
+        :return: time in seconds spent waiting.
+
+        """
+        delay = self.reserve(access_token, blocking=blocking, timeout=timeout)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def _bucket(self, access_token, now):
+        bucket = self._buckets.pop(access_token, None)
+        if bucket is None:
+            bucket = TokenBucket(self.token_rate, self.token_burst, now=now)
+        self._buckets[access_token] = bucket
+        while len(self._buckets) > self.max_tokens:
+            self._buckets.popitem(last=False)
+        return bucket
+
+    def stats(self):
+        """Returns number of access tokens being tracked and ones that are
+        currently being throttled.
+
+        """
+        now = time.time()
+        with self._lock:
+            throttled = sum(1 for bucket in self._buckets.values()
+                            if bucket.delay(now) > 0)
+            return {'tokens': len(self._buckets), 'throttled': throttled}
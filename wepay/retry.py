@@ -0,0 +1,124 @@
+"""Retrying of failed API calls.
+
+.. moduleauthor:: lehins <lehins@yandex.ru>
+   :platform: independent
+"""
+import random, time
+
+from wepay.exceptions import WePayError, WePayClientError, WePayServerError, \
+    WePayConnectionError, WePayRateLimitError, WePayCircuitOpenError
+from wepay.utils import is_read_only
+
+__all__ = ['RetryPolicy']
+
+
+class RetryPolicy(object):
+    """Describes when and how failed calls are retried. Pass an instance to
+    :class:`WePay<wepay.api.WePay>` in order to turn retries on:
+
+        >>> api = WePay(access_token=WEPAY_ACCESS_TOKEN, retry=RetryPolicy(max_attempts=5, deadline=20))
+
+    Calls are retried whenever they fail with
+    :exc:`WePayServerError<wepay.exceptions.WePayServerError>` or
+    :exc:`WePayConnectionError<wepay.exceptions.WePayConnectionError>`, but only
+    if it is safe to repeat them, i.e. they are read-only (lookups, `find` and
+    alike) or carry a ``unique_id`` param, like `/checkout/create` can. Any call
+    that was throttled by WePay (HTTP 429) is always retried, while calls
+    rejected by :class:`RateLimiter<wepay.ratelimit.RateLimiter>` or
+    :class:`CircuitBreaker<wepay.circuit.CircuitBreaker>` never are.
+
+    Delay before attempt `n + 1` is ``backoff * multiplier ** (n - 1)``, capped
+    at ``max_backoff`` and reduced by a random fraction of up to ``jitter``.
+
+    Number of attempts made and total time spent in seconds are set as
+    ``attempts`` and ``elapsed`` attributes on the raised exception, and are
+    also reported to ``callback(uri, attempts, elapsed, exc)`` after every
+    call, where ``exc`` is `None` for successful calls.
+
+    :keyword int max_attempts: maximum number of attempts per call.
+    :keyword float backoff: delay in seconds after the first attempt.
+    :keyword float multiplier: factor the delay grows by with each attempt.
+    :keyword float max_backoff: maximum delay in seconds.
+    :keyword float jitter: between `0` (no jitter) and `1` (delay is anywhere
+       between zero and its full value).
+    :keyword float deadline: maximum time in seconds for all attempts of a
+       call, no retry is made if the delay would exceed it. `None` means no
+       limit.
+    :keyword callback: a function called after every call.
+
+    """
+
+    def __init__(self, max_attempts=3, backoff=0.5, multiplier=2, max_backoff=10,
+                 jitter=1, deadline=None, callback=None):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.multiplier = multiplier
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.deadline = deadline
+        self.callback = callback
+
+    def __call__(self, fn, uri, params, *args):
+        """Calls ``fn(*args)``, which performs a call to ``uri`` with ``params``,
+        until it succeeds or is not worth retrying any more.
+
+        """
+        started = time.time()
+        retryable = self.retryable(uri, params)
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                response = fn(*args)
+            except (WePayError, WePayConnectionError) as exc:
+                delay = self.next_delay(exc, attempt, started, retryable)
+                if delay is None:
+                    self.report(uri, attempt, started, exc)
+                    raise
+                time.sleep(delay)
+            else:
+                self.report(uri, attempt, started)
+                return response
+
+    def retryable(self, uri, params):
+        """Checks if a call to ``uri`` with ``params`` is safe to repeat."""
+        return is_read_only(uri) or bool((params or {}).get('unique_id'))
+
+    def delay(self, attempt):
+        """Returns a delay in seconds after ``attempt`` (starting with 1)."""
+        delay = min(self.max_backoff,
+                    self.backoff * self.multiplier ** (attempt - 1))
+        return delay * (1 - self.jitter * random.random())
+
+    def next_delay(self, exc, attempt, started, retryable):
+        """Returns a delay before the next attempt or `None` if the call, which
+        was started at ``started`` and failed with ``exc`` on ``attempt``,
+        should not be retried.
+
+        """
+        if attempt >= self.max_attempts or isinstance(
+                exc, (WePayRateLimitError, WePayCircuitOpenError)):
+            return None
+        if isinstance(exc, WePayClientError):
+            if exc.status_code != 429:
+                return None
+        elif not (retryable and
+                  isinstance(exc, (WePayServerError, WePayConnectionError))):
+            return None
+        delay = self.delay(attempt)
+        if (self.deadline is not None and
+            time.time() + delay - started > self.deadline):
+            return None
+        return delay
+
+    def report(self, uri, attempts, started, exc=None):
+        """Sets ``attempts`` and ``elapsed`` on ``exc`` and invokes the
+        ``callback``.
+
+        """
+        elapsed = time.time() - started
+        if exc is not None:
+            exc.attempts = attempts
+            exc.elapsed = elapsed
+        if self.callback is not None:
+            self.callback(uri, attempts, elapsed, exc)
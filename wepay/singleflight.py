@@ -0,0 +1,94 @@
+"""Coalescing of identical concurrent lookups. While a read-only call is in
+flight, identical calls, i.e. ones with the same uri, parameters, access token
+and API version, do not go to WePay, but wait for it to finish and receive its
+response or exception instead:
+
+    >>> api = WePay(access_token=WEPAY_ACCESS_TOKEN, single_flight=SingleFlight())
+
+Unlike :mod:`cache<wepay.cache>`, nothing is kept once a call is over, so a
+call made right after it is sent to WePay again.
+
+.. moduleauthor:: lehins <lehins@yandex.ru>
+   :platform: independent
+"""
+import copy, json, threading
+from concurrent.futures import Future
+
+from wepay.calls.base import get_spec
+
+__all__ = ['SingleFlight']
+
+
+class SingleFlight(object):
+    """Keeps track of calls in flight. Only calls, which are marked as
+    read-only by their :class:`CallSpec<wepay.calls.base.CallSpec>`, are
+    coalesced. Every waiting caller receives its own copy of the response, so
+    it can be safely modified.
+
+    :ivar int calls: number of calls sent to WePay.
+    :ivar int shared: number of calls, that received a response of another one.
+
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def __len__(self):
+        return len(self._flights)
+
+    def __call__(self, fn, request):
+        """Calls ``fn(request)``, unless an identical call is already in
+        flight, in which case waits for its outcome.
+
+        """
+        key = self.key(request)
+        if key is None:
+            return fn(request)
+        flight, leader = self.join(key, Future)
+        if not leader:
+            return copy.deepcopy(flight.result())
+        try:
+            response = fn(request)
+        except BaseException as exc:
+            self.land(key)
+            flight.set_exception(exc)
+            raise
+        self.land(key)
+        flight.set_result(response)
+        return response
+
+    def key(self, request):
+        """Creates a key for a :class:`Request<wepay.middleware.Request>` or
+        returns `None` if it cannot be coalesced.
+
+        """
+        spec = get_spec(request.uri)
+        if spec is None or not spec.read_only:
+            return None
+        return (request.uri, json.dumps(request.params, sort_keys=True, default=str),
+                request.access_token, request.api_version)
+
+    def join(self, key, factory):
+        """Returns a tuple with a future of a call with ``key`` and whether it
+        is a new one created with ``factory``, which the caller has to make.
+
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.shared += 1
+                return flight, False
+            flight = self._flights[key] = factory()
+            self.calls += 1
+            return flight, True
+
+    def land(self, key):
+        """Marks a call with ``key`` as finished, so that identical calls made
+        from now on go to WePay.
+
+        """
+        with self._lock:
+            del self._flights[key]
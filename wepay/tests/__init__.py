@@ -1,5 +1,6 @@
-import unittest
+import json, threading, unittest
 from mock import MagicMock
+from six.moves import BaseHTTPServer, socketserver
 from wepay import WePay
 
 class CallBaseTestCase(unittest.TestCase):
@@ -33,3 +34,59 @@ class CallBaseTestCase(unittest.TestCase):
         self.assertEqual(allowed_params, expected_params)
 
         
+
+class StubServer(object):
+    """Local keep-alive HTTP server, that answers every POST with a JSON
+    response returned by ``handler(path, body)`` as a ``(status, dict)``
+    tuple. Setting ``keep_alive`` to ``False`` makes the server silently drop
+    connections after each response, just like idle connections are dropped by
+    real servers.
+
+    """
+
+    def __init__(self, handler=None):
+        self.handler = handler or (lambda path, body: (200, {'path': path}))
+        self.keep_alive = True
+        self.connections = 0
+        self.requests = []
+        stub = self
+
+        class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # send responses without delays caused by Nagle's algorithm
+            wbufsize = -1
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+                stub.connections += 1
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length).decode('utf-8'))
+                stub.requests.append((self.path, body))
+                status, response = stub.handler(self.path, body)
+                data = json.dumps(response).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                self.close_connection = not stub.keep_alive
+
+            def log_message(self, *args):
+                pass
+
+        class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+
+        self.server = Server(('127.0.0.1', 0), RequestHandler)
+        self.url = 'http://127.0.0.1:%s' % self.server.server_address[1]
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, args=(0.01,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,350 @@
+import asyncio, http.client, time, unittest
+from mock import MagicMock, patch
+from wepay.aio import AsyncWePay, AsyncConnectionPool, HAS_AIOHTTP
+from wepay.cache import LookupCache
+from wepay.exceptions import WePayClientError, WePayConnectionError, \
+    WePayServerError, WePayWarning
+from wepay.hedging import HedgePolicy
+from wepay.ipn import IPNReceiver
+from wepay.metrics import Metrics
+from wepay.objects import Checkout
+from wepay.ratelimit import RateLimiter
+from wepay.retry import RetryPolicy
+from wepay.singleflight import SingleFlight
+from wepay.tests import StubServer
+
+
+class AsyncWePayTestCase(unittest.TestCase):
+
+    use_aiohttp = False
+
+    def setUp(self):
+        self.server = StubServer()
+        self.api = AsyncWePay(production=False, access_token='dummy_access_token',
+                              use_aiohttp=self.use_aiohttp)
+        self.api.api_endpoint = self.server.url + '/v2'
+
+    def tearDown(self):
+        self.server.stop()
+
+    def run_async(self, coro):
+        async def wrapper():
+            async with self.api:
+                return await coro()
+        return asyncio.run(wrapper())
+
+    def test_calls(self):
+        async def calls():
+            return await asyncio.gather(
+                self.api.checkout(12345), self.api.account.find(name='foo'),
+                self.api.account.membership.create(54321, 'member_token'))
+        self.assertEqual(self.run_async(calls), [
+            {'path': '/v2/checkout'}, {'path': '/v2/account/find'},
+            {'path': '/v2/account/membership/create'}])
+        self.assertEqual(sorted(self.server.requests), [
+            ('/v2/account/find', {'name': 'foo'}),
+            ('/v2/account/membership/create', {
+                'account_id': 54321, 'member_access_token': 'member_token'}),
+            ('/v2/checkout', {'checkout_id': 12345})])
+
+    def test_connection_reuse(self):
+        async def calls():
+            for i in range(5):
+                await self.api.preapproval(i)
+            await asyncio.gather(*[self.api.checkout(i) for i in range(20)])
+        self.run_async(calls)
+        self.assertEqual(len(self.server.requests), 25)
+        self.assertTrue(self.server.connections <= 20)
+
+    def test_reconnect(self):
+        self.server.keep_alive = False
+        async def calls():
+            for i in range(3):
+                await self.api.checkout(i)
+        self.run_async(calls)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_batch_mode_and_validation(self):
+        self.assertEqual(self.api.checkout(12345, batch_mode=True),
+                         {'call': '/checkout', 'parameters': {'checkout_id': 12345}})
+        self.assertRaises(WePayWarning, self.api.checkout, 12345, foo='bar')
+
+    def test_errors(self):
+        self.server.handler = lambda path, body: (400, {
+            'error': 'invalid_request', 'error_code': 1004,
+            'error_description': 'client_id parameter is required'})
+        async def call():
+            return await self.api.app(None, None)
+        try:
+            self.run_async(call)
+        except WePayClientError as e:
+            self.assertEqual(e.status_code, 400)
+            self.assertEqual(e.error_code, 1004)
+        else:
+            self.fail("WePayClientError was not raised")
+        self.api.api_endpoint = 'http://127.0.0.1:1/v2'
+        self.assertRaises(WePayConnectionError, self.run_async, call)
+
+    def test_metrics(self):
+        self.api.metrics = Metrics()
+        async def calls():
+            await asyncio.gather(*[self.api.checkout(i) for i in range(3)])
+            self.api.api_endpoint = 'http://127.0.0.1:1/v2'
+            try:
+                await self.api.checkout(4)
+            except WePayConnectionError:
+                pass
+        self.run_async(calls)
+        summary = self.api.metrics.snapshot()['/checkout']
+        self.assertEqual(summary['count'], 4)
+        self.assertEqual(summary['errors'], 1)
+        self.assertEqual(summary['statuses'], {200: 3, None: 1})
+        self.assertEqual(summary['bytes_received'],
+                         3 * len(b'{"path": "/v2/checkout"}'))
+
+    def test_hedging(self):
+        self.api.hedge = HedgePolicy(delay=0.01, percentile=None)
+        cancelled = []
+        async def post(url, params, headers, timeout):
+            if not cancelled:
+                cancelled.append(False)
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    cancelled[0] = True
+                    raise
+            return {'url': url}
+        async def call():
+            with patch.object(self.api, '_post', post):
+                return await self.api.checkout(1)
+        self.assertEqual(self.run_async(call), {'url': self.api.api_endpoint +
+                                                '/checkout'})
+        self.assertEqual(cancelled, [True])
+        self.assertEqual(self.api.hedge.stats()['wins'], 1)
+
+    def test_hedging_metrics(self):
+        self.api.hedge = HedgePolicy(delay=0.01, percentile=None)
+        self.api.metrics = Metrics()
+        hook = self.api.metrics.register(MagicMock())
+        sent = []
+        async def post(url, params, headers, timeout, timing=None):
+            sent.append(timing)
+            timing.start()
+            if len(sent) == 1:
+                await asyncio.sleep(5)
+            timing.mark('network', received=10, status=200)
+            return {'url': url}
+        async def call():
+            with patch.object(self.api, '_post', post):
+                return await self.api.checkout(1)
+        self.run_async(call)
+        e = hook.call_args[0][0]
+        self.assertEqual((e.status, e.attempts, e.hedges), (200, 2, 1))
+        self.assertEqual(e.bytes_received, 10)
+
+    def test_single_flight(self):
+        self.api.single_flight = SingleFlight()
+        async def calls():
+            return await asyncio.gather(*[self.api.checkout(1) for _ in range(5)])
+        self.assertEqual(self.run_async(calls), [{'path': '/v2/checkout'}] * 5)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.api.single_flight.shared, 4)
+
+    def test_single_flight_cancelled_leader(self):
+        self.api.single_flight = SingleFlight()
+        handler = self.server.handler
+        def slow(path, body):
+            time.sleep(0.1)
+            return handler(path, body)
+        self.server.handler = slow
+        async def calls():
+            leader = asyncio.ensure_future(
+                asyncio.wait_for(self.api.checkout(1), 0.05))
+            await asyncio.sleep(0.01)
+            followers = asyncio.gather(*[self.api.checkout(1) for _ in range(3)])
+            with self.assertRaises(asyncio.TimeoutError):
+                await leader
+            return await followers
+        self.assertEqual(self.run_async(calls), [{'path': '/v2/checkout'}] * 3)
+        # followers made the call again only once
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_middleware(self):
+        self.api.cache = LookupCache()
+        async def sign(request, call_next):
+            request.headers['X-Signature'] = 'signed'
+            response = await call_next(request)
+            return dict(response, cached=request.cached)
+        self.api.middleware.append(sign)
+        async def calls():
+            return [await self.api.checkout(1) for _ in range(2)]
+        self.assertEqual(self.run_async(calls), [
+            {'path': '/v2/checkout', 'cached': False},
+            {'path': '/v2/checkout', 'cached': True}])
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_blocking_helpers(self):
+        self.assertRaises(TypeError, self.api.checkout.iter_find, 1)
+        self.assertRaises(TypeError, self.api.preapproval.iter_find)
+        self.assertRaises(TypeError, self.api.checkout.scan, 1, 0, 100)
+        self.assertRaises(TypeError, self.api.subscription_charge.scan, 1, 0, 100)
+        self.assertRaises(TypeError, self.api.batch.execute, 1, 'secret',
+                          [self.api.checkout(1, batch_mode=True)])
+        self.assertRaises(TypeError, self.api.batching, 1, 'secret')
+        self.assertEqual(self.server.requests, [])
+
+    def test_records(self):
+        self.api = AsyncWePay(production=False, use_aiohttp=self.use_aiohttp,
+                              records=True)
+        self.api.api_endpoint = self.server.url + '/v2'
+        async def calls():
+            return await self.api.checkout(1), await self.api.checkout.create(
+                1, 'short', 'goods', 10)
+        checkout, created = self.run_async(calls)
+        self.assertIsInstance(checkout, Checkout)
+        self.assertEqual(checkout['path'], '/v2/checkout')
+        self.assertIs(type(created), dict)
+
+
+@unittest.skipUnless(HAS_AIOHTTP, "aiohttp is not installed")
+class AiohttpWePayTestCase(AsyncWePayTestCase):
+
+    use_aiohttp = True
+
+    @unittest.skip("aiohttp drops idle connections itself after keepalive_timeout")
+    def test_reconnect(self):
+        pass
+
+
+class AsyncConnectionPoolTestCase(unittest.TestCase):
+
+    def serve(self, status_line=b'HTTP/1.1 200 OK', answered=None):
+        """Runs ``urlopen`` calls against a server, which answers with
+        ``status_line`` and drops a connection without a response after
+        ``answered`` requests were made on it.
+
+        """
+        async def handle(reader, writer):
+            count = 0
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = int(head.split(b'Content-Length: ')[1].split(b'\r\n')[0])
+                await reader.readexactly(length)
+                self.requests += 1
+                count += 1
+                if answered is not None and count > answered:
+                    writer.close()
+                    return
+                writer.write(status_line +
+                             b'\r\nContent-Length: 2\r\n\r\n{}')
+                await writer.drain()
+        async def run(calls):
+            self.requests = 0
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            url = 'http://127.0.0.1:%s/v2' % server.sockets[0].getsockname()[1]
+            pool = AsyncConnectionPool()
+            try:
+                return [await pool.urlopen(url + uri, b'{}', {}, **kwargs)
+                        for uri, kwargs in calls]
+            finally:
+                pool.close()
+                server.close()
+                await server.wait_closed()
+        return run
+
+    def test_empty_reason(self):
+        run = self.serve(status_line=b'HTTP/1.1 200')
+        responses = asyncio.run(run([('/checkout', {})] * 2))
+        self.assertEqual([response[:2] for response in responses],
+                         [(200, '')] * 2)
+        self.assertEqual(self.requests, 2)
+
+    def test_stale_connection(self):
+        run = self.serve(answered=1)
+        calls = [('/checkout/create', {})] * 2
+        # second request could have been processed, so it is not sent again
+        self.assertRaises(http.client.RemoteDisconnected, asyncio.run, run(calls))
+        self.assertEqual(self.requests, 2)
+        calls = [('/checkout/create', {}),
+                 ('/checkout/create', {'idempotent': True})]
+        self.assertEqual(len(asyncio.run(run(calls))), 2)
+        self.assertEqual(self.requests, 3)
+
+
+class AsyncRetryTestCase(unittest.TestCase):
+
+    def test_retry(self):
+        callback = MagicMock()
+        api = AsyncWePay(production=False, access_token='token', retry=RetryPolicy(
+            max_attempts=3, backoff=1, jitter=0, callback=callback))
+        results = [WePayServerError(None, 502), {'ok': True}]
+        async def post(*args):
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        api._post = post
+        with patch('wepay.aio.asyncio.sleep') as sleep:
+            async def no_sleep(delay):
+                pass
+            sleep.side_effect = no_sleep
+            self.assertEqual(asyncio.run(api.checkout(12345)), {'ok': True})
+            sleep.assert_called_once_with(1)
+        self.assertEqual(callback.call_args[0][1], 2)
+
+
+class AsyncRateLimitTestCase(unittest.TestCase):
+
+    @patch('wepay.ratelimit.time')
+    def test_rate_limit(self, time):
+        time.time.return_value = 1000.0
+        api = AsyncWePay(production=False, access_token='token',
+                         rate_limit=RateLimiter(token_rate=1))
+        async def post(*args):
+            return {}
+        api._post = post
+        with patch('wepay.aio.asyncio.sleep') as sleep:
+            async def no_sleep(delay):
+                pass
+            sleep.side_effect = no_sleep
+            async def calls():
+                await api.checkout(1)
+                await api.checkout(1)
+            asyncio.run(calls())
+            sleep.assert_called_once_with(1)
+        self.assertFalse(time.sleep.called)
+
+
+class IPNAppTestCase(unittest.TestCase):
+
+    def test_asgi(self):
+        receiver = IPNReceiver(MagicMock(), 123, 'secret')
+        receiver.notify = MagicMock()
+        receiver.close = MagicMock()
+        app = receiver.asgi()
+        async def request(scope, *messages):
+            sent = []
+            messages = list(messages)
+            async def receive():
+                return messages.pop(0)
+            async def send(message):
+                sent.append(message)
+            await app(scope, receive, send)
+            return sent
+        sent = asyncio.run(request(
+            {'type': 'http', 'method': 'POST',
+             'headers': [(b'content-type', b'application/x-www-form-urlencoded')]},
+            {'type': 'http.request', 'body': b'checkout_', 'more_body': True},
+            {'type': 'http.request', 'body': b'id=12345'}))
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertEqual(sent[1]['body'], b'OK')
+        receiver.notify.assert_called_once_with('checkout', 12345)
+        sent = asyncio.run(request({'type': 'http', 'method': 'GET'},
+                                   {'type': 'http.request'}))
+        self.assertEqual(sent[0]['status'], 405)
+        sent = asyncio.run(request({'type': 'lifespan'},
+                                   {'type': 'lifespan.startup'},
+                                   {'type': 'lifespan.shutdown'}))
+        self.assertEqual([message['type'] for message in sent], [
+            'lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        receiver.close.assert_called_once_with()
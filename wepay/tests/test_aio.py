@@ -0,0 +1,6 @@
+import sys
+
+# coroutine syntax does not even compile on older versions, so test cases of
+# wepay.aio live in a module, which is not discovered on its own
+if sys.version_info >= (3, 7):
+    from wepay.tests.aio_cases import *
@@ -1,10 +1,11 @@
-import unittest, warnings, requests
-from mock import MagicMock
+import subprocess, sys, unittest, warnings, requests
+from mock import MagicMock, patch
 from six.moves import urllib
 from wepay import WePay
-from wepay.calls.base import Call
+from wepay.calls.base import Call, SPECS, get_spec
 from wepay.exceptions import *
-from wepay.utils import cached_property
+from wepay.tests import StubServer
+from wepay.utils import Post, cached_property
 
 class ApiTestCase(unittest.TestCase):
 
@@ -106,6 +107,25 @@ class ApiTestCase(unittest.TestCase):
         utils.HAS_REQUESTS = has_requests
 
 
+    def test_requests_broken(self):
+        from wepay import utils
+        server = StubServer(lambda path, body: (200, {'app_id': 1}))
+        self.addCleanup(server.stop)
+        # library is found, but fails to import on the first call
+        with patch.multiple(utils, requests=None, HAS_REQUESTS=True), \
+                patch.dict(sys.modules, {'requests': None}):
+            api = WePay(production=False, use_requests=True)
+            api.api_endpoint = server.url + '/v2'
+            with warnings.catch_warnings(record=True) as w:
+                warnings.simplefilter("always")
+                self.assertEqual(api.call('/app'), {'app_id': 1})
+                self.assertEqual(api.call('/app'), {'app_id': 1})
+            self.assertEqual([warning.category for warning in w], [WePayWarning])
+            self.assertFalse(utils.HAS_REQUESTS)
+            self.assertIsNone(api._post._session)
+            api.close()
+
+
     def test_urllib_connection_error(self):
         api = WePay(production=False, use_requests=False, timeout=0.001)
         self.assertRaises(WePayConnectionError, api.call, '/app')
@@ -140,11 +160,115 @@ class ApiTestCase(unittest.TestCase):
             'https://stage.wepayapi.com/v2/user', {}, expected_headers, 30)
 
 
+    def test_session_reuse(self):
+        post = Post(pool_connections=3, pool_maxsize=7)
+        with patch('requests.Session') as Session:
+            session = Session.return_value
+            session.post.return_value.content = b'{"result": "success"}'
+            self.assertEqual(post('https://example.com/a', {}, {}, 10),
+                             {'result': 'success'})
+            post('https://example.com/b', {}, {}, 10)
+            Session.assert_called_once_with()
+            self.assertEqual(session.post.call_count, 2)
+            adapter = session.mount.call_args[0][1]
+            self.assertEqual(adapter._pool_connections, 3)
+            self.assertEqual(adapter._pool_maxsize, 7)
+            post.close()
+            session.close.assert_called_once_with()
+            post('https://example.com/a', {}, {}, 10)
+            self.assertEqual(Session.call_count, 2)
+
+
+    def test_pool_idle_timeout(self):
+        post = Post(pool_idle_timeout=60)
+        with patch('requests.Session') as Session, \
+             patch('wepay.utils.time.time') as now:
+            Session.return_value.post.return_value.content = b'{}'
+            now.return_value = 1000
+            post('https://example.com', {}, {}, 10)
+            now.return_value = 1050
+            post('https://example.com', {}, {}, 10)
+            Session.assert_called_once_with()
+            now.return_value = 1111
+            post('https://example.com', {}, {}, 10)
+            self.assertEqual(Session.call_count, 2)
+            Session.return_value.close.assert_called_once_with()
+
+
+    def test_close(self):
+        with WePay(production=False) as api:
+            api._post = MagicMock()
+        api._post.close.assert_called_once_with()
+
+
     def test_base_call(self):
         call = Call(self.api)
         self.assertRaises(NotImplementedError, lambda: call.call_name)
 
 
+    @unittest.skipIf(sys.version_info < (3, 7), "call modules are eager")
+    def test_lazy_imports(self):
+        output = subprocess.check_output([sys.executable, '-c', (
+            "import sys, wepay\n"
+            "from wepay.calls.base import get_spec\n"
+            "loaded = lambda: [name for name in ('requests', "
+            "'wepay.calls.account', 'wepay.calls.checkout') if name in sys.modules]\n"
+            "print(loaded())\n"
+            "wepay.WePay().account\n"
+            "print(get_spec('/checkout/find').read_only, loaded())\n")]).decode()
+        self.assertEqual(output.split('\n')[:2], [
+            "[]", "True ['wepay.calls.account', 'wepay.calls.checkout']"])
+
+
+    def test_call_specs(self):
+        spec = self.api.checkout.find.spec
+        self.assertIs(get_spec('/checkout/find'), spec)
+        self.assertEqual(spec.uri, '/checkout/find')
+        self.assertIn('shipping_fee', spec.allowed_params)
+        self.assertEqual(spec.floating, ('shipping_fee',))
+        self.assertEqual(spec.control_keywords,
+                         ('access_token', 'batch_mode', 'api_version', 'timeout'))
+        self.assertTrue(spec.batchable and spec.read_only)
+        spec = get_spec('/app')
+        self.assertIs(self.api.app.spec, spec)
+        self.assertEqual(spec.control_keywords,
+                         ('batch_mode', 'api_version', 'timeout'))
+        self.assertFalse(get_spec('/checkout/create').read_only)
+        self.assertIsNone(get_spec('/foo'))
+        # call methods attached after class creation still work
+        class Foo(Call):
+            call_name = 'foo'
+        def __bar(**kwargs):
+            return call.make_call(__bar, {}, kwargs)
+        __bar.allowed_params = ['baz']
+        call = Foo(self.api)
+        self.api.call = MagicMock()
+        __bar(baz=1, timeout=5)
+        self.api.call.assert_called_once_with(
+            '/foo/bar', params={'baz': 1}, timeout=5)
+
+
+    def test_spec_registry(self):
+        def define(allowed_params):
+            class Foo(Call):
+                call_name = 'foo_registry'
+                def __find(self, **kwargs):
+                    pass
+                __find.allowed_params = allowed_params
+                find = __find
+            return Foo
+        self.addCleanup(SPECS.pop, '/foo_registry/find', None)
+        # same class defined twice, as it happens when a module is imported
+        # under two names, shares its spec
+        first, second = define(['a']), define(['a'])
+        self.assertIs(first.find.spec, second.find.spec)
+        self.assertIs(get_spec('/foo_registry/find'), first.find.spec)
+        # changed definition replaces it
+        third = define(['a', 'b'])
+        self.assertIs(get_spec('/foo_registry/find'), third.find.spec)
+        self.assertEqual(third.find.spec.param_names, ('a', 'b'))
+
+
     def test_cached_property(self):
         class T(object):
             @cached_property
@@ -0,0 +1,133 @@
+import threading, time
+from wepay.exceptions import WePayClientError, WePayServerError, \
+    WePayConnectionError
+from wepay.tests import CallBaseTestCase
+
+
+def batch_response(uri, params=None, **kwargs):
+    calls = []
+    for call in params['calls']:
+        parameters = call.get('parameters', {})
+        if parameters.get('checkout_id') == 0:
+            response = {'error': 'invalid_request', 'error_code': 1012,
+                        'error_description': "checkout not found"}
+        elif parameters.get('checkout_id') == -1:
+            response = {'error': 'processing_error', 'error_code': 1008,
+                        'error_description': "unknown error"}
+        else:
+            response = dict(parameters, call=call['call'],
+                            authorization=call.get('authorization'))
+        calls.append({'call': call['call'], 'reference_id': call['reference_id'],
+                      'response': response})
+    return {'calls': calls}
+
+
+class AutoBatchTestCase(CallBaseTestCase):
+
+    def setUp(self):
+        super(AutoBatchTestCase, self).setUp()
+        self.api.access_token = 'default_token'
+        self.api.call.side_effect = batch_response
+
+    def test_batching(self):
+        with self.api.batching(123, 'secret') as batch:
+            self.assertIs(self.api.auto_batch, batch)
+            f1 = self.api.checkout(12345)
+            f2 = self.api.account(54321, access_token='other_token')
+            f3 = self.api.checkout.find(54321, batch_reference_id='ref')
+            self.assertFalse(self.api.call.called)
+        self.assertIsNone(self.api.auto_batch)
+        self.assertEqual(self.api.call.call_count, 1)
+        args, kwargs = self.api.call.call_args
+        self.assertEqual(args, ('/batch/create',))
+        self.assertEqual(kwargs['params']['client_id'], 123)
+        self.assertEqual(len(kwargs['params']['calls']), 3)
+        self.assertEqual(f1.result(), {'call': '/checkout', 'checkout_id': 12345,
+                                       'authorization': 'default_token'})
+        self.assertEqual(f2.result(), {'call': '/account', 'account_id': 54321,
+                                       'authorization': 'other_token'})
+        self.assertEqual(f3.result()['call'], '/checkout/find')
+
+    def test_errors(self):
+        with self.api.batching(123, 'secret'):
+            f1 = self.api.checkout(0)
+            f2 = self.api.checkout(-1)
+            f3 = self.api.checkout(1)
+        self.assertRaises(WePayClientError, f1.result)
+        self.assertEqual(f1.exception().error_code, 1012)
+        self.assertRaises(WePayServerError, f2.result)
+        self.assertEqual(f3.result()['checkout_id'], 1)
+        self.api.call.side_effect = WePayConnectionError(Exception("timeout"))
+        with self.api.batching(123, 'secret'):
+            f1 = self.api.checkout(1)
+        self.assertRaises(WePayConnectionError, f1.result)
+
+    def test_max_calls_and_result(self):
+        with self.api.batching(123, 'secret', max_calls=2):
+            futures = [self.api.checkout(i) for i in range(1, 6)]
+            self.assertEqual(self.api.call.call_count, 2)
+            # waiting on a future flushes the queue
+            self.assertEqual(futures[-1].result()['checkout_id'], 5)
+            self.assertEqual(self.api.call.call_count, 3)
+        self.assertEqual(self.api.call.call_count, 3)
+        self.assertEqual([f.result()['checkout_id'] for f in futures], [1, 2, 3, 4, 5])
+
+    def test_window(self):
+        batch = self.api.batching(123, 'secret', window=0.01)
+        futures = []
+        def worker(i):
+            with batch:
+                futures.append(self.api.checkout(i))
+                time.sleep(0.05)
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(1, 5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.api.call.call_count, 1)
+        self.assertEqual(sorted(f.result()['checkout_id'] for f in futures),
+                         [1, 2, 3, 4])
+
+    def test_not_batchable(self):
+        self.api.call.side_effect = None
+        self.api.call.return_value = {'client_id': 123}
+        with self.api.batching(123, 'secret'):
+            f1 = self.api.checkout(1, timeout=10)
+            f2 = self.api.app(123, 'secret', batch_mode=True)
+        self.assertEqual(f1.result(), {'client_id': 123})
+        self.assertEqual(f2, {'call': '/app', 'parameters': {
+            'client_id': 123, 'client_secret': 'secret'}})
+        self.api.call.assert_called_once_with(
+            '/checkout', params={'checkout_id': 1}, timeout=10)
+
+
+class BatchExecutorTestCase(CallBaseTestCase):
+
+    def setUp(self):
+        super(BatchExecutorTestCase, self).setUp()
+        self.api.call.side_effect = batch_response
+
+    def test_execute(self):
+        calls = [self.api.checkout(i, batch_mode=True) for i in range(1, 121)]
+        calls[7]['reference_id'] = 'chunk_0'
+        result = self.api.batch.execute(123, 'secret', calls, max_workers=3)
+        self.assertEqual(self.api.call.call_count, 3)
+        for args, kwargs in self.api.call.call_args_list:
+            self.assertEqual(args, ('/batch/create',))
+            self.assertTrue(len(kwargs['params']['calls']) <= 50)
+        self.assertEqual([sub['response']['checkout_id'] for sub in result['calls']],
+                         list(range(1, 121)))
+        self.assertEqual(len(result.references), 120)
+        self.assertEqual(result.response('chunk_0')['checkout_id'], 8)
+        self.assertEqual([(chunk.index, chunk.size) for chunk in result.chunks],
+                         [(0, 50), (1, 50), (2, 20)])
+        # original calls are left untouched
+        self.assertNotIn('reference_id', calls[0])
+
+    def test_execute_error(self):
+        self.api.call.side_effect = WePayConnectionError(Exception("timeout"))
+        calls = [self.api.checkout(i, batch_mode=True) for i in range(1, 70)]
+        self.assertRaises(WePayConnectionError, self.api.batch.execute,
+                          123, 'secret', calls, chunk_size=10)
+        self.assertRaises(AssertionError, self.api.batch.execute,
+                          123, 'secret', calls, chunk_size=51)
@@ -0,0 +1,80 @@
+import itertools, threading, time, unittest
+from mock import MagicMock
+from wepay import WePay
+from wepay.bulk import MapResult, imap
+from wepay.exceptions import WePayClientError
+from wepay.ratelimit import RateLimiter
+from wepay.tests import StubServer
+
+
+class MapTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubServer(lambda path, body: (
+            (404, {'error': 'invalid_request', 'error_code': 4004,
+                   'error_description': 'checkout not found'})
+            if body.get('checkout_id') == 13 else (200, body)))
+        self.api = WePay(production=False, access_token='token')
+        self.api.api_endpoint = self.server.url + '/v2'
+
+    def tearDown(self):
+        self.api.close()
+        self.server.stop()
+
+    def test_ordered(self):
+        results = list(self.api.map(self.api.checkout, range(30), max_workers=4))
+        self.assertEqual([r.index for r in results], list(range(30)))
+        self.assertEqual(results[1], MapResult(1, (1,), {'checkout_id': 1}, None))
+        failed = results[13]
+        self.assertIsNone(failed.response)
+        self.assertIsInstance(failed.error, WePayClientError)
+        self.assertEqual(failed.error.error_code, 4004)
+        self.assertEqual(len(self.server.requests), 30)
+        # connections are shared between threads and reused
+        self.assertTrue(self.server.connections <= 4)
+
+    def test_kwargs_and_tuples(self):
+        results = list(self.api.map(
+            self.api.checkout.find, [(1,), (2,)], ordered=False, limit=5))
+        self.assertEqual(sorted(r.response['account_id'] for r in results), [1, 2])
+        self.assertTrue(all(r.response['limit'] == 5 for r in results))
+
+    def test_rate_limit(self):
+        self.api.rate_limit = RateLimiter(rate=100, burst=1)
+        started = time.time()
+        results = list(self.api.map(self.api.checkout, range(11)))
+        self.assertTrue(time.time() - started >= 0.09)
+        self.assertTrue(all(r.error is None for r in results))
+
+
+class ImapTestCase(unittest.TestCase):
+
+    def test_unordered(self):
+        release = threading.Event()
+        def fn(i):
+            if i == 0:
+                release.wait(5)
+            return i * 2
+        results = imap(fn, range(4), max_workers=2, ordered=False)
+        self.assertEqual(sorted(next(results).index for _ in range(3)), [1, 2, 3])
+        release.set()
+        self.assertEqual(list(results), [MapResult(0, (0,), 0, None)])
+
+    def test_lazy_and_cancelled(self):
+        consumed = itertools.count()
+        def arguments():
+            for i in range(1000):
+                next(consumed)
+                yield i
+        fn = MagicMock(side_effect=lambda i: i)
+        results = imap(fn, arguments(), max_workers=2)
+        self.assertEqual(next(results).response, 0)
+        self.assertTrue(next(consumed) <= 6)
+        results.close()
+        time.sleep(0.05)
+        self.assertTrue(fn.call_count <= 6)
+
+    def test_async(self):
+        from wepay.aio import AsyncWePay
+        api = AsyncWePay(production=False)
+        self.assertRaises(TypeError, api.map, api.checkout, [1])
@@ -0,0 +1,161 @@
+import unittest
+from mock import MagicMock, patch
+from wepay import WePay
+from wepay.cache import LookupCache
+
+
+class LookupCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = LookupCache(maxsize=2, ttls={'/checkout': 10, '/account': 60})
+        self.api = WePay(production=False, access_token='token', cache=self.cache)
+        self.api._post = MagicMock(side_effect=lambda url, params, headers, timeout:
+                                   dict(params, url=url))
+
+    def test_read_through(self):
+        response = self.api.checkout(12345)
+        self.assertEqual(response['checkout_id'], 12345)
+        response['state'] = 'modified'
+        self.assertEqual(self.api.checkout(12345), {
+            'checkout_id': 12345, 'url': 'https://stage.wepayapi.com/v2/checkout'})
+        self.assertEqual(self.api._post.call_count, 1)
+        # different token, version and params are cached separately
+        self.api.checkout(12345, access_token='other_token')
+        self.api.checkout(12345, api_version='2015-09-09')
+        self.api.checkout(54321)
+        self.assertEqual(self.api._post.call_count, 4)
+        # not cached endpoints
+        self.api.preapproval(12345)
+        self.api.preapproval(12345)
+        self.api.checkout.find(54321)
+        self.api.checkout.find(54321)
+        self.assertEqual(self.api._post.call_count, 8)
+        self.assertEqual(self.cache.stats(), {
+            'hits': 1, 'misses': 4, 'evictions': 2, 'invalidations': 0,
+            'size': 2})
+
+    def test_ttl(self):
+        with patch('wepay.cache.time.time') as now:
+            now.return_value = 1000
+            self.api.checkout(1)
+            self.api.account(2)
+            now.return_value = 1009
+            self.api.checkout(1)
+            self.api.account(2)
+            self.assertEqual(self.api._post.call_count, 2)
+            now.return_value = 1011
+            self.api.checkout(1)
+            self.api.account(2)
+            self.assertEqual(self.api._post.call_count, 3)
+        self.assertEqual(self.cache.stats(), {
+            'hits': 3, 'misses': 3, 'evictions': 1, 'invalidations': 0,
+            'size': 2})
+
+    def test_lru(self):
+        self.api.checkout(1)
+        self.api.checkout(2)
+        self.api.checkout(1)
+        self.api.checkout(3) # evicts 2
+        self.api.checkout(1)
+        self.assertEqual(self.api._post.call_count, 3)
+        self.api.checkout(2)
+        self.assertEqual(self.api._post.call_count, 4)
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+
+    def test_invalidation(self):
+        self.cache.ttls['/preapproval'] = 10
+        self.cache.maxsize = 10
+        self.api.checkout(1)
+        self.api.checkout(1, access_token='other_token')
+        self.api.checkout(2)
+        self.api.preapproval(1)
+        self.assertEqual(len(self.cache), 4)
+        self.api.preapproval(1)
+        self.api.checkout(1)
+        self.api.checkout(1, access_token='other_token')
+        self.api.checkout(2)
+        self.assertEqual(self.api._post.call_count, 4)
+        # read-only calls do not invalidate
+        self.api.checkout.find(54321)
+        self.api.account.balance(1)
+        self.assertEqual(len(self.cache), 4)
+        self.api.checkout.refund(1, 'reason')
+        self.assertEqual(len(self.cache), 2)
+        self.api.checkout(1)
+        self.assertEqual(self.api._post.call_count, 8)
+        self.api.preapproval.cancel(1)
+        self.assertEqual(self.cache.stats()['invalidations'], 3)
+
+    def test_refresh(self):
+        self.cache.maxsize = 10
+        self.api._post.side_effect = lambda url, params, headers, timeout: \
+            dict(params, state='new')
+        self.api.checkout(1)
+        self.api.checkout.modify(1, callback_uri='https://example.com')
+        self.assertEqual(self.api.checkout(1), {
+            'checkout_id': 1, 'callback_uri': 'https://example.com', 'state': 'new'})
+        self.assertEqual(self.api._post.call_count, 2)
+        # failed calls evict objects as well
+        from wepay.exceptions import WePayServerError
+        self.api._post.side_effect = WePayServerError(None, 500)
+        self.assertRaises(WePayServerError, self.api.checkout.cancel, 1, 'reason')
+        self.assertEqual(len(self.cache), 0)
+
+    def test_id_types(self):
+        self.cache.maxsize = 10
+        self.api._post.side_effect = lambda url, params, headers, timeout: \
+            dict(params, checkout_id=int(params['checkout_id']), state='new')
+        self.api.checkout('123')
+        self.api.checkout(123)
+        self.assertEqual(len(self.cache), 2)
+        self.api.checkout.refund(123, 'reason')
+        self.assertEqual(len(self.cache), 0)
+        # refreshed object is found by a lookup with an ID, as WePay returns it
+        self.api.checkout.modify('123', callback_uri='https://example.com')
+        self.assertEqual(self.api.checkout(123)['callback_uri'],
+                         'https://example.com')
+        self.assertEqual(self.api._post.call_count, 4)
+
+    def test_invalidation_during_lookup(self):
+        self.cache.maxsize = 3
+        def post(url, params, headers, timeout):
+            if url.endswith('/checkout') and params['checkout_id'] == 1:
+                # refund of the object is made while its lookup is in flight
+                self.cache.invalidate('/checkout/refund', {'checkout_id': 1})
+            return dict(params, url=url)
+        self.api._post.side_effect = post
+        self.api.checkout(1)
+        self.assertEqual(len(self.cache), 0)
+        self.api.checkout(1)
+        self.assertEqual(self.api._post.call_count, 2)
+        # lookups of other objects and later ones are cached
+        self.api._post.side_effect = lambda url, params, headers, timeout: params
+        self.api.checkout(2)
+        generation = self.cache.generation()
+        self.api.checkout(1)
+        self.assertEqual(len(self.cache), 2)
+        # once too many objects changed, older lookups are not trusted
+        for i in range(3, 7):
+            self.cache.invalidate('/checkout/refund', {'checkout_id': i})
+        key = self.cache.key('/checkout', {'checkout_id': 7})
+        self.cache.set(key, {'checkout_id': 7}, generation)
+        self.assertEqual(self.cache.get(key), (False, None))
+        self.cache.set(key, {'checkout_id': 7}, self.cache.generation())
+        self.assertEqual(self.cache.get(key), (True, {'checkout_id': 7}))
+
+    def test_batch_invalidation(self):
+        self.cache.maxsize = 10
+        self.api.checkout(1)
+        self.api.checkout(2)
+        self.api.account(3)
+        calls = [self.api.checkout.capture(1, batch_mode=True, batch_reference_id='a'),
+                 self.api.account.modify(3, batch_mode=True, batch_reference_id='b',
+                                         name='New Name')]
+        self.api._post.side_effect = lambda url, params, headers, timeout: {
+            'calls': [{'reference_id': 'a', 'response': {'checkout_id': 1}},
+                      {'reference_id': 'b', 'response': {'account_id': 3,
+                                                         'name': 'New Name'}}]}
+        self.api.batch.create(123, 'secret', calls)
+        self.assertEqual(self.api.account(3), {'account_id': 3, 'name': 'New Name'})
+        self.assertEqual(len(self.cache), 2)
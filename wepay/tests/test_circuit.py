@@ -0,0 +1,82 @@
+import unittest
+from mock import MagicMock, patch
+from wepay import WePay
+from wepay.circuit import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from wepay.exceptions import WePayClientError, WePayServerError, \
+    WePayConnectionError, WePayCircuitOpenError
+from wepay.retry import RetryPolicy
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        time_patcher = patch('wepay.circuit.time.time')
+        self.now = time_patcher.start()
+        self.addCleanup(time_patcher.stop)
+        self.now.return_value = 1000
+        self.callback = MagicMock()
+        self.breaker = CircuitBreaker(failure_rate=0.5, min_calls=4, window=10,
+                                      reset_timeout=5, callback=self.callback)
+        self.api = WePay(production=False, access_token='token',
+                         breaker=self.breaker)
+        self.api._post = MagicMock(return_value={})
+
+    def failing(self, exc, times=1):
+        self.api._post.side_effect = exc
+        for _ in range(times):
+            self.assertRaises(type(exc), self.api.checkout, 12345)
+        self.api._post.side_effect = None
+
+    def test_open(self):
+        self.api.checkout(1)
+        self.failing(WePayClientError(None, 400))
+        self.failing(WePayServerError(None, 500))
+        self.assertEqual(self.breaker.state('/checkout/find'), CLOSED)
+        self.failing(WePayConnectionError(None))
+        self.assertEqual(self.breaker.state('/checkout/find'), OPEN)
+        self.assertEqual(self.breaker.state('/account'), CLOSED)
+        self.api._post.reset_mock()
+        with self.assertRaises(WePayCircuitOpenError) as cm:
+            self.api.checkout.find(54321)
+        self.assertEqual(cm.exception.group, '/checkout')
+        self.assertEqual(cm.exception.retry_after, 5)
+        self.api.account(1)
+        self.assertEqual(self.api._post.call_count, 1)
+        self.callback.assert_called_once_with('/checkout', CLOSED, OPEN)
+
+    def test_window(self):
+        self.failing(WePayServerError(None, 500), times=2)
+        self.now.return_value = 1011
+        self.api.checkout(1)
+        self.api.checkout(1)
+        self.failing(WePayServerError(None, 500))
+        # earlier failures are out of the window
+        self.assertEqual(self.breaker.state('/checkout'), CLOSED)
+        self.failing(WePayServerError(None, 500))
+        self.assertEqual(self.breaker.state('/checkout'), OPEN)
+
+    def test_half_open(self):
+        self.failing(WePayServerError(None, 500), times=4)
+        self.now.return_value = 1005
+        self.assertEqual(self.breaker.state('/checkout'), HALF_OPEN)
+        # failed probe opens the circuit again
+        self.failing(WePayServerError(None, 500))
+        self.assertRaises(WePayCircuitOpenError, self.api.checkout, 1)
+        self.now.return_value = 1010
+        # only one probe at a time
+        self.breaker.before('/checkout')
+        self.assertRaises(WePayCircuitOpenError, self.api.checkout, 1)
+        self.breaker.record('/checkout')
+        self.assertEqual(self.breaker.state('/checkout'), CLOSED)
+        self.api.checkout(1)
+        self.assertEqual([c[0][1:] for c in self.callback.call_args_list], [
+            (CLOSED, OPEN), (OPEN, HALF_OPEN), (HALF_OPEN, OPEN),
+            (OPEN, HALF_OPEN), (HALF_OPEN, CLOSED)])
+
+    def test_no_retry_while_open(self):
+        self.api.retry = RetryPolicy(max_attempts=10, backoff=0)
+        self.api._post.side_effect = WePayServerError(None, 500)
+        with self.assertRaises(WePayCircuitOpenError) as cm:
+            self.api.checkout(1)
+        self.assertEqual(cm.exception.attempts, 5)
+        self.assertEqual(self.api._post.call_count, 4)
@@ -0,0 +1,57 @@
+import decimal, unittest
+from mock import patch
+from wepay import WePay, codec
+from wepay.codec import JSONCodec, OrjsonCodec, SimplejsonCodec, get_codec
+from wepay.tests import StubServer
+
+
+class CodecTestCase(unittest.TestCase):
+
+    def test_codecs(self):
+        obj = {'checkout_id': 1, 'amount': 10.25, 'fee': decimal.Decimal('0.5'),
+               'short_description': u'ф'}
+        expected = dict(obj, fee=0.5)
+        for codec_class in codec.CODECS:
+            if not codec_class.available:
+                continue
+            c = codec_class()
+            data = c.dumps(obj)
+            self.assertIsInstance(data, bytes)
+            self.assertEqual(c.loads(data), expected)
+            self.assertRaises(ValueError, c.loads, b'{"foo":')
+
+    def test_decimal(self):
+        c = JSONCodec(use_decimal=True)
+        response = c.loads(b'{"amount": 10.10, "checkout_id": 12345}')
+        self.assertEqual(response['amount'], decimal.Decimal('10.10'))
+        self.assertEqual(response['checkout_id'], 12345)
+        self.assertRaises(ValueError, OrjsonCodec, use_decimal=True)
+
+    def test_get_codec(self):
+        c = JSONCodec()
+        self.assertIs(get_codec(c), c)
+        self.assertIsInstance(get_codec('json'), JSONCodec)
+        self.assertRaises(ValueError, get_codec, 'foo')
+        with patch.object(OrjsonCodec, 'available', True), \
+             patch.object(SimplejsonCodec, 'available', False):
+            self.assertIsInstance(get_codec(), OrjsonCodec)
+            self.assertIs(type(get_codec(use_decimal=True)), JSONCodec)
+            self.assertTrue(get_codec(use_decimal=True).use_decimal)
+        with patch.object(SimplejsonCodec, 'available', False):
+            self.assertRaises(ValueError, get_codec, 'simplejson')
+
+    def test_api(self):
+        server = StubServer()
+        server.handler = lambda path, body: (200, {'amount': 10.1, 'body': body})
+        try:
+            for use_requests in (True, False):
+                api = WePay(production=False, use_requests=use_requests,
+                            codec='json', use_decimal=True)
+                api.api_endpoint = server.url + '/v2'
+                with api:
+                    response = api.call(
+                        '/checkout', {'amount': decimal.Decimal('5.5')})
+                self.assertEqual(response['amount'], decimal.Decimal('10.1'))
+                self.assertEqual(response['body'], {'amount': decimal.Decimal('5.5')})
+        finally:
+            server.stop()
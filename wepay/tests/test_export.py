@@ -0,0 +1,113 @@
+import csv, io, json, unittest
+from wepay.export import COLUMNS, Column, HAS_NUMPY, HAS_PYARROW, \
+    make_columns, iter_batches, iter_arrays, write_csv, write_arrow
+
+
+def checkouts(count):
+    for i in range(count):
+        checkout = {'checkout_id': i, 'state': 'captured', 'amount': i + 0.5,
+                    'fee': {'app_fee': 0.1, 'fee_payer': 'payee'},
+                    'in_review': False, 'create_time': 1463589119}
+        if i % 2:
+            checkout['fee'] = None
+            del checkout['amount']
+        yield checkout
+
+
+class ExportTestCase(unittest.TestCase):
+
+    columns = ['checkout_id', ('amount', 'f8'), ('fee.app_fee', 'f8'),
+               ('state', 'U16'), ('in_review', '?')]
+
+    def test_make_columns(self):
+        self.assertEqual(make_columns(['fee.app_fee', ('amount', 'f8')]), [
+            Column('fee_app_fee', ('fee', 'app_fee'), None),
+            Column('amount', ('amount',), 'f8')])
+        self.assertIs(make_columns(COLUMNS['checkout'])[0],
+                      COLUMNS['checkout'][0])
+
+    def test_batches(self):
+        consumed = []
+        def rows():
+            for row in checkouts(5):
+                consumed.append(row['checkout_id'])
+                yield row
+        batches = iter_batches(rows(), self.columns, batch_size=2)
+        self.assertEqual(next(batches), [
+            [0, 1], [0.5, None], [0.1, None], ['captured'] * 2, [False] * 2])
+        # rows are consumed one batch at a time
+        self.assertEqual(consumed, [0, 1])
+        self.assertEqual([len(batch[0]) for batch in batches], [2, 1])
+
+    def test_csv(self):
+        fileobj = io.StringIO() if str is not bytes else io.BytesIO()
+        self.assertEqual(write_csv(checkouts(3), fileobj, self.columns,
+                                   batch_size=2), 3)
+        self.assertEqual(fileobj.getvalue().splitlines(), [
+            'checkout_id,amount,fee_app_fee,state,in_review',
+            '0,0.5,0.1,captured,False', '1,,,captured,False',
+            '2,2.5,0.1,captured,False'])
+        fileobj = io.StringIO() if str is not bytes else io.BytesIO()
+        self.assertEqual(write_csv([], fileobj, self.columns, header=False), 0)
+        self.assertEqual(fileobj.getvalue(), '')
+
+    def test_csv_nested(self):
+        fileobj = io.StringIO() if str is not bytes else io.BytesIO()
+        write_csv(checkouts(2), fileobj, ['checkout_id', 'fee'], codec='json',
+                  header=False)
+        fileobj.seek(0)
+        rows = list(csv.reader(fileobj))
+        self.assertEqual(json.loads(rows[0][1]),
+                         {'app_fee': 0.1, 'fee_payer': 'payee'})
+        self.assertEqual(rows[1], ['1', ''])
+
+    @unittest.skipUnless(HAS_NUMPY, "numpy is not installed")
+    def test_arrays(self):
+        arrays = list(iter_arrays(checkouts(5), self.columns, batch_size=4))
+        self.assertEqual([len(array) for array in arrays], [4, 1])
+        array = arrays[0]
+        self.assertEqual(list(array['checkout_id']), [0, 1, 2, 3])
+        self.assertEqual(array['amount'][2], 2.5)
+        self.assertTrue(array['fee_app_fee'][1] != array['fee_app_fee'][1])
+        self.assertEqual(array.dtype['state'].str[1:], 'U16')
+        self.assertEqual(array.dtype['checkout_id'].kind, 'O')
+
+    @unittest.skipUnless(HAS_PYARROW, "pyarrow is not installed")
+    def test_arrow(self):
+        import pyarrow, pyarrow.parquet
+        for format in ('parquet', 'arrow'):
+            sink = pyarrow.BufferOutputStream()
+            self.assertEqual(write_arrow(checkouts(5), sink, COLUMNS['checkout'],
+                                         batch_size=2, format=format), 5)
+            buf = pyarrow.BufferReader(sink.getvalue())
+            if format == 'parquet':
+                table = pyarrow.parquet.read_table(buf)
+            else:
+                table = pyarrow.ipc.open_file(buf).read_all()
+            self.assertEqual(table.num_rows, 5)
+            self.assertEqual(table.column('amount').to_pylist(),
+                             [0.5, None, 2.5, None, 4.5])
+            self.assertEqual(table.schema.field('fee_app_fee').type,
+                             pyarrow.float64())
+        self.assertRaises(ValueError, write_arrow, [], 'foo', self.columns,
+                          format='orc')
+
+    @unittest.skipUnless(HAS_PYARROW, "pyarrow is not installed")
+    def test_arrow_schema(self):
+        import pyarrow
+        rows = [{'checkout_id': 1}, {'checkout_id': 2, 'reference_id': 'ref'}]
+        for format in ('parquet', 'arrow'):
+            # optional field is missing from the whole first batch
+            sink = pyarrow.BufferOutputStream()
+            self.assertEqual(write_arrow(rows, sink, ['checkout_id', 'reference_id'],
+                                         batch_size=1, format=format), 2)
+            buf = pyarrow.BufferReader(sink.getvalue())
+            if format == 'parquet':
+                from pyarrow import parquet
+                table = parquet.read_table(buf)
+            else:
+                table = pyarrow.ipc.open_file(buf).read_all()
+            self.assertEqual(table.to_pydict(), {
+                'checkout_id': ['1', '2'], 'reference_id': [None, 'ref']})
+            sink = pyarrow.BufferOutputStream()
+            self.assertEqual(write_arrow([], sink, self.columns, format=format), 0)
@@ -0,0 +1,129 @@
+import threading, time, unittest
+from mock import MagicMock
+from wepay import WePay
+from wepay.exceptions import WePayServerError, WePayConnectionError
+from wepay.hedging import HedgePolicy
+from wepay.metrics import Metrics
+
+
+class HedgePolicyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = HedgePolicy(delay=0.01, percentile=None)
+        self.addCleanup(self.policy.close)
+        self.api = WePay(production=False, access_token='token',
+                         hedge=self.policy)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.responses = []
+
+    def post(self, *responses):
+        """Makes n-th request return n-th of ``responses``, where `None` blocks
+        until the test is over.
+
+        """
+        lock = threading.Lock()
+        responses = list(responses)
+        def post(url, params, headers, timeout, timing=None):
+            with lock:
+                response = responses.pop(0)
+            if response is None:
+                self.release.wait(5)
+                return {'slow': True}
+            if isinstance(response, Exception):
+                raise response
+            return response
+        self.api._post = MagicMock(side_effect=post)
+
+    def release_later(self):
+        timer = threading.Timer(0.1, self.release.set)
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+    def test_hedge_wins(self):
+        self.post(None, {'checkout_id': 1})
+        self.assertEqual(self.api.checkout(1), {'checkout_id': 1})
+        self.assertEqual(self.api._post.call_count, 2)
+        first, second = self.api._post.call_args_list
+        self.assertEqual(first, second)
+        self.assertEqual(self.policy.stats(), {'calls': 1, 'hedges': 1, 'wins': 1})
+
+    def test_metrics(self):
+        self.api.metrics = Metrics()
+        hook = self.api.metrics.register(MagicMock())
+        self.post(None, {'checkout_id': 1})
+        self.assertEqual(self.api.checkout(1), {'checkout_id': 1})
+        e = hook.call_args[0][0]
+        self.assertEqual((e.attempts, e.hedges, e.error), (2, 1, None))
+        self.assertEqual(self.api.metrics.snapshot()['/checkout']['hedges'], 1)
+        self.post({'checkout_id': 1})
+        self.api.checkout(1)
+        e = hook.call_args[0][0]
+        self.assertEqual((e.attempts, e.hedges), (1, 0))
+
+    def test_fast_primary(self):
+        self.post({'checkout_id': 1})
+        self.assertEqual(self.api.account.balance(1), {'checkout_id': 1})
+        self.assertEqual(self.api._post.call_count, 1)
+        self.assertEqual(self.policy.stats(), {'calls': 1, 'hedges': 0, 'wins': 0})
+
+    def test_mutating_calls(self):
+        self.assertFalse(self.policy.hedgeable('/checkout/create'))
+        self.assertFalse(self.policy.hedgeable('/foo'))
+        self.assertTrue(self.policy.hedgeable('/checkout/find'))
+        self.post({'checkout_id': 1})
+        self.api.checkout.cancel(1, 'reason')
+        self.assertEqual(self.api._post.call_count, 1)
+        self.assertIsNone(self.policy._executor)
+
+    def test_errors(self):
+        # hedge is sent while the primary request hangs, and fails
+        self.post(None, WePayServerError(None, 500))
+        self.release_later()
+        self.assertEqual(self.api.checkout(1), {'slow': True})
+        # primary fails before the delay, nothing to wait for
+        self.post(WePayConnectionError(None))
+        self.assertRaises(WePayConnectionError, self.api.checkout, 1)
+        self.policy.delay = 0
+        self.post(WePayServerError(None, 503), WePayServerError(None, 500))
+        with self.assertRaises(WePayServerError) as cm:
+            self.api.checkout(1)
+        self.assertIn(cm.exception.status_code, (500, 503))
+
+    def test_busy_threads(self):
+        # requests waiting for a free thread are neither late nor hedged
+        policy = HedgePolicy(delay=0.1, percentile=None, max_workers=4)
+        self.addCleanup(policy.close)
+        api = WePay(production=False, access_token='token', hedge=policy)
+        def post(url, params, headers, timeout):
+            time.sleep(0.01)
+            return {'checkout_id': params['checkout_id']}
+        api._post = MagicMock(side_effect=post)
+        threads = [threading.Thread(target=api.checkout, args=(i,))
+                   for i in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(api._post.call_count, 16)
+        self.assertEqual(policy.stats(), {'calls': 16, 'hedges': 0, 'wins': 0})
+        self.assertEqual(policy._active, 0)
+        # all threads are taken by hanging requests, so a duplicate is not sent
+        self.policy.max_workers = 1
+        self.post(None)
+        self.release_later()
+        self.assertEqual(self.api.checkout(1), {'slow': True})
+        self.assertEqual(self.api._post.call_count, 1)
+        self.assertEqual(self.policy.stats()['hedges'], 0)
+
+    def test_percentile_delay(self):
+        policy = HedgePolicy(delay=1, percentile=90, min_samples=10, window=20)
+        for i in range(9):
+            policy.record('/checkout', i / 100.0)
+        self.assertEqual(policy.hedge_delay('/checkout'), 1)
+        policy.record('/checkout', 0.09)
+        self.assertEqual(policy.hedge_delay('/checkout'), 0.09)
+        for i in range(20):
+            policy.record('/checkout', 0.5)
+        self.assertEqual(policy.hedge_delay('/checkout'), 0.5)
+        self.assertEqual(policy.hedge_delay('/account'), 1)
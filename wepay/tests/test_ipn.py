@@ -0,0 +1,119 @@
+import io, json, threading
+from wepay.exceptions import WePayClientError
+from wepay.ipn import IPNReceiver
+from wepay.tests import CallBaseTestCase
+from wepay.tests.test_batching import batch_response
+
+
+class IPNReceiverTestCase(CallBaseTestCase):
+
+    def setUp(self):
+        super(IPNReceiverTestCase, self).setUp()
+        self.api.access_token = 'default_token'
+        self.api.call.side_effect = batch_response
+        self.receiver = IPNReceiver(self.api, 123, 'secret', window=0.01)
+        self.addCleanup(self.receiver.close)
+        self.received = []
+        self.done = threading.Event()
+        @self.receiver.handler()
+        def handler(ipn):
+            self.received.append(ipn)
+            self.done.set()
+
+    def wsgi(self, body, method='POST',
+             content_type='application/x-www-form-urlencoded'):
+        body = body.encode('utf-8')
+        started = []
+        result = self.receiver({
+            'REQUEST_METHOD': method, 'CONTENT_TYPE': content_type,
+            'CONTENT_LENGTH': str(len(body)), 'wsgi.input': io.BytesIO(body)
+        }, lambda status, headers: started.append(status))
+        return started[0], b''.join(result)
+
+    def test_wsgi(self):
+        self.assertEqual(self.wsgi('checkout_id=12345'), ('200 OK', b'OK'))
+        self.assertTrue(self.done.wait(5))
+        self.assertEqual(self.api.call.call_count, 1)
+        ipn = self.received[0]
+        self.assertEqual((ipn.type, ipn.id, ipn.error), ('checkout', 12345, None))
+        self.assertEqual(ipn.object, {'call': '/checkout', 'checkout_id': 12345,
+                                      'authorization': 'default_token'})
+        self.assertEqual(self.wsgi('', method='GET')[0], '405 Method Not Allowed')
+        self.assertEqual(self.wsgi('foo=bar')[0], '400 Bad Request')
+        self.assertEqual(self.wsgi('checkout_id=foo')[0], '400 Bad Request')
+        # notifications about objects, which are not looked up
+        self.assertEqual(self.wsgi('user_id=5')[0], '200 OK')
+        self.assertEqual(self.wsgi('credit_card_id=6')[0], '200 OK')
+        self.assertEqual(self.receiver.received, 1)
+        self.assertEqual(self.wsgi(json.dumps({'account_id': 1}),
+                                   content_type='application/json')[0], '200 OK')
+
+    def test_dedupe_and_batching(self):
+        self.receiver.window = 5
+        self.receiver.max_calls = 4
+        self.assertTrue(self.receiver.notify('checkout', 1))
+        self.assertFalse(self.receiver.notify('checkout', 1))
+        self.assertTrue(self.receiver.notify('account', 1))
+        self.assertTrue(self.receiver.notify('subscription_charge', 1))
+        self.assertFalse(self.receiver.notify('account', 1))
+        self.assertTrue(self.receiver.notify('checkout', 0))
+        self.assertTrue(self.done.wait(5))
+        self.receiver.close()
+        self.assertEqual((self.receiver.received, self.receiver.duplicates), (6, 2))
+        # all lookups went in a single /batch/create once max_calls was reached
+        self.assertEqual(self.api.call.call_count, 1)
+        self.assertEqual(len(self.received), 4)
+        failed = [ipn for ipn in self.received if ipn.error is not None]
+        self.assertEqual([(ipn.type, ipn.id) for ipn in failed], [('checkout', 0)])
+        self.assertIsInstance(failed[0].error, WePayClientError)
+        self.assertIsNone(failed[0].object)
+        self.assertRaises(RuntimeError, self.receiver.notify, 'checkout', 2)
+
+    def test_notify_after_lookup(self):
+        states = iter(['authorized', 'captured'])
+        def lookup(call, params=None, **kwargs):
+            response = batch_response(call, params=params, **kwargs)
+            for item in response['calls']:
+                item['response']['state'] = next(states)
+            return response
+        self.api.call.side_effect = lookup
+        self.receiver.window = 5
+        self.assertTrue(self.receiver.notify('checkout', 1))
+        self.receiver.flush()
+        # object could have changed since it was looked up
+        self.assertTrue(self.receiver.notify('checkout', 1))
+        self.receiver.close()
+        self.assertEqual(self.receiver.duplicates, 0)
+        self.assertEqual([ipn.object['state'] for ipn in self.received],
+                         ['authorized', 'captured'])
+
+    def test_handlers_and_tokens(self):
+        self.receiver.access_token = lambda object_type, object_id: (
+            'token_%s' % object_id)
+        accounts = []
+        self.receiver.register(accounts.append, 'account', 'withdrawal')
+        @self.receiver.handler('checkout')
+        def broken(ipn):
+            raise ValueError(ipn)
+        self.assertRaises(ValueError, self.receiver.register, len, 'user')
+        self.receiver.notify('checkout', 1)
+        self.receiver.notify('account', 2)
+        self.receiver.notify('withdrawal', 3)
+        self.receiver.close()
+        self.assertEqual(len(self.received), 3)
+        self.assertEqual([(ipn.type, ipn.object['authorization'])
+                          for ipn in accounts],
+                         [('account', 'token_2'), ('withdrawal', 'token_3')])
+
+    def test_parse(self):
+        parse = self.receiver.parse
+        self.assertEqual(parse('', b'preapproval_id=5&foo=bar'), ('preapproval', 5))
+        self.assertEqual(parse('', 'subscription_id=1&subscription_charge_id=2'),
+                         ('subscription_charge', 2))
+        self.assertEqual(parse('application/json', b'{"withdrawal_id": "7"}'),
+                         ('withdrawal', 7))
+        self.assertEqual(parse('', b'user_id=5'), ('user', 5))
+        self.assertEqual(parse('', b'credit_card_id=6&foo_id=7'), ('credit_card', 6))
+        self.assertIsNone(parse('', b'user_id=foo'))
+        self.assertIsNone(parse('application/json', b'[1]'))
+        self.assertIsNone(parse('application/json', b'{'))
@@ -0,0 +1,193 @@
+import socket, unittest
+from mock import MagicMock, patch
+from wepay import WePay
+from wepay.cache import LookupCache
+from wepay.exceptions import WePayServerError, WePayConnectionError
+from wepay.metrics import Metrics, Histogram, CallEvent, StatsdHook, \
+    PrometheusHook, HAS_PROMETHEUS
+from wepay.retry import RetryPolicy
+from wepay.tests import StubServer
+
+
+def event(uri='/checkout', elapsed=0.1, status=200, error=None, cached=False,
+          hedges=0):
+    return CallEvent(uri, status, error, elapsed, 0, elapsed, 0, 10, 100,
+                     0 if cached else 1 + hedges, cached, hedges)
+
+
+class HistogramTestCase(unittest.TestCase):
+
+    def test_quantiles(self):
+        histogram = Histogram(buckets=(0.1, 0.2, 0.4, float('inf')))
+        self.assertIsNone(histogram.quantile(0.5))
+        for elapsed in [0.05] * 50 + [0.15] * 40 + [0.3] * 9 + [5]:
+            histogram.add(event(elapsed=elapsed))
+        self.assertEqual(histogram.counts, [50, 40, 9, 1])
+        self.assertAlmostEqual(histogram.quantile(0.5), 0.1)
+        self.assertAlmostEqual(histogram.quantile(0.7), 0.15)
+        self.assertAlmostEqual(histogram.quantile(0.99), 0.4)
+        self.assertAlmostEqual(histogram.quantile(1), 0.4)
+
+    def test_summary(self):
+        histogram = Histogram()
+        histogram.add(event())
+        histogram.add(event(status=500, error=WePayServerError(None, 500)))
+        histogram.add(event(status=None, cached=True))
+        summary = histogram.summary()
+        self.assertEqual(summary['count'], 3)
+        self.assertEqual(summary['errors'], 1)
+        self.assertEqual(summary['cached'], 1)
+        self.assertEqual(summary['statuses'], {200: 1, 500: 1, None: 1})
+        self.assertEqual(summary['bytes_received'], 300)
+        self.assertAlmostEqual(summary['mean'], 0.1)
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+        self.hook = self.metrics.register(MagicMock())
+        self.api = WePay(production=False, access_token='token',
+                         metrics=self.metrics)
+        self.server = StubServer(lambda path, body: (200, {'checkout_id': 1}))
+        self.api.api_endpoint = self.server.url + '/v2'
+
+    def tearDown(self):
+        self.api.close()
+        self.server.stop()
+
+    def test_events(self):
+        for use_requests in (True, False):
+            self.api = WePay(production=False, access_token='token',
+                             use_requests=use_requests, metrics=self.metrics)
+            self.api.api_endpoint = self.server.url + '/v2'
+            self.hook.reset_mock()
+            self.api.checkout(1)
+            e = self.hook.call_args[0][0]
+            self.assertEqual(e.uri, '/checkout')
+            self.assertEqual(e.status, 200)
+            self.assertIsNone(e.error)
+            self.assertEqual(e.attempts, 1)
+            self.assertFalse(e.cached)
+            self.assertEqual(e.bytes_sent, len(
+                self.api._post.codec.dumps({'checkout_id': 1})))
+            self.assertEqual(e.bytes_received, len(b'{"checkout_id": 1}'))
+            self.assertTrue(e.network > 0)
+            self.assertTrue(e.elapsed >= e.encode + e.network + e.decode)
+            self.api.close()
+        self.assertEqual(self.metrics.snapshot()['/checkout']['count'], 2)
+
+    def test_errors_and_retries(self):
+        self.server.handler = lambda path, body: (
+            503, {'error': 'server_error', 'error_code': 1000,
+                  'error_description': 'unavailable'})
+        self.api.retry = RetryPolicy(max_attempts=3, backoff=0, jitter=0)
+        self.assertRaises(WePayServerError, self.api.checkout, 1)
+        e = self.hook.call_args[0][0]
+        self.assertEqual(e.status, 503)
+        self.assertIsInstance(e.error, WePayServerError)
+        self.assertEqual(e.attempts, 3)
+        self.api._post = MagicMock(side_effect=WePayConnectionError(None))
+        self.api.retry = None
+        self.assertRaises(WePayConnectionError, self.api.checkout.find, 1)
+        e = self.hook.call_args[0][0]
+        self.assertIsNone(e.status)
+        self.assertIsInstance(e.error, WePayConnectionError)
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot['/checkout']['errors'], 1)
+        self.assertEqual(snapshot['/checkout']['statuses'], {503: 1})
+        self.assertEqual(snapshot['/checkout/find']['errors'], 1)
+        self.assertEqual(self.metrics.histogram('/checkout/find').count, 1)
+        self.assertIsNone(self.metrics.histogram('/account'))
+        self.metrics.reset()
+        self.assertEqual(self.metrics.snapshot(), {})
+
+    def test_cached(self):
+        self.api.cache = LookupCache()
+        self.api.checkout(1)
+        self.api.checkout(1)
+        e = self.hook.call_args[0][0]
+        self.assertTrue(e.cached)
+        self.assertEqual(e.attempts, 0)
+        self.assertEqual(self.metrics.snapshot()['/checkout']['cached'], 1)
+
+    def test_disabled(self):
+        api = WePay(production=False)
+        api._post = MagicMock(return_value={})
+        api.checkout(1)
+        # timing is not passed to transport
+        self.assertEqual(len(api._post.call_args[0]), 4)
+
+    def test_failing_hook(self):
+        self.hook.side_effect = socket.error("statsd is down")
+        with patch('wepay.metrics.logger') as logger:
+            self.assertEqual(self.api.checkout(1), {'checkout_id': 1})
+            self.server.handler = lambda path, body: (
+                503, {'error': 'server_error', 'error_code': 1000,
+                      'error_description': 'unavailable'})
+            # the real error is not replaced by the hook's one
+            self.assertRaises(WePayServerError, self.api.checkout, 1)
+        self.assertEqual(logger.exception.call_count, 2)
+        self.assertEqual(self.metrics.snapshot()['/checkout']['count'], 2)
+
+    def test_no_aggregation(self):
+        metrics = Metrics(hooks=[self.hook], aggregate=False)
+        metrics.emit(event())
+        self.hook.assert_called_once_with(event())
+        self.assertEqual(metrics.snapshot(), {})
+        metrics.unregister(self.hook)
+        metrics.emit(event())
+        self.assertEqual(self.hook.call_count, 1)
+
+
+class StatsdHookTestCase(unittest.TestCase):
+
+    def test_client(self):
+        client = MagicMock()
+        hook = StatsdHook(client=client, prefix='app')
+        hook(event('/checkout/find', elapsed=0.25,
+                   error=WePayServerError(None, 500)))
+        client.timing.assert_called_once_with('app.checkout.find.time', 250)
+        self.assertEqual([c[0][0] for c in client.incr.call_args_list],
+                         ['app.checkout.find.calls', 'app.checkout.find.errors'])
+        client.reset_mock()
+        hook(event('/checkout/find', hedges=2))
+        self.assertEqual(client.incr.call_args_list[-1][0],
+                         ('app.checkout.find.hedges', 2))
+
+    def test_udp(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', 0))
+        sock.settimeout(5)
+        self.addCleanup(sock.close)
+        hook = StatsdHook(host='127.0.0.1', port=sock.getsockname()[1])
+        hook(event('/checkout', elapsed=0.01, cached=True))
+        self.assertEqual(sock.recv(1024).decode('utf-8').split('\n'), [
+            'wepay.checkout.time:10.000|ms', 'wepay.checkout.calls:1|c',
+            'wepay.checkout.cached:1|c'])
+
+
+@unittest.skipUnless(HAS_PROMETHEUS, "prometheus_client is not installed")
+class PrometheusHookTestCase(unittest.TestCase):
+
+    def test_hook(self):
+        import prometheus_client
+        registry = prometheus_client.CollectorRegistry()
+        hook = PrometheusHook(registry=registry)
+        hook(event('/checkout', elapsed=0.2))
+        hook(event('/checkout', elapsed=0.3, status=500,
+                   error=WePayServerError(None, 500)))
+        sample = registry.get_sample_value
+        self.assertEqual(sample('wepay_call_duration_seconds_count',
+                                {'endpoint': '/checkout'}), 2)
+        self.assertEqual(sample('wepay_call_errors_total',
+                                {'endpoint': '/checkout', 'status': '500'}), 1)
+        self.assertEqual(sample('wepay_bytes_received_total',
+                                {'endpoint': '/checkout'}), 200)
+
+
+class PrometheusMissingTestCase(unittest.TestCase):
+
+    def test_missing(self):
+        with patch('wepay.metrics.HAS_PROMETHEUS', False):
+            self.assertRaises(ImportError, PrometheusHook)
@@ -0,0 +1,87 @@
+import unittest
+from mock import MagicMock
+from wepay import WePay
+from wepay.cache import LookupCache
+from wepay.exceptions import WePayServerError
+from wepay.metrics import Metrics
+from wepay.middleware import Request, compose, CacheMiddleware, \
+    MetricsMiddleware, RetryMiddleware
+from wepay.retry import RetryPolicy
+
+
+class MiddlewareTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.api = WePay(production=False, access_token='token')
+        self.api._post = MagicMock(return_value={'checkout_id': 1})
+        self.seen = []
+
+    def tracing(self, name):
+        def middleware(request, call_next):
+            self.seen.append((name, request.uri))
+            return call_next(request)
+        return middleware
+
+    def test_order_and_transform(self):
+        def sign(request, call_next):
+            request.headers['X-Signature'] = 'signed'
+            request.params = dict(request.params, extra=True)
+            request.timeout = 5
+            response = call_next(request)
+            return dict(response, signed=True)
+        self.api.middleware = [self.tracing('first'), sign, self.tracing('last')]
+        self.assertEqual(self.api.checkout(1), {'checkout_id': 1, 'signed': True})
+        self.assertEqual(self.seen, [('first', '/checkout'), ('last', '/checkout')])
+        url, params, headers, timeout = self.api._post.call_args[0]
+        self.assertEqual(url, 'https://stage.wepayapi.com/v2/checkout')
+        self.assertEqual(params, {'checkout_id': 1, 'extra': True})
+        self.assertEqual(headers['X-Signature'], 'signed')
+        self.assertEqual(headers['Authorization'], 'Bearer token')
+        self.assertEqual(timeout, 5)
+
+    def test_short_circuit(self):
+        def stub(request, call_next):
+            return {'stubbed': request.uri}
+        self.api.middleware.append(stub)
+        self.assertEqual(self.api.checkout.find(1), {'stubbed': '/checkout/find'})
+        self.assertFalse(self.api._post.called)
+        self.api.middleware.remove(stub)
+        self.assertEqual(self.api.checkout(1), {'checkout_id': 1})
+
+    def test_builtin_middleware(self):
+        self.api.middleware.append(self.tracing('user'))
+        self.api.cache = LookupCache()
+        self.api.metrics = Metrics()
+        self.api.retry = RetryPolicy(backoff=0)
+        self.api._post.side_effect = [WePayServerError(None, 500), {'checkout_id': 1}]
+        self.assertEqual(self.api.checkout(1), {'checkout_id': 1})
+        self.assertEqual(self.api.checkout(1), {'checkout_id': 1})
+        # user middleware is outermost, retry is below the cache
+        self.assertEqual(len(self.seen), 2)
+        self.assertEqual(self.api._post.call_count, 2)
+        summary = self.api.metrics.snapshot()['/checkout']
+        self.assertEqual((summary['count'], summary['cached']), (2, 1))
+        chain = self.api._chain
+        self.api.checkout(1)
+        self.assertIs(self.api._chain, chain)
+        self.api.cache = None
+        self.api._post.side_effect = None
+        self.api.checkout(1)
+        self.assertIsNot(self.api._chain, chain)
+        self.assertEqual(self.api._post.call_count, 3)
+
+    def test_compose(self):
+        request = Request('/checkout', 'url', {}, {}, 10, 'token')
+        handler = compose([MetricsMiddleware(Metrics()), RetryMiddleware(
+            RetryPolicy(backoff=0))], lambda request: request.timing)
+        self.assertIsNotNone(handler(request))
+        self.assertEqual(repr(request), '<Request /checkout>')
+        cache = CacheMiddleware(LookupCache())
+        response = {'checkout_id': 1}
+        self.assertEqual(compose([cache], lambda request: response)(request),
+                         response)
+        self.assertFalse(request.cached)
+        # served from the cache without reaching the handler
+        self.assertEqual(compose([cache], None)(request), response)
+        self.assertTrue(request.cached)
+
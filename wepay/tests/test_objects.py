@@ -0,0 +1,92 @@
+import copy, json, pickle, unittest
+from wepay import WePay
+from wepay.codec import get_codec
+from wepay.objects import Checkout, Account, Record, decode_records, split_array
+from wepay.tests import StubServer
+
+
+CHECKOUT = {'checkout_id': 1, 'state': 'captured', 'amount': 10.5,
+            'payer': {'name': 'Bob', 'note': '}]"{['}, 'new_field': [1, {}]}
+
+
+class RecordTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.codec = get_codec('json')
+        self.raw = json.dumps(CHECKOUT).encode('utf-8')
+
+    def test_lazy(self):
+        record = Checkout(raw=self.raw, codec=self.codec)
+        self.assertIsNotNone(record._raw)
+        self.assertEqual(record.state, 'captured')
+        self.assertIsNone(record._raw)
+        self.assertEqual(record['payer']['name'], 'Bob')
+        self.assertIsNone(record.payment_error)
+        self.assertRaises(KeyError, lambda: record['payment_error'])
+        self.assertRaises(AttributeError, lambda: record.foo)
+        self.assertEqual(Checkout(raw=self.raw, codec=self.codec)['new_field'],
+                         [1, {}])
+
+    def test_mapping(self):
+        record = Checkout(CHECKOUT)
+        self.assertEqual(record, CHECKOUT)
+        self.assertEqual(CHECKOUT, record)
+        self.assertEqual(len(record), 5)
+        self.assertEqual(set(record), set(CHECKOUT))
+        self.assertEqual(record.to_dict(), CHECKOUT)
+        self.assertEqual(record.get('gross', 0), 0)
+        self.assertTrue('new_field' in record)
+        record['gross'] = 11
+        record['other'] = 'x'
+        self.assertEqual((record.gross, record['other']), (11, 'x'))
+        del record['gross'], record['other']
+        self.assertRaises(KeyError, record.__delitem__, 'gross')
+        self.assertRaises(KeyError, record.__delitem__, 'other')
+        self.assertEqual(record, CHECKOUT)
+        self.assertFalse(hasattr(record, '__dict__'))
+        self.assertEqual(copy.deepcopy(record), CHECKOUT)
+        self.assertIsInstance(pickle.loads(pickle.dumps(record)), Checkout)
+        self.assertEqual(repr(Record({'a': 1})), "Record({'a': 1})")
+
+    def test_decode(self):
+        page = json.dumps([CHECKOUT, dict(CHECKOUT, checkout_id=2)]).encode('utf-8')
+        records = decode_records('https://wepayapi.com/v2/checkout/find', page,
+                                 self.codec)
+        self.assertEqual([type(record) for record in records], [Checkout] * 2)
+        self.assertEqual([record.checkout_id for record in records], [1, 2])
+        self.assertIsInstance(
+            decode_records('http://127.0.0.1/v2/account', b'{"account_id": 1}'),
+            Account)
+        self.assertEqual(decode_records('https://wepayapi.com/v2/checkout/create',
+                                        self.raw, self.codec), CHECKOUT)
+        self.assertEqual(
+            decode_records('https://wepayapi.com/v2/checkout/find', b'[]'), [])
+        self.assertEqual(split_array(b' [{"a": "]"} , {"b": [{}]}]  '),
+                         [b'{"a": "]"}', b'{"b": [{}]}'])
+        self.assertRaises(ValueError, split_array, b'[{"a": [}]')
+
+
+class RecordsApiTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubServer(lambda path, body: (200, (
+            [dict(CHECKOUT, checkout_id=i) for i in range(3)]
+            if path.endswith('/find') else dict(CHECKOUT, **body))))
+        self.addCleanup(self.server.stop)
+
+    def check(self, use_requests):
+        api = WePay(production=False, use_requests=use_requests, records=True)
+        api.api_endpoint = self.server.url + '/v2'
+        self.addCleanup(api.close)
+        checkout = api.checkout(7)
+        self.assertIsInstance(checkout, Checkout)
+        self.assertEqual(checkout.checkout_id, 7)
+        self.assertEqual([c.checkout_id for c in api.checkout.find(1)], [0, 1, 2])
+        self.assertIs(type(api.checkout.modify(7)), dict)
+        self.assertIs(type(WePay(production=False)._post.records), type(None))
+
+    def test_urllib(self):
+        self.check(False)
+
+    def test_requests(self):
+        self.check(True)
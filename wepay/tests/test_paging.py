@@ -0,0 +1,90 @@
+import threading
+from wepay.tests import CallBaseTestCase
+
+
+def find_response(total):
+    def response(uri, params=None, **kwargs):
+        start, limit = params['start'], params['limit']
+        return [{'id': i} for i in range(start, min(start + limit, total))]
+    return response
+
+
+class PagingTestCase(CallBaseTestCase):
+
+    def test_iter_find(self):
+        self.api.call.side_effect = find_response(120)
+        objs = self.api.checkout.iter_find(54321, state='captured')
+        self.assertFalse(self.api.call.called)
+        self.assertEqual(next(objs), {'id': 0})
+        self.assertEqual(self.api.call.call_count, 1)
+        self.assertEqual([obj['id'] for obj in objs], list(range(1, 120)))
+        self.assertEqual(
+            [(args, kwargs['params']['start']) for args, kwargs in
+             self.api.call.call_args_list],
+            [(('/checkout/find',), 0), (('/checkout/find',), 50),
+             (('/checkout/find',), 100)])
+        self.api.call.assert_called_with('/checkout/find', params={
+            'account_id': 54321, 'state': 'captured', 'start': 100, 'limit': 50})
+
+    def test_iter_find_limits(self):
+        self.api.call.side_effect = find_response(40)
+        self.assertEqual(len(list(self.api.credit_card.iter_find(
+            123, 'secret', start=5, limit=10))), 35)
+        self.assertEqual(self.api.call.call_count, 4)
+        self.api.call.reset_mock()
+        self.assertEqual(len(list(self.api.preapproval.iter_find(page_size=20))), 40)
+        # last page is empty
+        self.assertEqual(self.api.call.call_count, 3)
+
+    def test_iter_find_prefetch(self):
+        threads = set()
+        def response(uri, params=None, **kwargs):
+            threads.add(threading.current_thread())
+            return find_response(75)(uri, params=params)
+        self.api.call.side_effect = response
+        objs = self.api.subscription_charge.iter_find(12345, prefetch=True)
+        self.assertEqual(next(objs), {'id': 0})
+        self.assertEqual([obj['id'] for obj in objs], list(range(1, 75)))
+        self.assertEqual(self.api.call.call_count, 2)
+        self.assertIn(threading.current_thread(), threads)
+        self.assertEqual(len(threads), 2)
+
+    def test_iter_find_batch_mode(self):
+        self.assertRaises(AssertionError, list, self.api.withdrawal.iter_find(
+            54321, batch_mode=True))
+
+
+class ScanTestCase(CallBaseTestCase):
+
+    def setUp(self):
+        super(ScanTestCase, self).setUp()
+        # dense burst of objects at 1000 and sparse ones afterwards
+        self.objs = [{'checkout_id': i, 'create_time': 1000} for i in range(120)] + \
+            [{'checkout_id': i, 'create_time': i * 10} for i in range(120, 400)]
+        self.lock = threading.Lock()
+        def response(uri, params=None, **kwargs):
+            found = [obj for obj in self.objs if params['start_time'] <=
+                     obj['create_time'] <= params['end_time']]
+            return found[params['start']:params['start'] + params['limit']]
+        self.api.call.side_effect = response
+
+    def test_scan(self):
+        objs = list(self.api.checkout.scan(
+            54321, 0, 4000, shards=4, max_workers=3, state='captured'))
+        self.assertEqual(sorted(obj['checkout_id'] for obj in objs),
+                         list(range(400)))
+        windows = set()
+        for args, kwargs in self.api.call.call_args_list:
+            params = kwargs['params']
+            self.assertEqual(params['state'], 'captured')
+            self.assertTrue(params['end_time'] - params['start_time'] <= 1000)
+            windows.add((params['start_time'], params['end_time']))
+        # one second window with dense objects was paged through
+        self.assertIn((999, 1000), windows)
+        self.assertTrue(len(windows) > 4)
+
+    def test_scan_close(self):
+        objs = self.api.subscription.scan(12345, 1200, 4000, shards=8)
+        self.assertIn('checkout_id', next(objs))
+        objs.close()
+        self.assertTrue(self.api.call.call_count <= 8)
@@ -0,0 +1,73 @@
+import unittest
+from mock import MagicMock, patch
+from wepay import WePay
+from wepay.exceptions import WePayRateLimitError
+from wepay.ratelimit import RateLimiter
+
+
+class RateLimiterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        time_patcher = patch('wepay.ratelimit.time')
+        self.time = time_patcher.start()
+        self.addCleanup(time_patcher.stop)
+        self.time.time.return_value = 1000.0
+        self.time.sleep.side_effect = self.sleep
+
+    def sleep(self, delay):
+        self.time.time.return_value += delay
+
+    def test_global_bucket(self):
+        limiter = RateLimiter(rate=2, burst=3)
+        self.assertEqual([limiter.acquire() for _ in range(3)], [0, 0, 0])
+        self.assertEqual(limiter.acquire(), 0.5)
+        self.assertEqual(limiter.acquire(), 0.5)
+        self.time.time.return_value += 10
+        # refilled up to the burst only
+        self.assertEqual([limiter.acquire() for _ in range(4)], [0, 0, 0, 0.5])
+
+    def test_token_buckets(self):
+        limiter = RateLimiter(rate=10, burst=10, token_rate=1, token_burst=2)
+        for token in ('a', 'b', 'a', 'b'):
+            self.assertEqual(limiter.acquire(token), 0)
+        self.assertEqual(limiter.reserve('a'), 1)
+        self.assertEqual(limiter.reserve('a'), 2)
+        self.assertEqual(limiter.reserve('c'), 0)
+        self.assertEqual(limiter.stats(), {'tokens': 3, 'throttled': 2})
+        # global bucket is used by all tokens
+        self.assertEqual(limiter.reserve('d'), 0)
+        self.assertEqual(limiter.reserve('e'), 0)
+        self.assertEqual(limiter.reserve('f'), 0)
+        self.assertAlmostEqual(limiter.reserve('g'), 0.1)
+
+    def test_non_blocking(self):
+        limiter = RateLimiter(token_rate=1, blocking=False)
+        limiter.acquire('a')
+        with self.assertRaises(WePayRateLimitError) as cm:
+            limiter.acquire('a')
+        self.assertEqual(cm.exception.delay, 1)
+        self.assertIn('1.000 seconds', str(cm.exception))
+        # no token was taken by the failed attempt
+        self.assertEqual(limiter.acquire('a', blocking=True), 1)
+        limiter = RateLimiter(token_rate=1, timeout=1.5)
+        limiter.reserve('a')
+        limiter.reserve('a')
+        self.assertRaises(WePayRateLimitError, limiter.reserve, 'a')
+        self.assertEqual(limiter.reserve('a', timeout=2), 2)
+
+    def test_max_tokens(self):
+        limiter = RateLimiter(token_rate=1, max_tokens=2)
+        limiter.acquire('a')
+        limiter.acquire('b')
+        limiter.acquire('a')
+        limiter.acquire('c') # drops 'b'
+        self.assertEqual(list(limiter._buckets), ['a', 'c'])
+
+    def test_api(self):
+        limiter = RateLimiter(token_rate=1, blocking=False)
+        api = WePay(production=False, access_token='token', rate_limit=limiter)
+        api._post = MagicMock(return_value={})
+        api.checkout(1)
+        api.checkout(1, access_token='other')
+        self.assertRaises(WePayRateLimitError, api.checkout, 1)
+        self.assertEqual(api._post.call_count, 2)
@@ -0,0 +1,75 @@
+import unittest
+from mock import MagicMock, patch
+from wepay import WePay
+from wepay.exceptions import WePayClientError, WePayServerError, \
+    WePayConnectionError
+from wepay.retry import RetryPolicy
+
+
+class RetryPolicyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.callback = MagicMock()
+        self.policy = RetryPolicy(max_attempts=3, backoff=1, jitter=0,
+                                  callback=self.callback)
+        self.api = WePay(production=False, access_token='token', retry=self.policy)
+        self.api._post = MagicMock()
+        sleep_patcher = patch('wepay.retry.time.sleep')
+        self.sleep = sleep_patcher.start()
+        self.addCleanup(sleep_patcher.stop)
+
+    def test_delay(self):
+        policy = RetryPolicy(backoff=0.5, multiplier=2, max_backoff=3, jitter=0)
+        self.assertEqual([policy.delay(n) for n in range(1, 6)],
+                         [0.5, 1, 2, 3, 3])
+        policy.jitter = 1
+        for n in range(1, 6):
+            self.assertTrue(0 <= policy.delay(n) <= 3)
+
+    def test_retry_read_only(self):
+        self.api._post.side_effect = [
+            WePayServerError(None, 503), WePayConnectionError(None), {'ok': True}]
+        self.assertEqual(self.api.checkout(12345), {'ok': True})
+        self.assertEqual(self.api._post.call_count, 3)
+        self.assertEqual([c[0][0] for c in self.sleep.call_args_list], [1, 2])
+        uri, attempts, elapsed, exc = self.callback.call_args[0]
+        self.assertEqual((uri, attempts, exc), ('/checkout', 3, None))
+
+    def test_give_up(self):
+        self.api._post.side_effect = WePayServerError(None, 500)
+        with self.assertRaises(WePayServerError) as cm:
+            self.api.checkout.find(12345)
+        self.assertEqual(cm.exception.attempts, 3)
+        self.assertTrue(cm.exception.elapsed >= 0)
+        self.assertEqual(self.api._post.call_count, 3)
+        self.callback.assert_called_once_with(
+            '/checkout/find', 3, cm.exception.elapsed, cm.exception)
+
+    def test_not_retryable(self):
+        # mutating call without unique_id
+        self.api._post.side_effect = WePayServerError(None, 500)
+        with self.assertRaises(WePayServerError) as cm:
+            self.api.checkout.create(1, 'short', 'GOODS', 10)
+        self.assertEqual(cm.exception.attempts, 1)
+        # client errors
+        self.api._post.reset_mock()
+        self.api._post.side_effect = WePayClientError(None, 400)
+        self.assertRaises(WePayClientError, self.api.checkout, 12345)
+        self.assertEqual(self.api._post.call_count, 1)
+        self.assertFalse(self.sleep.called)
+
+    def test_idempotent_and_throttled(self):
+        self.api._post.side_effect = [WePayServerError(None, 500), {'ok': True}]
+        self.assertEqual(self.api.checkout.create(
+            1, 'short', 'GOODS', 10, unique_id='abc'), {'ok': True})
+        self.api._post.side_effect = [WePayClientError(None, 429), {'ok': True}]
+        self.assertEqual(self.api.checkout.cancel(1, 'reason'), {'ok': True})
+        self.assertEqual(self.api._post.call_count, 4)
+
+    def test_deadline(self):
+        self.policy.deadline = 1.5
+        self.api._post.side_effect = WePayConnectionError(None)
+        with self.assertRaises(WePayConnectionError) as cm:
+            self.api.checkout(12345)
+        # second delay of 2 seconds would exceed the deadline
+        self.assertEqual(cm.exception.attempts, 2)
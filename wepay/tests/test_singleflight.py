@@ -0,0 +1,83 @@
+import threading, time, unittest
+from mock import MagicMock
+from wepay import WePay
+from wepay.cache import LookupCache
+from wepay.exceptions import WePayServerError
+from wepay.singleflight import SingleFlight
+
+
+class SingleFlightTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.group = SingleFlight()
+        self.api = WePay(production=False, access_token='token',
+                         single_flight=self.group)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.started = threading.Event()
+        self.response = {'checkout_id': 1, 'state': 'captured'}
+        def post(url, params, headers, timeout):
+            self.started.set()
+            self.release.wait(5)
+            if isinstance(self.response, Exception):
+                raise self.response
+            return dict(self.response)
+        self.api._post = MagicMock(side_effect=post)
+
+    def burst(self, call, count=10):
+        results = [None] * count
+        def worker(i):
+            try:
+                results[i] = call()
+            except Exception as exc:
+                results[i] = exc
+        threads = [threading.Thread(target=worker, args=(i,))
+                   for i in range(count)]
+        threads[0].start()
+        self.started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        # wait for everyone to join the flight before letting it land
+        for _ in range(500):
+            if self.group.shared >= count - 1:
+                break
+            time.sleep(0.01)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_coalesced(self):
+        results = self.burst(lambda: self.api.checkout(1))
+        self.assertEqual(self.api._post.call_count, 1)
+        self.assertEqual(results, [self.response] * 10)
+        # everyone gets their own copy
+        self.assertEqual(len(set(id(result) for result in results)), 10)
+        self.assertEqual((self.group.calls, self.group.shared), (1, 9))
+        self.assertEqual(len(self.group), 0)
+        # nothing is kept once the call is over
+        self.api.checkout(1)
+        self.assertEqual(self.api._post.call_count, 2)
+
+    def test_exceptions_shared(self):
+        self.response = WePayServerError(None, 500)
+        results = self.burst(lambda: self.api.checkout(1))
+        self.assertEqual(self.api._post.call_count, 1)
+        self.assertTrue(all(result is self.response for result in results))
+
+    def test_not_coalesced(self):
+        self.release.set()
+        self.api.checkout(1)
+        self.api.checkout(2)
+        self.api.checkout(1, access_token='other')
+        self.api.checkout.cancel(1, 'reason')
+        self.assertEqual(self.api._post.call_count, 4)
+        self.assertEqual(self.group.calls, 3)
+        self.assertIsNone(self.group.key(MagicMock(uri='/checkout/create')))
+
+    def test_with_cache(self):
+        self.api.cache = LookupCache()
+        results = self.burst(lambda: self.api.checkout(1), count=5)
+        self.assertEqual(results, [self.response] * 5)
+        self.api.checkout(1)
+        self.assertEqual(self.api._post.call_count, 1)
@@ -0,0 +1,106 @@
+import os, shutil, tempfile, threading, time, unittest
+from mock import MagicMock
+from wepay import WePay
+from wepay.exceptions import WePayClientError
+from wepay.tokens import TokenStore, SQLiteTokenStore
+
+
+class TokenStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.store = TokenStore()
+        self.api = WePay(production=False, access_token='app_token',
+                         tokens=self.store)
+        self.api._post = MagicMock(return_value={'ok': True})
+
+    def test_store(self):
+        self.assertIsNone(self.store.get('m1'))
+        self.assertEqual(self.store.get('m1', 'default'), 'default')
+        self.store.set('m1', 'token_1')
+        self.assertEqual(self.store.get('m1'), 'token_1')
+        self.assertTrue('m1' in self.store)
+        self.store.delete('m1')
+        self.assertFalse('m1' in self.store)
+        self.store.delete('m1')
+
+    def test_merchant(self):
+        self.store.set(1, 'token_1')
+        self.api.checkout(5)
+        merchant = self.api.merchant(1)
+        merchant.checkout(5)
+        merchant.account.find()
+        self.assertEqual(
+            [args[2]['Authorization'] for args, _ in self.api._post.call_args_list],
+            ['Bearer app_token', 'Bearer token_1', 'Bearer token_1'])
+        self.assertIs(merchant.checkout._api, merchant)
+        self.assertIs(self.api.checkout._api, self.api)
+        self.assertEqual(self.api.access_token, 'app_token')
+        self.assertEqual(merchant.checkout(5, batch_mode=True),
+                         {'call': '/checkout', 'parameters': {'checkout_id': 5}})
+        self.assertRaises(KeyError, self.api.merchant, 2)
+
+    def test_exchange(self):
+        release = threading.Event()
+        def post(url, params, headers, timeout):
+            release.wait(5)
+            return {'user_id': 42, 'access_token': 'token_%s' % params['code']}
+        self.api._post.side_effect = post
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            self.store.exchange(self.api, 1, 'https://example.com', 'secret',
+                                'code'))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for _ in range(500):
+            if self.store._exchanges.shared >= 4:
+                break
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.api._post.call_count, 1)
+        self.assertEqual(results, [{'user_id': 42, 'access_token': 'token_code'}] * 5)
+        self.assertEqual(self.store.get(42), 'token_code')
+        self.store.exchange(self.api, 1, 'https://example.com', 'secret',
+                            'other', key='merchant')
+        self.assertEqual(self.store.get('merchant'), 'token_other')
+        self.assertEqual(self.api._post.call_count, 2)
+
+    def test_exchange_error(self):
+        self.api._post.side_effect = WePayClientError(None, 400)
+        self.assertRaises(WePayClientError, self.store.exchange, self.api, 1,
+                          'https://example.com', 'secret', 'code')
+        self.assertEqual(len(self.store._exchanges), 0)
+        self.assertIsNone(self.store.get(42))
+
+
+class SQLiteTokenStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'tokens.db')
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def test_persistence(self):
+        store = SQLiteTokenStore(self.path)
+        store.set('m1', 'token_1')
+        store.set(2, 'token_2')
+        store.set('m1', 'token_3')
+        self.assertEqual(store.get('m1'), 'token_3')
+        self.assertEqual(store.loads, 0)
+        other = SQLiteTokenStore(self.path)
+        self.assertEqual((other.get('m1'), other.get(2)), ('token_3', 'token_2'))
+        self.assertEqual(other.get('m1'), 'token_3')
+        # repeated reads are served from memory
+        self.assertEqual(other.loads, 2)
+        store.delete('m1')
+        self.assertEqual(other.get('m1'), 'token_3')
+        other.invalidate('m1')
+        self.assertIsNone(other.get('m1'))
+        store.close()
+        other.close()
+
+    def test_table_name(self):
+        self.assertRaises(ValueError, SQLiteTokenStore, self.path,
+                          table='tokens; DROP TABLE x')
+        SQLiteTokenStore(self.path, table='other_tokens').close()
@@ -0,0 +1,121 @@
+import threading, time, unittest
+from mock import MagicMock, patch
+from six.moves import http_client, urllib
+from wepay.exceptions import WePayClientError, WePayServerError, \
+    WePayConnectionError
+from wepay.tests import StubServer
+from wepay.utils import ConnectionPool, Post, is_idempotent, \
+    _STALE_CONNECTION_ERRORS
+
+class UrllibPostTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubServer()
+        self.post = Post(use_requests=False)
+
+    def tearDown(self):
+        self.post.close()
+        self.server.stop()
+
+    def _post(self, uri, params=None):
+        return self.post(self.server.url + uri, params or {},
+                         {'Content-Type': 'application/json'}, 10)
+
+    def test_connection_reuse(self):
+        for i in range(5):
+            self.assertEqual(self._post('/checkout', {'checkout_id': i}),
+                             {'path': '/checkout'})
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.server.requests[-1], ('/checkout', {'checkout_id': 4}))
+
+    def test_reconnect(self):
+        self.server.keep_alive = False
+        for i in range(3):
+            self.assertEqual(self._post('/account'), {'path': '/account'})
+        self.assertEqual(self.server.connections, 3)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_dropped_connection(self):
+        self.server.keep_alive = False
+        self._post('/checkout/create')
+        time.sleep(0.05)
+        # connection closed by the server is not reused
+        self.assertEqual(self._post('/checkout/create'), {'path': '/checkout/create'})
+        self.assertEqual(self.server.connections, 2)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_stale_connection(self):
+        pool = ConnectionPool()
+        fresh = MagicMock()
+        fresh.getresponse.return_value.read.return_value = b'{}'
+        def urlopen(stale, idempotent=False):
+            with patch.object(pool, '_get', return_value=(stale, True)), \
+                    patch.object(pool, '_new_connection', return_value=fresh):
+                return pool.urlopen('http://localhost/v2/checkout/create',
+                                    b'{}', {}, 10, idempotent=idempotent)
+        # request could have been processed before the connection was dropped
+        stale = MagicMock()
+        stale.getresponse.side_effect = http_client.BadStatusLine("''")
+        self.assertRaises(http_client.BadStatusLine, urlopen, stale)
+        self.assertFalse(fresh.request.called)
+        self.assertEqual(urlopen(stale, idempotent=True)[1], b'{}')
+        self.assertEqual(fresh.request.call_count, 1)
+        # request could not be written
+        stale = MagicMock()
+        stale.request.side_effect = _STALE_CONNECTION_ERRORS[-1]("''")
+        self.assertEqual(urlopen(stale)[1], b'{}')
+        self.assertEqual(fresh.request.call_count, 2)
+
+    def test_idempotent(self):
+        self.assertTrue(is_idempotent('https://wepayapi.com/v2/checkout', {}))
+        self.assertTrue(is_idempotent('https://wepayapi.com/v2/checkout/find', {}))
+        self.assertFalse(is_idempotent('https://wepayapi.com/v2/checkout/refund', {}))
+        self.assertTrue(is_idempotent('https://wepayapi.com/v2/checkout/create',
+                                      {'unique_id': 'abc'}))
+
+    def test_idle_timeout(self):
+        self.post = Post(use_requests=False, pool_idle_timeout=0)
+        self._post('/account')
+        self._post('/account')
+        self.assertEqual(self.server.connections, 2)
+
+    def test_threads(self):
+        results = []
+        def worker():
+            for i in range(10):
+                results.append(self._post('/app'))
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [{'path': '/app'}] * 40)
+        self.assertTrue(self.server.connections <= 4)
+
+    def test_errors(self):
+        self.server.handler = lambda path, body: (400, {
+            'error': 'invalid_request', 'error_code': 1004,
+            'error_description': 'client_id parameter is required'})
+        try:
+            self._post('/app')
+        except WePayClientError as e:
+            self.assertIsInstance(e.http_error, urllib.error.HTTPError)
+            self.assertEqual(e.status_code, 400)
+            self.assertEqual(e.error_code, 1004)
+        else:
+            self.fail("WePayClientError was not raised")
+        self.server.handler = lambda path, body: (503, {})
+        self.assertRaises(WePayServerError, self._post, '/app')
+        # errors do not break the pool
+        self.assertEqual(self.server.connections, 1)
+
+    def test_connection_error(self):
+        url = self.server.url
+        self.server.stop()
+        try:
+            self.post(url + '/app', {}, {}, 1)
+        except WePayConnectionError as e:
+            self.assertIsInstance(e.error, urllib.error.URLError)
+        else:
+            self.fail("WePayConnectionError was not raised")
+        self.server = StubServer()
@@ -0,0 +1,169 @@
+"""Storage of access tokens for applications, that make calls on behalf of
+many merchants. Tokens are kept in a :class:`TokenStore` under a merchant
+key of your choice, for instance WePay's ``user_id`` or an ID of a merchant in
+your own database, and calls can then be addressed by that key:
+
+    >>> api = WePay(tokens=SQLiteTokenStore('tokens.db'))
+    >>> api.tokens.exchange(api, CLIENT_ID, REDIRECT_URI, CLIENT_SECRET, code,
+    ...                     key=merchant_id)
+    >>> api.merchant(merchant_id).checkout(12345)
+
+Every token read after the first one is served from memory, so addressing a
+call by a key costs a dictionary lookup rather than a trip to the database.
+
+.. moduleauthor:: lehins <lehins@yandex.ru>
+   :platform: independent
+"""
+import copy, re, sqlite3, threading, time
+from concurrent.futures import Future
+
+from wepay.singleflight import SingleFlight
+
+__all__ = ['TokenStore', 'SQLiteTokenStore']
+
+
+class TokenStore(object):
+    """In-memory store of access tokens, which is also a base class for
+    persistent ones. Subclasses only need to override :meth:`load`,
+    :meth:`save` and :meth:`remove`, while caching and coalescing of code
+    exchanges are taken care of here.
+
+    Tokens read from a backend are cached in memory for as long as the store
+    exists, so tokens changed or deleted by another process should be
+    :meth:`invalidated<invalidate>`.
+
+    :ivar int loads: number of reads, that missed the cache.
+
+    """
+
+    def __init__(self):
+        self.loads = 0
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._exchanges = SingleFlight()
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key, default=None):
+        """Returns an access token of a merchant with ``key`` or ``default``
+        if there is none.
+
+        """
+        token = self._cache.get(key)
+        if token is None:
+            with self._lock:
+                self.loads += 1
+            token = self.load(key)
+            if token is None:
+                return default
+            self._cache[key] = token
+        return token
+
+    def set(self, key, access_token):
+        """Saves an ``access_token`` of a merchant with ``key``."""
+        self.save(key, access_token)
+        self._cache[key] = access_token
+
+    def delete(self, key):
+        """Removes an access token of a merchant with ``key``, for instance
+        once it was revoked.
+
+        """
+        self.remove(key)
+        self._cache.pop(key, None)
+
+    def invalidate(self, key=None):
+        """Drops a cached token of a merchant with ``key``, or all of them, so
+        they are read from the backend again.
+
+        """
+        if key is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(key, None)
+
+    def exchange(self, api, client_id, redirect_uri, client_secret, code,
+                 key=None, **kwargs):
+        """Exchanges a ``code`` for an access token with
+        :meth:`oauth2.token<wepay.calls.oauth2.OAuth2.token>` and saves it
+        under ``key``, or under ``user_id`` from the response if ``key`` is
+        `None`. Concurrent exchanges of the same code, for instance when a
+        user reloads the redirect page, result in a single call to WePay and
+        all receive its response or exception. Synchronous
+        :class:`WePay<wepay.api.WePay>` only.
+
+        :keyword kwargs: passed to `oauth2.token`, for instance ``callback_uri``.
+        :return: response of `/oauth2/token`.
+
+        """
+        flight, leader = self._exchanges.join(code, Future)
+        if not leader:
+            return copy.deepcopy(flight.result())
+        try:
+            response = api.oauth2.token(
+                client_id, redirect_uri, client_secret, code, **kwargs)
+            self.set(response['user_id'] if key is None else key,
+                     response['access_token'])
+        except BaseException as exc:
+            self._exchanges.land(code)
+            flight.set_exception(exc)
+            raise
+        self._exchanges.land(code)
+        flight.set_result(response)
+        return response
+
+    def load(self, key):
+        """Reads a token from the backend, returns `None` if there is none."""
+        return None
+
+    def save(self, key, access_token):
+        """Writes a token to the backend."""
+
+    def remove(self, key):
+        """Deletes a token from the backend."""
+
+
+class SQLiteTokenStore(TokenStore):
+    """Keeps tokens in a table of an SQLite database, which can be shared by
+    many processes on the same host.
+
+    :param str path: path to the database file.
+    :keyword str table: name of the table, created if it does not exist.
+
+    """
+
+    def __init__(self, path, table='wepay_tokens'):
+        super(SQLiteTokenStore, self).__init__()
+        if re.match(r'^[A-Za-z_][A-Za-z0-9_]*$', table) is None:
+            raise ValueError("Invalid table name: %r" % table)
+        self.path = path
+        self.table = table
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db_lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS %s (key PRIMARY KEY, "
+                "access_token TEXT NOT NULL, updated REAL NOT NULL)" % table)
+
+    def close(self):
+        """Closes the database connection."""
+        with self._db_lock:
+            self._db.close()
+
+    def load(self, key):
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT access_token FROM %s WHERE key = ?" % self.table,
+                (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def save(self, key, access_token):
+        with self._db_lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO %s (key, access_token, updated) "
+                "VALUES (?, ?, ?)" % self.table, (key, access_token, time.time()))
+
+    def remove(self, key):
+        with self._db_lock, self._db:
+            self._db.execute("DELETE FROM %s WHERE key = ?" % self.table, (key,))
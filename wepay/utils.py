@@ -1,71 +1,400 @@
-import json, warnings
-from six.moves import urllib
+import collections, io, re, select, socket, threading, time, warnings
+from six.moves import http_client, urllib
 try:
-    import requests
-    HAS_REQUESTS = True
-except ImportError:
-    HAS_REQUESTS = False
+    from importlib.util import find_spec
+    HAS_REQUESTS = find_spec('requests') is not None
+except ImportError: # python 2
+    import imp
+    try:
+        imp.find_module('requests')
+        HAS_REQUESTS = True
+    except ImportError:
+        HAS_REQUESTS = False
 
+# `requests` together with urllib3 and friends takes longer to import than the
+# rest of the SDK, so it is imported by the first call, see `Post`
+requests = None
+
+from wepay.codec import get_codec
 from wepay.exceptions import WePayWarning, WePayClientError, WePayServerError, \
     WePayConnectionError
+from wepay.objects import decode_records
+
+try:
+    _STALE_CONNECTION_ERRORS = (
+        http_client.BadStatusLine, ConnectionResetError, BrokenPipeError)
+except NameError: # python 2
+    _STALE_CONNECTION_ERRORS = (http_client.BadStatusLine,)
+
 
 class Post(object):
     """This is a helper class that uses either `urllib` or `requests` library to
     perform POST requests.
 
+    When `requests` library is used, all calls go through a single long lived
+    :class:`requests.Session`, otherwise through a :class:`ConnectionPool`, so
+    in both cases connections to WePay are kept alive and reused between
+    calls. Connections are created lazily, are safe to share between threads
+    and can be drained with :meth:`close`.
+
+    :keyword int pool_connections: number of per host connection pools to cache.
+    :keyword int pool_maxsize: maximum number of connections kept alive per host.
+    :keyword float pool_idle_timeout: time in seconds after which an idle pool is
+       discarded together with all of its connections. `None` means never.
+    :keyword codec: a :mod:`codec<wepay.codec>` instance, used for encoding
+       params and decoding responses. Fastest available one is used by default.
+
     """
     
-    def __init__(self, use_requests=None, silent=None):
+    def __init__(self, use_requests=None, silent=None, pool_connections=10,
+                 pool_maxsize=10, pool_idle_timeout=None, codec=None):
         self._use_requests = HAS_REQUESTS and (
             use_requests is None or use_requests)
-        if not silent and use_requests and not self._use_requests:
+        self._silent = silent
+        if use_requests and not self._use_requests:
+            self._requests_missing()
+        self._pool_connections = pool_connections
+        self._pool_maxsize = pool_maxsize
+        self._pool_idle_timeout = pool_idle_timeout
+        self.codec = get_codec(codec)
+        self.records = None
+        self._lock = threading.Lock()
+        self._session = None
+        self._in_flight = 0
+        self._last_used = 0
+        self._pool = ConnectionPool(
+            maxhosts=pool_connections, maxsize=pool_maxsize,
+            idle_timeout=pool_idle_timeout)
+
+    def __call__(self, url, params, headers, timeout, timing=None):
+        if self._use_requests and (requests is not None or
+                                   self._import_requests()):
+            return self._post_requests(url, params, headers, timeout, timing)
+        return self._post_urllib(url, params, headers, timeout, timing)
+
+    def close(self):
+        """Closes all pooled connections. Pool will be recreated on the next call."""
+        with self._lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.close()
+        self._pool.close()
+
+    def _requests_missing(self):
+        if not self._silent:
             message = "Using requests library was specified, but there was a problem " \
                       "importing it. Falling back to urllib."
-            if silent is not None:
+            if self._silent is not None:
                 raise WePayWarning(message)
             warnings.warn(message, WePayWarning)
 
-    def __call__(self, url, params, headers, timeout):
-        if self._use_requests:
-            return self._post_requests(url, params, headers, timeout)
-        return self._post_urllib(url, params, headers, timeout)
+    def _import_requests(self):
+        # library was found, but can still be broken
+        global requests, HAS_REQUESTS
+        try:
+            import requests
+        except ImportError:
+            HAS_REQUESTS = self._use_requests = False
+            self._requests_missing()
+            return False
+        return True
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=self._pool_connections,
+            pool_maxsize=self._pool_maxsize)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def _acquire_session(self):
+        stale = None
+        with self._lock:
+            now = time.time()
+            if (self._session is not None and self._in_flight == 0 and
+                self._pool_idle_timeout is not None and
+                now - self._last_used > self._pool_idle_timeout):
+                stale, self._session = self._session, None
+            if self._session is None:
+                self._session = self._new_session()
+            self._in_flight += 1
+            self._last_used = now
+            session = self._session
+        if stale is not None:
+            stale.close()
+        return session
 
-    def _post_urllib(self, url, params, headers, timeout):
-        data = urllib.parse.urlencode(params).encode('utf-8')
-        request = urllib.request.Request(url, data=data, headers=headers)
+    def _release_session(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._last_used = time.time()
+
+    def _post_urllib(self, url, params, headers, timeout, timing=None):
+        if timing is not None:
+            timing.start()
+        data = self.codec.dumps(params)
+        if timing is not None:
+            timing.mark('encode', sent=len(data))
         try:
-            response = urllib.request.urlopen(request, timeout=timeout)
-        except urllib.error.HTTPError as exc:
-            try:
-                kwargs = json.loads(exc.read().decode('utf-8'))
-            except ValueError:
-                kwargs = {}
-            self._raise_error(exc, exc.code, **kwargs)
-        except urllib.error.URLError as exc:
-            raise WePayConnectionError(exc)
-        return json.loads(response.read().decode('utf-8'))
+            response, body = self._pool.urlopen(
+                url, data, headers, timeout,
+                idempotent=is_idempotent(url, params))
+        except (socket.error, http_client.HTTPException) as exc:
+            if timing is not None:
+                timing.mark('network')
+            raise WePayConnectionError(urllib.error.URLError(exc))
+        if timing is None:
+            return decode_response(
+                url, response.status, response.reason, response.msg, body,
+                self.codec, self.records)
+        timing.mark('network', received=len(body), status=response.status)
+        try:
+            return decode_response(
+                url, response.status, response.reason, response.msg, body,
+                self.codec, self.records)
+        finally:
+            timing.mark('decode')
 
-    def _post_requests(self, url, params, headers, timeout):
-        data = json.dumps(params)
+    def _post_requests(self, url, params, headers, timeout, timing=None):
+        if timing is not None:
+            timing.start()
+        data = self.codec.dumps(params)
+        if timing is not None:
+            timing.mark('encode', sent=len(data))
+        session = self._acquire_session()
         try:
-            response = requests.post(
+            response = session.post(
                 url, data=data, headers=headers, timeout=timeout)
+            if timing is not None:
+                timing.mark('network', received=len(response.content),
+                            status=response.status_code)
             response.raise_for_status()
         except requests.exceptions.HTTPError as exc:
             try:
-                kwargs = exc.response.json()
+                kwargs = self.codec.loads(exc.response.content)
             except ValueError: # JSONDecodeError is a subclass of ValueError
                 kwargs = {}
             self._raise_error(exc, exc.response.status_code, **kwargs)
         except requests.exceptions.RequestException as exc:
+            if timing is not None:
+                timing.mark('network')
             raise WePayConnectionError(exc)
-        return response.json()
+        finally:
+            self._release_session()
+        if timing is None:
+            return self._decode(url, response.content)
+        try:
+            return self._decode(url, response.content)
+        finally:
+            timing.mark('decode')
+
+    def _decode(self, url, body):
+        if self.records is None:
+            return self.codec.loads(body)
+        return decode_records(url, body, self.codec, self.records)
 
     def _raise_error(self, exc, status_code, **kwargs):
-        if status_code >= 500:
-            raise WePayServerError(exc, status_code, **kwargs)
-        if status_code >= 400:
-            raise WePayClientError(exc, status_code, **kwargs)
+        raise_error(exc, status_code, **kwargs)
+
+
+_JSON = get_codec('json')
+
+
+def is_read_only(uri):
+    """Checks if a call to ``uri`` does not modify any objects on WePay, i.e. it
+    is a lookup, a `find` or a getter, for instance `/checkout`,
+    `/checkout/find` or `/account/get_tax`.
+
+    """
+    parts = uri.strip('/').split('/')
+    action = parts[-1] if len(parts) > 1 else ''
+    return action in ('', 'find', 'balance') or action.startswith('get_')
+
+
+_API_VERSION = re.compile(r'^/v[0-9]+(?=/)')
+
+
+def is_idempotent(url, params):
+    """Checks if a POST request to ``url`` with ``params`` can be safely sent
+    more than once, i.e. it is :func:`read-only<is_read_only>` or it carries
+    a `unique_id`.
+
+    """
+    path = urllib.parse.urlsplit(url).path
+    return 'unique_id' in params or is_read_only(_API_VERSION.sub('', path))
+
+
+def raise_error(exc, status_code, **kwargs):
+    """Raises :exc:`WePayServerError<wepay.exceptions.WePayServerError>` or
+    :exc:`WePayClientError<wepay.exceptions.WePayClientError>` depending on
+    the ``status_code``.
+
+    """
+    if status_code >= 500:
+        raise WePayServerError(exc, status_code, **kwargs)
+    if status_code >= 400:
+        raise WePayClientError(exc, status_code, **kwargs)
+
+
+def decode_response(url, status, reason, headers, body, codec=None,
+                    records=None):
+    """Decodes raw JSON ``body`` of a response received through
+    :class:`ConnectionPool` or an alike with a ``codec`` (standard :mod:`json`
+    by default), while errors are raised with :exc:`urllib.error.HTTPError`
+    attached to them. Objects are returned as :mod:`records<wepay.objects>`
+    for calls from ``records``, if it is given.
+
+    """
+    codec = codec or _JSON
+    if status >= 400:
+        exc = urllib.error.HTTPError(url, status, reason, headers, io.BytesIO(body))
+        try:
+            kwargs = codec.loads(body)
+        except ValueError:
+            kwargs = {}
+        raise_error(exc, status, **kwargs)
+    if records is not None:
+        return decode_records(url, body, codec, records)
+    return codec.loads(body)
+
+
+class ConnectionPool(object):
+    """Thread safe pool of kept alive :class:`http.client.HTTPSConnection` (or
+    :class:`http.client.HTTPConnection` for plain `http` urls) objects, that is
+    used for POST requests whenever `requests` library is not available.
+
+    Each connection is used by one thread at a time. Connections that were
+    closed by the server while idle are transparently replaced by new ones.
+    A request is only sent again on a new connection if it could not have
+    reached the server, or if it is idempotent.
+
+    :keyword int maxhosts: number of hosts to keep connections for.
+    :keyword int maxsize: maximum number of idle connections kept per host.
+    :keyword float idle_timeout: connections idle for longer than this number
+       of seconds are closed instead of being reused. `None` means never.
+
+    """
+
+    def __init__(self, maxhosts=10, maxsize=10, idle_timeout=None):
+        self._maxhosts = maxhosts
+        self._maxsize = maxsize
+        self._idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._idle = collections.OrderedDict()
+
+    def urlopen(self, url, body, headers, timeout, idempotent=False):
+        """Sends a POST request and reads the whole response.
+
+        :keyword bool idempotent: whether the request can be sent again, when
+           a kept alive connection turns out to be closed after the request
+           was written to it.
+        :return: a tuple with :class:`http.client.HTTPResponse` and its body
+        :raises: :exc:`socket.error` or :exc:`http.client.HTTPException`
+
+        """
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        conn, reused = self._get(key, timeout)
+        try:
+            try:
+                conn.request('POST', path, body, headers)
+            except _STALE_CONNECTION_ERRORS:
+                if not reused:
+                    raise
+                # request was not written in full, so it was not processed
+                conn.close()
+                conn, reused = self._new_connection(key, timeout), False
+                conn.request('POST', path, body, headers)
+            try:
+                response = conn.getresponse()
+                data = response.read()
+            except _STALE_CONNECTION_ERRORS:
+                # server could have processed the request before dropping the
+                # connection, so only an idempotent one can be sent again
+                if not (reused and idempotent):
+                    raise
+                conn.close()
+                conn = self._new_connection(key, timeout)
+                response, data = self._request(conn, path, body, headers)
+        except Exception:
+            conn.close()
+            raise
+        if response.will_close:
+            conn.close()
+        else:
+            self._put(key, conn)
+        return response, data
+
+    def close(self):
+        """Closes all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, collections.OrderedDict()
+        for connections in idle.values():
+            for conn, _ in connections:
+                conn.close()
+
+    def _request(self, conn, path, body, headers):
+        conn.request('POST', path, body, headers)
+        response = conn.getresponse()
+        return response, response.read()
+
+    def _new_connection(self, key, timeout):
+        scheme, host, port = key
+        if scheme == 'http':
+            return http_client.HTTPConnection(host, port, timeout=timeout)
+        return http_client.HTTPSConnection(host, port, timeout=timeout)
+
+    def _get(self, key, timeout):
+        expired = []
+        conn = None
+        with self._lock:
+            connections = self._idle.get(key)
+            now = time.time()
+            while connections:
+                conn, last_used = connections.pop()
+                if ((self._idle_timeout is None or
+                     now - last_used <= self._idle_timeout) and
+                    not _is_dropped(conn.sock)):
+                    break
+                expired.append(conn)
+                conn = None
+        for stale in expired:
+            stale.close()
+        if conn is None:
+            return self._new_connection(key, timeout), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def _put(self, key, conn):
+        evicted = []
+        with self._lock:
+            connections = self._idle.pop(key, [])
+            self._idle[key] = connections
+            if len(connections) < self._maxsize:
+                connections.append((conn, time.time()))
+                conn = None
+            while len(self._idle) > self._maxhosts:
+                evicted.extend(self._idle.popitem(last=False)[1])
+        if conn is not None:
+            conn.close()
+        for stale, _ in evicted:
+            stale.close()
+
+
+def _is_dropped(sock):
+    # an idle connection has nothing to read, unless it was closed by the server
+    if sock is None:
+        return True
+    try:
+        return bool(select.select([sock], [], [], 0)[0])
+    except (ValueError, socket.error):
+        return True
 
 
 class cached_property(object):